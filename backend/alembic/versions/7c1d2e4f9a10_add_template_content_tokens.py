@@ -0,0 +1,44 @@
+"""
+新增模板 token 估算欄位
+Revision ID: 7c1d2e4f9a10
+Revises: 33b5b5fc9b39
+Create Date: 2026-10-18 12:00:00.000000
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+from app.services.token_budget import estimate_tokens
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1d2e4f9a10'
+down_revision: Union[str, None] = '33b5b5fc9b39'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """升級資料庫架構 - 新增 templates.content_tokens 並回填既有模板"""
+    with op.batch_alter_table('templates') as batch_op:
+        batch_op.add_column(sa.Column('content_tokens', sa.Integer, nullable=True))
+
+    # ### 回填既有模板的 token 估算值 ###
+    connection = op.get_bind()
+    templates = connection.execute(
+        sa.text("SELECT template_id, content FROM templates")
+    ).fetchall()
+    for template_id, content in templates:
+        connection.execute(
+            sa.text(
+                "UPDATE templates SET content_tokens = :tokens "
+                "WHERE template_id = :template_id"
+            ),
+            {"tokens": estimate_tokens(content), "template_id": template_id},
+        )
+
+
+def downgrade() -> None:
+    """降級資料庫架構 - 移除 templates.content_tokens"""
+    with op.batch_alter_table('templates') as batch_op:
+        batch_op.drop_column('content_tokens')
@@ -0,0 +1,29 @@
+"""
+新增用戶歷史記錄保存期限
+Revision ID: a2c4e6f8b025
+Revises: f1b5c7d9e023
+Create Date: 2026-10-18 18:00:00.000000
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2c4e6f8b025'
+down_revision: Union[str, None] = 'f1b5c7d9e023'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """升級資料庫架構 - users 新增歷史記錄保存天數"""
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('history_retention_days', sa.Integer,
+                                      nullable=True))
+
+
+def downgrade() -> None:
+    """降級資料庫架構 - 移除歷史記錄保存天數"""
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('history_retention_days')
@@ -0,0 +1,73 @@
+"""
+新增歷史記錄用量欄位與用量彙總表
+Revision ID: a4b8c2d6e013
+Revises: 7c1d2e4f9a10
+Create Date: 2026-10-18 13:00:00.000000
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4b8c2d6e013'
+down_revision: Union[str, None] = '7c1d2e4f9a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """升級資料庫架構 - 新增用量欄位與 usage_rollups 資料表"""
+    # ### prompt_history 新增用量欄位 ###
+    with op.batch_alter_table('prompt_history') as batch_op:
+        batch_op.add_column(sa.Column('input_tokens', sa.Integer, nullable=True))
+        batch_op.add_column(sa.Column('output_tokens', sa.Integer, nullable=True))
+        batch_op.add_column(sa.Column('total_tokens', sa.Integer, nullable=True))
+        batch_op.add_column(sa.Column('latency_ms', sa.Integer, nullable=True))
+        batch_op.add_column(sa.Column('cache_hit', sa.Boolean, nullable=False,
+                                      server_default=sa.false()))
+
+    # ### 建立 usage_rollups 資料表 ###
+    op.create_table(
+        'usage_rollups',
+        sa.Column('rollup_id', sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey(
+            'users.user_id'), nullable=False),
+        sa.Column('model', sa.String(length=100), nullable=False),
+        sa.Column('day', sa.Date, nullable=False),
+        sa.Column('requests', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('cache_hits', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('input_tokens', sa.BigInteger, nullable=False, server_default='0'),
+        sa.Column('output_tokens', sa.BigInteger, nullable=False, server_default='0'),
+        sa.Column('total_tokens', sa.BigInteger, nullable=False, server_default='0'),
+        sa.Column('upstream_calls', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('latency_ms_total', sa.BigInteger,
+                  nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True),
+                  nullable=False, server_default=sa.text('(CURRENT_TIMESTAMP)')),
+        sa.UniqueConstraint('user_id', 'model', 'day', name='uq_usage_rollups_key'),
+    )
+
+    # ### 以既有歷史記錄回填彙總（舊資料沒有用量，只累計請求數） ###
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        day_expression = "(created_at AT TIME ZONE 'UTC')::date"
+    else:
+        day_expression = "DATE(created_at)"
+    op.execute(sa.text(f"""
+        INSERT INTO usage_rollups (user_id, model, day, requests)
+        SELECT user_id, model_used, {day_expression}, COUNT(*)
+        FROM prompt_history
+        GROUP BY user_id, model_used, {day_expression}
+    """))
+
+
+def downgrade() -> None:
+    """降級資料庫架構 - 移除 usage_rollups 與用量欄位"""
+    op.drop_table('usage_rollups')
+    with op.batch_alter_table('prompt_history') as batch_op:
+        batch_op.drop_column('cache_hit')
+        batch_op.drop_column('latency_ms')
+        batch_op.drop_column('total_tokens')
+        batch_op.drop_column('output_tokens')
+        batch_op.drop_column('input_tokens')
@@ -0,0 +1,128 @@
+"""
+prompt_history 依月份分區（僅 PostgreSQL，需啟用 HISTORY_PARTITIONING_ENABLED）
+Revision ID: b3d5f7a9c027
+Revises: a2c4e6f8b025
+Create Date: 2026-10-18 19:00:00.000000
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+from app.services.history_partitions import (
+    add_months,
+    create_partition_sql,
+    is_partitioned,
+    partition_month,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d5f7a9c027'
+down_revision: Union[str, None] = 'a2c4e6f8b025'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 資料複製完成後才建立的索引與觸發器（與先前遷移的定義相同）
+AFTER_COPY = (
+    """
+    CREATE INDEX ix_prompt_history_user_created ON prompt_history
+    (user_id, created_at, history_id)
+    """,
+    """
+    CREATE INDEX ix_prompt_history_search ON prompt_history
+    USING GIN (search_vector)
+    """,
+    """
+    CREATE TRIGGER prompt_history_search_vector
+    BEFORE INSERT OR UPDATE OF original_prompt, optimized_prompt,
+        original_blob_hash, optimized_blob_hash
+    ON prompt_history FOR EACH ROW EXECUTE FUNCTION prompt_history_search_vector()
+    """,
+)
+
+
+def _rebuild(partitioned: bool) -> None:
+    """以新的 prompt_history（分區或一般資料表）取代現有資料表並複製資料
+
+    現有資料表先改名保留，新資料表以 LIKE 複製欄位、預設值（history_id 序列）
+    與限制；主鍵、外鍵、索引與觸發器在複製資料後重新建立。
+    分區資料表的主鍵必須包含分區鍵，因此為 (history_id, created_at)。
+    """
+    connection = op.get_bind()
+    old_table = ('prompt_history_unpartitioned' if partitioned
+                 else 'prompt_history_partitioned')
+
+    sequence = connection.execute(sa.text(
+        "SELECT pg_get_serial_sequence('prompt_history', 'history_id')"
+    )).scalar()
+    primary_key = connection.execute(sa.text(
+        "SELECT conname FROM pg_constraint "
+        "WHERE conrelid = 'prompt_history'::regclass AND contype = 'p'"
+    )).scalar()
+    foreign_keys = connection.execute(sa.text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = 'prompt_history'::regclass AND contype = 'f'"
+    )).all()
+    oldest, newest = connection.execute(sa.text(
+        "SELECT min(created_at), max(created_at) FROM prompt_history"
+    )).one()
+
+    # ### 保留現有資料表，移除名稱會衝突的主鍵與索引 ###
+    op.execute(f'ALTER TABLE prompt_history RENAME TO {old_table}')
+    op.execute(f'DROP TRIGGER IF EXISTS prompt_history_search_vector ON {old_table}')
+    op.execute(f'ALTER TABLE {old_table} DROP CONSTRAINT {primary_key}')
+    op.execute('DROP INDEX IF EXISTS ix_prompt_history_user_created')
+    op.execute('DROP INDEX IF EXISTS ix_prompt_history_search')
+
+    # ### 建立新的 prompt_history ###
+    partition_by = ' PARTITION BY RANGE (created_at)' if partitioned else ''
+    op.execute(f'CREATE TABLE prompt_history (LIKE {old_table} '
+               f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS){partition_by}')
+    key = 'history_id, created_at' if partitioned else 'history_id'
+    op.execute(f'ALTER TABLE prompt_history ADD CONSTRAINT prompt_history_pkey '
+               f'PRIMARY KEY ({key})')
+    if sequence:
+        # 序列改由新資料表擁有，刪除舊資料表時才不會一併刪除
+        op.execute(f'ALTER SEQUENCE {sequence} OWNED BY prompt_history.history_id')
+
+    if partitioned:
+        # 涵蓋既有記錄的所有月份，並預先建立未來的月份；
+        # created_at 可能未帶時區（視為 UTC），不可依本機時區換算
+        today = datetime.now(timezone.utc).date()
+        month = partition_month(oldest) if oldest else add_months(today, 0)
+        last = add_months(today, settings.history_partition_months_ahead)
+        if newest:
+            last = max(last, partition_month(newest))
+        while month <= last:
+            op.execute(create_partition_sql(month))
+            month = add_months(month, 1)
+
+    # ### 複製資料，再建立索引、觸發器與外鍵 ###
+    op.execute(f'INSERT INTO prompt_history SELECT * FROM {old_table}')
+    for statement in AFTER_COPY:
+        op.execute(statement)
+    op.execute(f'DROP TABLE {old_table}')
+    for name, definition in foreign_keys:
+        op.execute(f'ALTER TABLE prompt_history ADD CONSTRAINT {name} {definition}')
+    op.execute('ANALYZE prompt_history')
+
+
+def upgrade() -> None:
+    """升級資料庫架構 - 將 prompt_history 轉為依 created_at 每月分區的資料表"""
+    connection = op.get_bind()
+    # SQLite 不支援分區；未啟用時維持單一資料表
+    if (connection.dialect.name != 'postgresql'
+            or not settings.history_partitioning_enabled
+            or is_partitioned(connection)):
+        return
+    _rebuild(partitioned=True)
+
+
+def downgrade() -> None:
+    """降級資料庫架構 - 將分區的 prompt_history 還原為單一資料表"""
+    connection = op.get_bind()
+    if not is_partitioned(connection):
+        return
+    _rebuild(partitioned=False)
@@ -0,0 +1,39 @@
+"""
+新增常用查詢的複合索引
+Revision ID: c5d9e3f7a017
+Revises: a4b8c2d6e013
+Create Date: 2026-10-18 14:00:00.000000
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d9e3f7a017'
+down_revision: Union[str, None] = 'a4b8c2d6e013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """升級資料庫架構 - 建立 prompt_history、templates 與 usage_rollups 的查詢索引"""
+    # ### 歷史記錄列表：WHERE user_id = ? ORDER BY created_at DESC, history_id DESC ###
+    op.create_index('ix_prompt_history_user_created', 'prompt_history',
+                    ['user_id', 'created_at', 'history_id'])
+
+    # ### 模板查詢：WHERE user_id = ? AND name = ?，以及 user_id = ? OR is_default ###
+    op.create_index('ix_templates_user_name', 'templates', ['user_id', 'name'])
+    op.create_index('ix_templates_is_default', 'templates', ['is_default'])
+
+    # ### 用量統計：WHERE user_id = ? AND day BETWEEN ... ORDER BY day DESC, model ###
+    op.create_index('ix_usage_rollups_user_day', 'usage_rollups',
+                    ['user_id', sa.text('day DESC'), 'model'])
+
+
+def downgrade() -> None:
+    """降級資料庫架構 - 移除查詢索引"""
+    op.drop_index('ix_usage_rollups_user_day', 'usage_rollups')
+    op.drop_index('ix_templates_is_default', 'templates')
+    op.drop_index('ix_templates_user_name', 'templates')
+    op.drop_index('ix_prompt_history_user_created', 'prompt_history')
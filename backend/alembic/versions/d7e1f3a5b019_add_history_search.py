@@ -0,0 +1,100 @@
+"""
+新增歷史記錄全文檢索索引
+Revision ID: d7e1f3a5b019
+Revises: c5d9e3f7a017
+Create Date: 2026-10-18 15:00:00.000000
+"""
+from typing import Sequence, Union
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7e1f3a5b019'
+down_revision: Union[str, None] = 'c5d9e3f7a017'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# SQLite：以 trigram 分詞的外部內容 FTS5 表，觸發器在同一交易內同步增刪改
+SQLITE_UPGRADE = (
+    """
+    CREATE VIRTUAL TABLE prompt_history_fts USING fts5(
+        original_prompt, optimized_prompt,
+        content='prompt_history', content_rowid='history_id',
+        tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER prompt_history_fts_insert AFTER INSERT ON prompt_history BEGIN
+        INSERT INTO prompt_history_fts(rowid, original_prompt, optimized_prompt)
+        VALUES (new.history_id, new.original_prompt, new.optimized_prompt);
+    END
+    """,
+    """
+    CREATE TRIGGER prompt_history_fts_delete AFTER DELETE ON prompt_history BEGIN
+        INSERT INTO prompt_history_fts(
+            prompt_history_fts, rowid, original_prompt, optimized_prompt
+        )
+        VALUES ('delete', old.history_id, old.original_prompt, old.optimized_prompt);
+    END
+    """,
+    """
+    CREATE TRIGGER prompt_history_fts_update
+    AFTER UPDATE OF original_prompt, optimized_prompt ON prompt_history BEGIN
+        INSERT INTO prompt_history_fts(
+            prompt_history_fts, rowid, original_prompt, optimized_prompt
+        )
+        VALUES ('delete', old.history_id, old.original_prompt, old.optimized_prompt);
+        INSERT INTO prompt_history_fts(rowid, original_prompt, optimized_prompt)
+        VALUES (new.history_id, new.original_prompt, new.optimized_prompt);
+    END
+    """,
+    # 以既有歷史記錄建立索引
+    "INSERT INTO prompt_history_fts(prompt_history_fts) VALUES ('rebuild')",
+)
+
+SQLITE_DOWNGRADE = (
+    "DROP TRIGGER IF EXISTS prompt_history_fts_update",
+    "DROP TRIGGER IF EXISTS prompt_history_fts_delete",
+    "DROP TRIGGER IF EXISTS prompt_history_fts_insert",
+    "DROP TABLE IF EXISTS prompt_history_fts",
+)
+
+# PostgreSQL：由資料庫維護的 tsvector 產生欄位與 GIN 索引
+POSTGRES_UPGRADE = (
+    """
+    ALTER TABLE prompt_history ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple',
+                    coalesce(original_prompt, '') || ' ' ||
+                    coalesce(optimized_prompt, ''))
+    ) STORED
+    """,
+    """
+    CREATE INDEX ix_prompt_history_search ON prompt_history
+    USING GIN (search_vector)
+    """,
+)
+
+POSTGRES_DOWNGRADE = (
+    "DROP INDEX IF EXISTS ix_prompt_history_search",
+    "ALTER TABLE prompt_history DROP COLUMN IF EXISTS search_vector",
+)
+
+
+def upgrade() -> None:
+    """升級資料庫架構 - 建立 prompt_history 全文檢索索引"""
+    dialect = op.get_bind().dialect.name
+    statements = {'sqlite': SQLITE_UPGRADE,
+                  'postgresql': POSTGRES_UPGRADE}.get(dialect, ())
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """降級資料庫架構 - 移除全文檢索索引"""
+    dialect = op.get_bind().dialect.name
+    statements = {'sqlite': SQLITE_DOWNGRADE,
+                  'postgresql': POSTGRES_DOWNGRADE}.get(dialect, ())
+    for statement in statements:
+        op.execute(statement)
@@ -0,0 +1,283 @@
+"""
+壓縮歷史記錄內容
+Revision ID: e9a3b5c7d021
+Revises: d7e1f3a5b019
+Create Date: 2026-10-18 16:00:00.000000
+"""
+import sqlite3
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+from app.services.history_compression import (
+    MIN_TRAINING_SAMPLES,
+    HistoryCompressor,
+    train_dictionary,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9a3b5c7d021'
+down_revision: Union[str, None] = 'd7e1f3a5b019'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 每批處理的歷史記錄筆數
+BATCH_SIZE = 500
+# 訓練字典使用的最近樣本數
+TRAINING_ROWS = 1000
+
+prompt_history = sa.table(
+    'prompt_history',
+    sa.column('history_id', sa.Integer),
+    sa.column('original_prompt', sa.Text),
+    sa.column('optimized_prompt', sa.Text),
+    sa.column('original_prompt_z', sa.LargeBinary),
+    sa.column('optimized_prompt_z', sa.LargeBinary),
+)
+history_dictionaries = sa.table(
+    'history_dictionaries',
+    sa.column('dictionary_id', sa.Integer),
+    sa.column('data', sa.LargeBinary),
+    sa.column('sample_count', sa.Integer),
+)
+
+
+# SQLite：壓縮後文字欄位只保留預覽，改用自行保存索引內容的 FTS5 表，
+# 由應用程式在新增歷史記錄的同一交易內寫入完整內容；刪除觸發器只需 rowid，
+# 不依賴任何應用程式註冊的 SQL 函式。SQLite 3.43+ 以 contentless_delete
+# 只保存索引，較舊版本則保存一份未壓縮的內容。
+_CONTENTLESS = (", content='', contentless_delete=1"
+                if sqlite3.sqlite_version_info >= (3, 43, 0) else '')
+SQLITE_UPGRADE = (
+    "DROP TRIGGER IF EXISTS prompt_history_fts_update",
+    "DROP TRIGGER IF EXISTS prompt_history_fts_delete",
+    "DROP TRIGGER IF EXISTS prompt_history_fts_insert",
+    "DROP TABLE IF EXISTS prompt_history_fts",
+    f"""
+    CREATE VIRTUAL TABLE prompt_history_fts USING fts5(
+        original_prompt, optimized_prompt,
+        tokenize='trigram'{_CONTENTLESS}
+    )
+    """,
+    """
+    CREATE TRIGGER prompt_history_fts_delete AFTER DELETE ON prompt_history BEGIN
+        DELETE FROM prompt_history_fts WHERE rowid = old.history_id;
+    END
+    """,
+    # 壓縮前文字欄位仍為完整內容，直接以既有歷史記錄建立索引
+    """
+    INSERT INTO prompt_history_fts(rowid, original_prompt, optimized_prompt)
+    SELECT history_id, original_prompt, optimized_prompt FROM prompt_history
+    """,
+)
+
+# 還原為以觸發器同步的外部內容 FTS5 表（與 d7e1f3a5b019 的定義相同）
+SQLITE_DOWNGRADE = (
+    "DROP TRIGGER IF EXISTS prompt_history_fts_delete",
+    "DROP TABLE IF EXISTS prompt_history_fts",
+    """
+    CREATE VIRTUAL TABLE prompt_history_fts USING fts5(
+        original_prompt, optimized_prompt,
+        content='prompt_history', content_rowid='history_id',
+        tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER prompt_history_fts_insert AFTER INSERT ON prompt_history BEGIN
+        INSERT INTO prompt_history_fts(rowid, original_prompt, optimized_prompt)
+        VALUES (new.history_id, new.original_prompt, new.optimized_prompt);
+    END
+    """,
+    """
+    CREATE TRIGGER prompt_history_fts_delete AFTER DELETE ON prompt_history BEGIN
+        INSERT INTO prompt_history_fts(
+            prompt_history_fts, rowid, original_prompt, optimized_prompt
+        )
+        VALUES ('delete', old.history_id, old.original_prompt, old.optimized_prompt);
+    END
+    """,
+    """
+    CREATE TRIGGER prompt_history_fts_update
+    AFTER UPDATE OF original_prompt, optimized_prompt ON prompt_history BEGIN
+        INSERT INTO prompt_history_fts(
+            prompt_history_fts, rowid, original_prompt, optimized_prompt
+        )
+        VALUES ('delete', old.history_id, old.original_prompt, old.optimized_prompt);
+        INSERT INTO prompt_history_fts(rowid, original_prompt, optimized_prompt)
+        VALUES (new.history_id, new.original_prompt, new.optimized_prompt);
+    END
+    """,
+    "INSERT INTO prompt_history_fts(prompt_history_fts) VALUES ('rebuild')",
+)
+
+
+def _train(connection, compressor: HistoryCompressor) -> None:
+    """以最近的長內容訓練共用字典"""
+    min_bytes = compressor.min_bytes
+    rows = connection.execute(
+        sa.select(prompt_history.c.original_prompt, prompt_history.c.optimized_prompt)
+        .where(sa.or_(
+            sa.func.length(sa.cast(prompt_history.c.original_prompt,
+                                   sa.LargeBinary)) >= min_bytes,
+            sa.func.length(sa.cast(prompt_history.c.optimized_prompt,
+                                   sa.LargeBinary)) >= min_bytes,
+        ))
+        .order_by(prompt_history.c.history_id.desc())
+        .limit(TRAINING_ROWS)
+    ).all()
+    samples = [body for row in rows for body in row
+               if body and len(body.encode('utf-8')) >= min_bytes]
+    if len(samples) < MIN_TRAINING_SAMPLES:
+        return
+
+    data = train_dictionary(samples)
+    if not data:
+        return
+    dictionary_id = connection.execute(
+        history_dictionaries.insert()
+        .values(data=data, sample_count=len(samples))
+        .returning(history_dictionaries.c.dictionary_id)
+    ).scalar_one()
+    compressor.add_dictionary(dictionary_id, data)
+
+
+def _compress_rows(connection, compressor: HistoryCompressor) -> None:
+    """依 history_id 分批壓縮既有內容"""
+    update = (
+        prompt_history.update()
+        .where(prompt_history.c.history_id == sa.bindparam('b_history_id'))
+        .values(
+            original_prompt=sa.bindparam('b_original_prompt'),
+            optimized_prompt=sa.bindparam('b_optimized_prompt'),
+            original_prompt_z=sa.bindparam('b_original_prompt_z'),
+            optimized_prompt_z=sa.bindparam('b_optimized_prompt_z'),
+        )
+    )
+    after = 0
+    while True:
+        rows = connection.execute(
+            sa.select(prompt_history.c.history_id,
+                      prompt_history.c.original_prompt,
+                      prompt_history.c.optimized_prompt)
+            .where(prompt_history.c.history_id > after)
+            .order_by(prompt_history.c.history_id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        after = rows[-1].history_id
+
+        params = []
+        for history_id, original, optimized in rows:
+            row = {'b_history_id': history_id}
+            for field, text in (('original_prompt', original),
+                                ('optimized_prompt', optimized)):
+                blob = compressor.compress(text) if text else None
+                row[f'b_{field}'] = (text if blob is None
+                                     else text[:compressor.preview_chars])
+                row[f'b_{field}_z'] = blob
+            if row['b_original_prompt_z'] or row['b_optimized_prompt_z']:
+                params.append(row)
+        if params:
+            connection.execute(update, params)
+
+
+def _decompress_rows(connection, compressor: HistoryCompressor) -> None:
+    """依 history_id 分批將壓縮內容還原至文字欄位"""
+    update = (
+        prompt_history.update()
+        .where(prompt_history.c.history_id == sa.bindparam('b_history_id'))
+        .values(
+            original_prompt=sa.bindparam('b_original_prompt'),
+            optimized_prompt=sa.bindparam('b_optimized_prompt'),
+            original_prompt_z=None,
+            optimized_prompt_z=None,
+        )
+    )
+    after = 0
+    while True:
+        rows = connection.execute(
+            sa.select(prompt_history)
+            .where(prompt_history.c.history_id > after)
+            .where(sa.or_(prompt_history.c.original_prompt_z.is_not(None),
+                          prompt_history.c.optimized_prompt_z.is_not(None)))
+            .order_by(prompt_history.c.history_id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        after = rows[-1].history_id
+        connection.execute(update, [
+            {
+                'b_history_id': row.history_id,
+                'b_original_prompt': compressor.full_text(
+                    row.original_prompt, row.original_prompt_z),
+                'b_optimized_prompt': compressor.full_text(
+                    row.optimized_prompt, row.optimized_prompt_z),
+            }
+            for row in rows
+        ])
+
+
+def _compressor(connection) -> HistoryCompressor:
+    """建立遷移用的壓縮器並載入字典"""
+    compressor = HistoryCompressor(
+        enabled=settings.history_compression_enabled,
+        min_bytes=settings.history_compression_min_bytes,
+        level=settings.history_compression_level,
+        preview_chars=settings.history_preview_chars,
+    )
+    compressor.load_dictionaries(connection)
+    return compressor
+
+
+def upgrade() -> None:
+    """升級資料庫架構 - 新增壓縮欄位與字典表，並壓縮既有內容（僅 SQLite）"""
+    # ### prompt_history 新增壓縮內容欄位 ###
+    op.add_column('prompt_history',
+                  sa.Column('original_prompt_z', sa.LargeBinary, nullable=True))
+    op.add_column('prompt_history',
+                  sa.Column('optimized_prompt_z', sa.LargeBinary, nullable=True))
+
+    # ### 建立 history_dictionaries 資料表 ###
+    op.create_table(
+        'history_dictionaries',
+        sa.Column('dictionary_id', sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column('data', sa.LargeBinary, nullable=False),
+        sa.Column('sample_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True),
+                  nullable=False, server_default=sa.text('(CURRENT_TIMESTAMP)')),
+    )
+
+    # PostgreSQL 由 TOAST 自動壓縮，且 tsvector 欄位需要資料庫內的完整內容
+    connection = op.get_bind()
+    if connection.dialect.name != 'sqlite':
+        return
+
+    for statement in SQLITE_UPGRADE:
+        op.execute(statement)
+    compressor = _compressor(connection)
+    if compressor.enabled:
+        _train(connection, compressor)
+        _compress_rows(connection, compressor)
+
+
+def downgrade() -> None:
+    """降級資料庫架構 - 還原壓縮內容並移除壓縮欄位與字典表"""
+    connection = op.get_bind()
+    if connection.dialect.name == 'sqlite':
+        compressor = _compressor(connection)
+        _decompress_rows(connection, compressor)
+        # 直接刪除欄位（SQLite 3.35+），避免重建資料表而遺失觸發器
+        op.execute('ALTER TABLE prompt_history DROP COLUMN optimized_prompt_z')
+        op.execute('ALTER TABLE prompt_history DROP COLUMN original_prompt_z')
+        # 內容已還原，重建外部內容 FTS5 表與觸發器
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
+    else:
+        op.drop_column('prompt_history', 'optimized_prompt_z')
+        op.drop_column('prompt_history', 'original_prompt_z')
+
+    op.drop_table('history_dictionaries')
@@ -0,0 +1,326 @@
+"""
+以內容雜湊去重歷史記錄內容
+Revision ID: f1b5c7d9e023
+Revises: e9a3b5c7d021
+Create Date: 2026-10-18 17:00:00.000000
+"""
+from collections import Counter
+import hashlib
+import logging
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+from app.services.history_compression import HistoryCompressor
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b5c7d9e023'
+down_revision: Union[str, None] = 'e9a3b5c7d021'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+# 每批處理的歷史記錄筆數
+BATCH_SIZE = 500
+
+# (文字欄位, 壓縮欄位, 雜湊欄位)
+BODY_FIELDS = (
+    ('original_prompt', 'original_prompt_z', 'original_blob_hash'),
+    ('optimized_prompt', 'optimized_prompt_z', 'optimized_blob_hash'),
+)
+
+prompt_history = sa.table(
+    'prompt_history',
+    sa.column('history_id', sa.Integer),
+    sa.column('original_prompt', sa.Text),
+    sa.column('optimized_prompt', sa.Text),
+    sa.column('original_prompt_z', sa.LargeBinary),
+    sa.column('optimized_prompt_z', sa.LargeBinary),
+    sa.column('original_blob_hash', sa.String),
+    sa.column('optimized_blob_hash', sa.String),
+)
+prompt_blobs = sa.table(
+    'prompt_blobs',
+    sa.column('blob_hash', sa.String),
+    sa.column('body', sa.Text),
+    sa.column('body_z', sa.LargeBinary),
+    sa.column('size_bytes', sa.Integer),
+    sa.column('ref_count', sa.Integer),
+)
+
+
+# PostgreSQL：產生欄位不能參考其他資料表，改由觸發器計算 tsvector
+POSTGRES_UPGRADE = (
+    "ALTER TABLE prompt_history ALTER COLUMN search_vector DROP EXPRESSION",
+    """
+    CREATE FUNCTION prompt_history_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector('simple',
+            coalesce((SELECT body FROM prompt_blobs
+                      WHERE blob_hash = NEW.original_blob_hash),
+                     NEW.original_prompt, '') || ' ' ||
+            coalesce((SELECT body FROM prompt_blobs
+                      WHERE blob_hash = NEW.optimized_blob_hash),
+                     NEW.optimized_prompt, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER prompt_history_search_vector
+    BEFORE INSERT OR UPDATE OF original_prompt, optimized_prompt,
+        original_blob_hash, optimized_blob_hash
+    ON prompt_history FOR EACH ROW EXECUTE FUNCTION prompt_history_search_vector()
+    """,
+)
+
+POSTGRES_DOWNGRADE = (
+    "DROP TRIGGER IF EXISTS prompt_history_search_vector ON prompt_history",
+    "DROP FUNCTION IF EXISTS prompt_history_search_vector()",
+    "DROP INDEX IF EXISTS ix_prompt_history_search",
+    "ALTER TABLE prompt_history DROP COLUMN IF EXISTS search_vector",
+    """
+    ALTER TABLE prompt_history ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple',
+                    coalesce(original_prompt, '') || ' ' ||
+                    coalesce(optimized_prompt, ''))
+    ) STORED
+    """,
+    """
+    CREATE INDEX ix_prompt_history_search ON prompt_history
+    USING GIN (search_vector)
+    """,
+)
+
+
+def _compressor(connection) -> HistoryCompressor:
+    """建立遷移用的壓縮器（僅 SQLite 啟用）並載入字典"""
+    compressor = HistoryCompressor(
+        enabled=(settings.history_compression_enabled
+                 and connection.dialect.name == 'sqlite'),
+        min_bytes=settings.history_compression_min_bytes,
+        level=settings.history_compression_level,
+        preview_chars=settings.history_preview_chars,
+    )
+    compressor.load_dictionaries(connection)
+    return compressor
+
+
+def _store_blobs(connection, compressor: HistoryCompressor,
+                 refs: Counter, contents: dict) -> None:
+    """遞增參考計數，不存在的內容才新增（沿用既有的壓縮內容）"""
+    for digest in sorted(refs):
+        result = connection.execute(
+            prompt_blobs.update()
+            .where(prompt_blobs.c.blob_hash == digest)
+            .values(ref_count=prompt_blobs.c.ref_count + refs[digest])
+        )
+        if result.rowcount:
+            continue
+        text, blob = contents[digest]
+        if blob is None:
+            blob = compressor.compress(text)
+        connection.execute(prompt_blobs.insert().values(
+            blob_hash=digest,
+            body=text if blob is None else None,
+            body_z=blob,
+            size_bytes=len(text.encode('utf-8')),
+            ref_count=refs[digest],
+        ))
+
+
+def _dedup_rows(connection, compressor: HistoryCompressor) -> None:
+    """依 history_id 分批將長內容移至 prompt_blobs，並記錄去重比例"""
+    min_bytes = settings.history_blob_min_bytes
+    preview_chars = settings.history_preview_chars
+    update = (
+        prompt_history.update()
+        .where(prompt_history.c.history_id == sa.bindparam('b_history_id'))
+        .values(**{
+            column: sa.bindparam(f'b_{column}')
+            for fields in BODY_FIELDS for column in fields
+        })
+    )
+    references = stored_bytes = logical_bytes = 0
+    unique: set[str] = set()
+    after = 0
+    while True:
+        rows = connection.execute(
+            sa.select(prompt_history)
+            .where(prompt_history.c.history_id > after)
+            .order_by(prompt_history.c.history_id)
+            .limit(BATCH_SIZE)
+        ).mappings().all()
+        if not rows:
+            break
+        after = rows[-1]['history_id']
+
+        refs: Counter = Counter()
+        contents: dict = {}
+        params = []
+        for row in rows:
+            values = {'b_history_id': row['history_id']}
+            changed = False
+            for text_field, blob_field, hash_field in BODY_FIELDS:
+                text, blob = row[text_field], row[blob_field]
+                full = compressor.full_text(text, blob)
+                size = len(full.encode('utf-8')) if full else 0
+                if size < min_bytes:
+                    changed = changed or blob is not None
+                    values.update({f'b_{text_field}': full, f'b_{blob_field}': None,
+                                   f'b_{hash_field}': None})
+                    continue
+                changed = True
+                digest = hashlib.sha256(full.encode('utf-8')).hexdigest()
+                refs[digest] += 1
+                contents.setdefault(digest, (full, blob))
+                values.update({f'b_{text_field}': full[:preview_chars],
+                               f'b_{blob_field}': None, f'b_{hash_field}': digest})
+                references += 1
+                logical_bytes += size
+                if digest not in unique:
+                    unique.add(digest)
+                    stored_bytes += size
+            if changed:
+                params.append(values)
+
+        _store_blobs(connection, compressor, refs, contents)
+        if params:
+            connection.execute(update, params)
+
+    if references:
+        logger.info(
+            '歷史記錄內容去重：%d 個參考、%d 個不重複內容（%.1f%% 重複），'
+            '內容由 %d bytes 降為 %d bytes（未計壓縮）',
+            references, len(unique), (1 - len(unique) / references) * 100,
+            logical_bytes, stored_bytes,
+        )
+
+
+def _restore_rows(connection, compressor: HistoryCompressor) -> None:
+    """依 history_id 分批將 prompt_blobs 的內容還原至文字欄位"""
+    update = (
+        prompt_history.update()
+        .where(prompt_history.c.history_id == sa.bindparam('b_history_id'))
+        .values(
+            original_prompt=sa.bindparam('b_original_prompt'),
+            optimized_prompt=sa.bindparam('b_optimized_prompt'),
+            original_blob_hash=None,
+            optimized_blob_hash=None,
+        )
+    )
+    after = 0
+    while True:
+        rows = connection.execute(
+            sa.select(prompt_history.c.history_id,
+                      prompt_history.c.original_prompt,
+                      prompt_history.c.optimized_prompt,
+                      prompt_history.c.original_blob_hash,
+                      prompt_history.c.optimized_blob_hash)
+            .where(prompt_history.c.history_id > after)
+            .where(sa.or_(prompt_history.c.original_blob_hash.is_not(None),
+                          prompt_history.c.optimized_blob_hash.is_not(None)))
+            .order_by(prompt_history.c.history_id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        after = rows[-1].history_id
+
+        hashes = {digest for row in rows
+                  for digest in (row.original_blob_hash, row.optimized_blob_hash)
+                  if digest is not None}
+        loaded = {
+            digest: compressor.full_text(body, body_z)
+            for digest, body, body_z in connection.execute(
+                sa.select(prompt_blobs.c.blob_hash, prompt_blobs.c.body,
+                          prompt_blobs.c.body_z)
+                .where(prompt_blobs.c.blob_hash.in_(hashes))
+            )
+        }
+        connection.execute(update, [
+            {
+                'b_history_id': row.history_id,
+                'b_original_prompt': loaded.get(row.original_blob_hash,
+                                                row.original_prompt),
+                'b_optimized_prompt': loaded.get(row.optimized_blob_hash,
+                                                 row.optimized_prompt),
+            }
+            for row in rows
+        ])
+
+
+def upgrade() -> None:
+    """升級資料庫架構 - 建立 prompt_blobs 並將長內容移入，取代逐列壓縮欄位"""
+    # ### 建立 prompt_blobs 資料表 ###
+    op.create_table(
+        'prompt_blobs',
+        sa.Column('blob_hash', sa.String(length=64), primary_key=True),
+        sa.Column('body', sa.Text, nullable=True),
+        sa.Column('body_z', sa.LargeBinary, nullable=True),
+        sa.Column('size_bytes', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('ref_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True),
+                  nullable=False, server_default=sa.text('(CURRENT_TIMESTAMP)')),
+    )
+
+    # ### prompt_history 新增內容雜湊欄位 ###
+    op.add_column('prompt_history',
+                  sa.Column('original_blob_hash', sa.String(length=64), nullable=True))
+    op.add_column('prompt_history',
+                  sa.Column('optimized_blob_hash', sa.String(length=64), nullable=True))
+
+    connection = op.get_bind()
+    sqlite = connection.dialect.name == 'sqlite'
+    compressor = _compressor(connection)
+    # SQLite 的全文檢索索引保存完整內容，移動內容時不需更新
+    if not sqlite:
+        for column in ('original_blob_hash', 'optimized_blob_hash'):
+            op.create_foreign_key(f'fk_prompt_history_{column}', 'prompt_history',
+                                  'prompt_blobs', [column], ['blob_hash'])
+        if connection.dialect.name == 'postgresql':
+            for statement in POSTGRES_UPGRADE:
+                op.execute(statement)
+
+    _dedup_rows(connection, compressor)
+
+    # ### 移除逐列壓縮欄位（內容已移至 prompt_blobs） ###
+    if sqlite:
+        # 直接刪除欄位（SQLite 3.35+），避免重建資料表
+        op.execute('ALTER TABLE prompt_history DROP COLUMN optimized_prompt_z')
+        op.execute('ALTER TABLE prompt_history DROP COLUMN original_prompt_z')
+    else:
+        op.drop_column('prompt_history', 'optimized_prompt_z')
+        op.drop_column('prompt_history', 'original_prompt_z')
+
+
+def downgrade() -> None:
+    """降級資料庫架構 - 將內容還原至歷史記錄並移除 prompt_blobs"""
+    op.add_column('prompt_history',
+                  sa.Column('original_prompt_z', sa.LargeBinary, nullable=True))
+    op.add_column('prompt_history',
+                  sa.Column('optimized_prompt_z', sa.LargeBinary, nullable=True))
+
+    connection = op.get_bind()
+    sqlite = connection.dialect.name == 'sqlite'
+    compressor = _compressor(connection)
+    _restore_rows(connection, compressor)
+
+    if sqlite:
+        op.execute('ALTER TABLE prompt_history DROP COLUMN optimized_blob_hash')
+        op.execute('ALTER TABLE prompt_history DROP COLUMN original_blob_hash')
+    else:
+        for column in ('optimized_blob_hash', 'original_blob_hash'):
+            op.drop_constraint(f'fk_prompt_history_{column}', 'prompt_history',
+                               type_='foreignkey')
+            op.drop_column('prompt_history', column)
+        if connection.dialect.name == 'postgresql':
+            # 內容已還原，重新建立 tsvector 產生欄位
+            for statement in POSTGRES_DOWNGRADE:
+                op.execute(statement)
+
+    op.drop_table('prompt_blobs')
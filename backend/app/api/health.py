@@ -4,6 +4,24 @@ Health check endpoint
 
 from fastapi import APIRouter
 
+from app.services.gemini_client_pool import (
+    gemini_client_pool,
+    gemini_context_cache,
+    gemini_hedger,
+    gemini_limiter,
+    gemini_resilience,
+)
+from app.services.history_compression import history_compressor
+from app.services.history_partitions import history_partitions
+from app.services.history_retention import history_retention
+from app.services.history_writer import history_writer
+from app.services.job_queue import optimize_job_queue
+from app.services.model_catalogue import model_catalogue
+from app.services.optimize_cache import optimize_result_cache
+from app.services.prompt_blobs import prompt_blob_store
+from app.services.single_flight import optimize_single_flight
+from app.services.token_budget import optimize_token_budget
+
 router = APIRouter(
     prefix="/v1/health",
     tags=["health"],
@@ -17,3 +35,27 @@ def health_check():
     Checks if the API service is running.
     """
     return {"status": "ok"}
+
+
+@router.get("/metrics", response_model=dict, summary="Runtime Metrics")
+async def runtime_metrics():
+    """
+    Returns runtime counters for connection pools and caches.
+    """
+    return {
+        "gemini_client_pool": gemini_client_pool.stats(),
+        "gemini_resilience": gemini_resilience.stats(),
+        "gemini_limiter": gemini_limiter.stats(),
+        "gemini_hedging": gemini_hedger.stats() if gemini_hedger else None,
+        "gemini_context_cache": gemini_context_cache.stats(),
+        "optimize_cache": await optimize_result_cache.stats(),
+        "single_flight": optimize_single_flight.stats(),
+        "job_queue": await optimize_job_queue.stats(),
+        "model_catalogue": model_catalogue.stats(),
+        "token_budget": optimize_token_budget.stats(),
+        "history_writer": history_writer.stats(),
+        "history_compression": history_compressor.stats(),
+        "prompt_blobs": prompt_blob_store.stats(),
+        "history_retention": history_retention.stats(),
+        "history_partitions": history_partitions.stats(),
+    }
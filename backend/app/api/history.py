@@ -2,14 +2,42 @@
 Prompt History 相關 API 端點
 """
 
-from typing import List
+import base64
+import binascii
+from collections.abc import Iterator
+import csv
+from datetime import UTC, date, datetime, time, timedelta
+import io
+import json
+from typing import Annotated, Literal
+import zlib
 
-from fastapi import APIRouter, HTTPException, status
-from sqlmodel import desc, select
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, or_, tuple_
+from sqlmodel import Session, desc, select
 
-from app.dependencies import SessionDep, VerifyUserDep
-from app.models import PromptHistory
-from app.schemas.history import PromptHistoryOut
+from app.config import settings
+from app.dependencies import SessionDep, VerifyUserDep, engine
+from app.models import PromptHistory, UsageRollup
+from app.schemas.history import (
+    HistoryRetentionOut,
+    HistoryRetentionUpdate,
+    PromptHistoryBulkDelete,
+    PromptHistoryBulkDeleteOut,
+    PromptHistoryOut,
+    PromptHistoryPreviewOut,
+    PromptHistorySearchOut,
+    UsageStatsOut,
+)
+from app.services.history_retention import (
+    delete_history,
+    effective_retention_days,
+    history_retention,
+)
+from app.services.history_search import search_history
+from app.services.prompt_blobs import prompt_blob_store
+from app.utils import compute_etag, etag_matches
 
 router = APIRouter(
     prefix="/v1/prompts",
@@ -17,55 +45,473 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# 列表、匯出與搜尋共用的日期篩選參數
+StartDateQuery = Annotated[date | None, Query(description="起始日期（UTC）")]
+EndDateQuery = Annotated[date | None, Query(description="結束日期（UTC，含）")]
+
+
+def _encode_cursor(history: PromptHistory) -> str:
+    """將分頁位置 (created_at, history_id) 編碼為不透明的游標字串"""
+    payload = json.dumps([history.created_at.isoformat(), history.history_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
 
-@router.get("/history", response_model=List[PromptHistoryOut])
-async def get_prompt_history(session: SessionDep, current_user: VerifyUserDep):
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """解碼游標字串
+
+    Raises:
+        ValueError: 游標格式錯誤時
     """
-    獲取用戶的 Prompt 歷史記錄
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, history_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(history_id)
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError("無效的分頁游標") from e
+
+
+def _history_filters(
+    user_id: int,
+    model: str | None,
+    start_date: date | None,
+    end_date: date | None,
+) -> list:
+    """建立歷史記錄查詢條件（日期以 UTC 計，結束日期包含當天）"""
+    conditions = [PromptHistory.user_id == user_id]
+    if model:
+        conditions.append(PromptHistory.model_used == model)
+    if start_date:
+        conditions.append(
+            PromptHistory.created_at
+            >= datetime.combine(start_date, time.min, tzinfo=UTC)
+        )
+    if end_date:
+        conditions.append(
+            PromptHistory.created_at
+            < datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=UTC)
+        )
+    return conditions
+
+
+def _keyset_before(created_at: datetime, history_id: int):
+    """鍵集分頁條件：排在 (created_at, history_id) 之後（較舊）的記錄"""
+    return tuple_(PromptHistory.created_at, PromptHistory.history_id) < tuple_(
+        created_at, history_id
+    )
+
+
+def _history_out(history: PromptHistory, loaded: dict[str, str]) -> PromptHistoryOut:
+    """將歷史記錄轉換為回應格式
+
+    Args:
+        history: 歷史記錄
+        loaded: prompt_blob_store.load_bodies 取得的完整內容
+    """
+    original_prompt, optimized_prompt = prompt_blob_store.bodies(history, loaded)
+    return PromptHistoryOut(
+        history_id=history.history_id,
+        original_prompt=original_prompt,
+        optimized_prompt=optimized_prompt,
+        model_used=history.model_used,
+        temperature=history.temperature,
+        input_tokens=history.input_tokens,
+        output_tokens=history.output_tokens,
+        total_tokens=history.total_tokens,
+        latency_ms=history.latency_ms,
+        cache_hit=history.cache_hit,
+        created_at=history.created_at,
+    )
+
+
+def _preview_columns(chars: int) -> list:
+    """歷史記錄列表查詢的欄位：中繼資料與在資料庫端截斷的 Prompt 預覽
+
+    存於 prompt_blobs 的內容在文字欄位保留預覽，列表不需讀取完整內容。
+    """
+    return [
+        PromptHistory.history_id,
+        func.substr(PromptHistory.original_prompt, 1, chars).label("original_prompt"),
+        func.substr(PromptHistory.optimized_prompt, 1, chars).label("optimized_prompt"),
+        or_(
+            func.length(PromptHistory.original_prompt) > chars,
+            func.length(PromptHistory.optimized_prompt) > chars,
+            PromptHistory.original_blob_hash.is_not(None),
+            PromptHistory.optimized_blob_hash.is_not(None),
+        ).label("truncated"),
+        PromptHistory.model_used,
+        PromptHistory.temperature,
+        PromptHistory.input_tokens,
+        PromptHistory.output_tokens,
+        PromptHistory.total_tokens,
+        PromptHistory.latency_ms,
+        PromptHistory.cache_hit,
+        PromptHistory.created_at,
+    ]
+
+
+@router.get("/history", response_model=list[PromptHistoryPreviewOut])
+async def get_prompt_history(
+    request: Request,
+    response: Response,
+    session: SessionDep,
+    current_user: VerifyUserDep,
+    limit: int | None = Query(
+        None,
+        ge=1,
+        le=settings.history_page_max_size,
+        description="每頁筆數，預設為 HISTORY_PAGE_SIZE",
+    ),
+    cursor: str | None = Query(None, description="上一頁回應的 X-Next-Cursor"),
+    model: str | None = Query(None, description="只回傳指定模型"),
+    start_date: StartDateQuery = None,
+    end_date: EndDateQuery = None,
+):
+    """
+    獲取用戶的 Prompt 歷史記錄（由新到舊，游標分頁）
+
+    以 (created_at, history_id) 作為鍵集分頁，不使用 OFFSET，
+    因此無論翻到第幾頁，查詢成本都相同。
+
+    回應內容維持為陣列；還有下一頁時以 `X-Next-Cursor` 標頭
+    與 `Link: <...>; rel="next"` 提供下一頁游標。
+
+    Prompt 只回傳前 HISTORY_PREVIEW_CHARS 個字元（於資料庫端截斷），
+    完整內容請以 `GET /history/{history_id}` 取得。
     """
+    limit = limit or settings.history_page_size
+    conditions = _history_filters(current_user.user_id, model, start_date, end_date)
+    if cursor:
+        try:
+            cursor_created_at, cursor_history_id = _decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+            ) from e
+        conditions.append(_keyset_before(cursor_created_at, cursor_history_id))
 
+    # 多取一筆用於判斷是否還有下一頁
     statement = (
-        select(PromptHistory)
-        .where(PromptHistory.user_id == current_user.user_id)
-        .order_by(desc(PromptHistory.created_at))
+        select(*_preview_columns(settings.history_preview_chars))
+        .where(*conditions)
+        .order_by(desc(PromptHistory.created_at), desc(PromptHistory.history_id))
+        .limit(limit + 1)
     )
-
     history = session.exec(statement).all()
 
+    if len(history) > limit:
+        history = history[:limit]
+        next_cursor = _encode_cursor(history[-1])
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+    return [PromptHistoryPreviewOut(**row._mapping) for row in history]
+
+
+def _export_batches(
+    conditions: list, batch_size: int
+) -> Iterator[list[PromptHistoryOut]]:
+    """以鍵集分批讀取歷史記錄（由新到舊）
+
+    每批使用獨立的 session，查詢與轉換完成後即歸還連線，
+    等待用戶端接收資料期間不佔用連線或保持開啟的交易；
+    記憶體用量只與批次大小有關。
+    """
+    after: tuple[datetime, int] | None = None
+    while True:
+        # 串流回應在端點返回後才開始傳送，不使用請求的 session
+        with Session(engine) as session:
+            statement = select(PromptHistory).where(*conditions)
+            if after is not None:
+                statement = statement.where(_keyset_before(*after))
+            statement = statement.order_by(
+                desc(PromptHistory.created_at), desc(PromptHistory.history_id)
+            ).limit(batch_size)
+            rows = session.exec(statement).all()
+            if not rows:
+                return
+            after = (rows[-1].created_at, rows[-1].history_id)
+            loaded = prompt_blob_store.load_bodies(session, rows)
+            batch = [_history_out(h, loaded) for h in rows]
+        yield batch
+        if len(rows) < batch_size:
+            return
+
+
+def _ndjson_lines(batches: Iterator[list[PromptHistoryOut]]) -> Iterator[bytes]:
+    """每批輸出為一段 NDJSON"""
+    for batch in batches:
+        yield "".join(item.model_dump_json() + "\n" for item in batch).encode()
+
+
+def _csv_lines(batches: Iterator[list[PromptHistoryOut]]) -> Iterator[bytes]:
+    """每批輸出為一段 CSV（第一段含標題列）"""
+    fields = list(PromptHistoryOut.model_fields)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    # 加上 BOM 讓試算表軟體正確辨識 UTF-8
+    yield ("\ufeff" + buffer.getvalue()).encode()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(item.model_dump(mode="json") for item in batch)
+        yield buffer.getvalue().encode()
+
+
+def _gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """以 gzip 格式逐段壓縮"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+@router.get("/history/export")
+async def export_prompt_history(
+    current_user: VerifyUserDep,
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="匯出格式"),
+    gzip: bool = Query(False, description="是否以 gzip 壓縮"),
+    model: str | None = Query(None, description="只匯出指定模型"),
+    start_date: StartDateQuery = None,
+    end_date: EndDateQuery = None,
+):
+    """
+    串流匯出用戶的全部 Prompt 歷史記錄（由新到舊）
+
+    依 HISTORY_EXPORT_BATCH_SIZE 分批查詢並逐批輸出，
+    無論記錄數量多少，worker 的記憶體用量都維持固定。
+    """
+    conditions = _history_filters(current_user.user_id, model, start_date, end_date)
+    batches = _export_batches(conditions, settings.history_export_batch_size)
+    if format == "csv":
+        chunks, media_type = _csv_lines(batches), "text/csv; charset=utf-8"
+    else:
+        chunks, media_type = _ndjson_lines(batches), "application/x-ndjson"
+
+    filename = f"prompt-history-{datetime.now(UTC):%Y%m%d}.{format}"
+    if gzip:
+        chunks, media_type = _gzip_chunks(chunks), "application/gzip"
+        filename += ".gz"
+
+    # 同步產生器由 Starlette 於執行緒池中迭代，資料庫查詢不會阻塞事件迴圈
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/history/search", response_model=list[PromptHistorySearchOut])
+async def search_prompt_history(
+    request: Request,
+    response: Response,
+    session: SessionDep,
+    current_user: VerifyUserDep,
+    q: str = Query(..., min_length=1, max_length=200, description="搜尋關鍵字"),
+    limit: int | None = Query(
+        None,
+        ge=1,
+        le=settings.history_page_max_size,
+        description="每頁筆數，預設為 HISTORY_PAGE_SIZE",
+    ),
+    offset: int = Query(0, ge=0, description="略過的筆數"),
+    model: str | None = Query(None, description="只搜尋指定模型"),
+    start_date: StartDateQuery = None,
+    end_date: EndDateQuery = None,
+):
+    """
+    全文檢索用戶的 Prompt 歷史記錄（比對原始與優化後 Prompt）
+
+    以空白分隔的詞皆須出現，結果依相關程度排序。
+    還有下一頁時以 `Link: <...>; rel="next"` 提供下一頁網址。
+    """
+    limit = limit or settings.history_page_size
+    conditions = _history_filters(current_user.user_id, model, start_date, end_date)
+    try:
+        # 多取一筆用於判斷是否還有下一頁
+        results = search_history(session, q, conditions, limit + 1, offset)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        ) from e
+
+    if len(results) > limit:
+        results = results[:limit]
+        next_url = request.url.include_query_params(offset=offset + limit)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+    loaded = prompt_blob_store.load_bodies(session, (h for h, _ in results))
     return [
-        PromptHistoryOut(
-            history_id=h.history_id,
-            original_prompt=h.original_prompt,
-            optimized_prompt=h.optimized_prompt,
-            model_used=h.model_used,
-            temperature=h.temperature,
-            created_at=h.created_at,
-        )
-        for h in history
-        if h.history_id is not None
+        PromptHistorySearchOut(**_history_out(h, loaded).model_dump(), score=score)
+        for h, score in results
     ]
 
 
-@router.delete("/history/{history_id}", status_code=204)
-async def delete_prompt_history(
-    history_id: int, session: SessionDep, current_user: VerifyUserDep
+def _retention_out(user_days: int | None) -> HistoryRetentionOut:
+    global_days = history_retention.global_days
+    return HistoryRetentionOut(
+        retention_days=user_days,
+        global_retention_days=global_days,
+        effective_days=effective_retention_days(user_days, global_days),
+    )
+
+
+@router.get("/history/retention", response_model=HistoryRetentionOut)
+async def get_history_retention(current_user: VerifyUserDep):
+    """
+    獲取用戶的歷史記錄保存期限
+    """
+    return _retention_out(current_user.history_retention_days)
+
+
+@router.put("/history/retention", response_model=HistoryRetentionOut)
+async def update_history_retention(
+    retention: HistoryRetentionUpdate,
+    session: SessionDep,
+    current_user: VerifyUserDep,
 ):
     """
-    刪除用戶的 Prompt 歷史記錄
+    設定用戶的歷史記錄保存期限（retention_days 為 null 時改用系統設定）
+
+    系統設定了較短的期限時以系統設定為準；過期記錄由背景工作定期刪除。
     """
+    current_user.history_retention_days = retention.retention_days
+    session.add(current_user)
+    session.commit()
+    return _retention_out(current_user.history_retention_days)
+
+
+@router.post("/history/delete", response_model=PromptHistoryBulkDeleteOut)
+async def bulk_delete_prompt_history(
+    selection: PromptHistoryBulkDelete,
+    session: SessionDep,
+    current_user: VerifyUserDep,
+):
+    """
+    批次刪除用戶的 Prompt 歷史記錄
 
+    指定 history_ids 或日期範圍（UTC，結束日期包含當天），以單一 DELETE 刪除；
+    不存在或不屬於該用戶的 ID 會被忽略。刪除歷史記錄不會影響已累計的用量。
+    """
+    conditions = _history_filters(
+        current_user.user_id, None, selection.start_date, selection.end_date
+    )
+    if selection.history_ids is not None:
+        conditions.append(PromptHistory.history_id.in_(selection.history_ids))
+    deleted = delete_history(session, conditions)
+    session.commit()
+    return PromptHistoryBulkDeleteOut(deleted=deleted)
+
+
+@router.get(
+    "/history/{history_id}",
+    response_model=PromptHistoryOut,
+    responses={304: {"description": "Not Modified"}},
+)
+async def get_prompt_history_detail(
+    history_id: int,
+    session: SessionDep,
+    current_user: VerifyUserDep,
+    if_none_match: str | None = Header(default=None),
+):
+    """
+    獲取單筆 Prompt 歷史記錄的完整內容
+
+    回應附上 ETag；用戶端帶上 If-None-Match 且內容未變更時回傳 304。
+    """
     statement = (
         select(PromptHistory)
         .where(PromptHistory.user_id == current_user.user_id)
         .where(PromptHistory.history_id == history_id)
     )
-
     history = session.exec(statement).first()
-
     if not history:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="歷史紀錄不存在"
         )
 
-    session.delete(history)
+    loaded = prompt_blob_store.load_bodies(session, [history])
+    body = _history_out(history, loaded).model_dump_json().encode()
+    etag = compute_etag(body)
+    # 內容屬於個別用戶，只允許瀏覽器快取，且每次使用前需重新驗證
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.delete("/history/{history_id}", status_code=204)
+async def delete_prompt_history(
+    history_id: int, session: SessionDep, current_user: VerifyUserDep
+):
+    """
+    刪除用戶的 Prompt 歷史記錄
+    """
+    deleted = delete_history(
+        session,
+        [
+            PromptHistory.user_id == current_user.user_id,
+            PromptHistory.history_id == history_id,
+        ],
+    )
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="歷史紀錄不存在"
+        )
     session.commit()
+
+
+@router.get("/usage", response_model=list[UsageStatsOut])
+async def get_usage_stats(
+    session: SessionDep,
+    current_user: VerifyUserDep,
+    start_date: Annotated[
+        date | None, Query(description="起始日期（UTC），預設為 30 天前")
+    ] = None,
+    end_date: Annotated[
+        date | None, Query(description="結束日期（UTC，含），預設為今天")
+    ] = None,
+    model: str | None = Query(None, description="只回傳指定模型"),
+):
+    """
+    獲取用戶依模型與日期彙總的用量統計
+
+    資料來自寫入歷史記錄時同步遞增的彙總表，不掃描歷史記錄；
+    刪除歷史記錄不會影響已累計的用量。
+    """
+    end_date = end_date or datetime.now(UTC).date()
+    start_date = start_date or end_date - timedelta(days=30)
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="起始日期不能晚於結束日期",
+        )
+
+    statement = (
+        select(UsageRollup)
+        .where(UsageRollup.user_id == current_user.user_id)
+        .where(UsageRollup.day >= start_date, UsageRollup.day <= end_date)
+        .order_by(desc(UsageRollup.day), UsageRollup.model)
+    )
+    if model:
+        statement = statement.where(UsageRollup.model == model)
+
+    return [
+        UsageStatsOut(
+            day=r.day,
+            model=r.model,
+            requests=r.requests,
+            cache_hits=r.cache_hits,
+            input_tokens=r.input_tokens,
+            output_tokens=r.output_tokens,
+            total_tokens=r.total_tokens,
+            upstream_calls=r.upstream_calls,
+            avg_latency_ms=(
+                r.latency_ms_total / r.upstream_calls if r.upstream_calls else None
+            ),
+        )
+        for r in session.exec(statement).all()
+    ]
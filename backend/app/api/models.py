@@ -4,10 +4,12 @@ API 路由：模型相關操作
 
 from typing import List
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, Response, status
 
+from app.config import settings
 from app.schemas.model import Model
-from app.services.gemini_client import GeminiModel
+from app.services.model_catalogue import model_catalogue
+from app.utils import etag_matches
 
 router = APIRouter(
     prefix="/v1/models",
@@ -16,22 +18,27 @@ router = APIRouter(
 )
 
 
-@router.get("/models")
-async def get_available_models() -> List[Model]:
+@router.get(
+    "/models",
+    response_model=List[Model],
+    responses={304: {"description": "Not Modified"}},
+)
+async def get_available_models(
+    if_none_match: str | None = Header(default=None),
+):
     """
     獲取可用的模型列表
-    """
-    _models: List[Model] = []  # 將 GeminiModel 枚舉轉換為 Model 物件列表
-    for gemini_model in GeminiModel:
-        # 將底線替換為空格，然後轉換為標題格式
-        display_name = gemini_model.name.replace("_", " ").title()
-        # 將 "2 5" 替換為 "2.5"
-        display_name = display_name.replace("2 5", "2.5")
 
-        model = Model(
-            name=gemini_model.value,
-            displayName=display_name,
-        )
-        _models.append(model)
-
-    return _models
+    回應內容已預先序列化並附上 ETag；
+    用戶端帶上 If-None-Match 且內容未變更時回傳 304。
+    """
+    etag = model_catalogue.etag
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.model_catalogue_max_age_seconds}",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(
+        content=model_catalogue.body, media_type="application/json", headers=headers
+    )
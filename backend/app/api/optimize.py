@@ -2,15 +2,29 @@
 Prompt 相關 API 端點
 """
 
-from fastapi import APIRouter, HTTPException, status
+import json
+import math
 
-from app.dependencies import OptionalVerifyUserDep, SessionDep
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from app.config import settings
+from app.dependencies import OptionalVerifyUserDep, SessionDep, engine
 from app.schemas.optimize import (
+    OptimizeJobOut,
+    PromptOptimizeBatchRequest,
     PromptOptimizeRequest,
     PromptOptimizeResponse,
 )
-from app.services.gemini_client import gemini_service
+from app.services.gemini_client_pool import get_gemini_client
+from app.services.gemini_resilience import GeminiUnavailableError
+from app.services.history_writer import history_writer
+from app.services.job_queue import JobQueueFullError, optimize_job_queue
+from app.services.optimize_cache import optimize_result_cache
 from app.services.prompt_optimizer import PromptOptimizerService
+from app.services.single_flight import optimize_single_flight
+from app.services.token_budget import optimize_token_budget
 
 router = APIRouter(
     prefix="/v1/prompts",
@@ -30,6 +44,10 @@ async def optimize_prompt(
 
     根據選擇的模板作為系統提示詞與 Gemini API 互動
 
+    提供 models 時會同時呼叫多個模型：
+    - fan_out_mode="first": 回傳最快完成的有效結果（response 的 model 為實際採用的模型）
+    - fan_out_mode="all": 以 NDJSON 依完成順序回傳每個模型的結果與延遲
+
     只有登入情況下才會將結果紀錄於資料庫內
     """
     user_id = current_user.user_id if current_user else None
@@ -38,9 +56,18 @@ async def optimize_prompt(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="API 金鑰不能為空"
         )
+    if request.fan_out_mode == "all":
+        return await _optimize_fan_out_all(request, user_id)
 
     try:
-        optimizer = PromptOptimizerService(session, gemini_service(request.api_key))
+        optimizer = PromptOptimizerService(
+            session,
+            get_gemini_client(request.api_key),
+            result_cache=optimize_result_cache,
+            single_flight=optimize_single_flight,
+            token_budget=optimize_token_budget,
+            history_writer=history_writer,
+        )
         result = await optimizer.optimize_prompt(user_id=user_id, request=request)
         return result
 
@@ -50,7 +77,259 @@ async def optimize_prompt(
         ) from e
     except PermissionError as e:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e)) from e
+    except GeminiUnavailableError as e:
+        raise _unavailable_exception(e) from e
     except RuntimeError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
         ) from e
+
+
+async def _optimize_fan_out_all(
+    request: PromptOptimizeRequest, user_id: int | None
+) -> StreamingResponse:
+    """以 NDJSON 串流回傳多模型比較結果"""
+    # 串流回應在端點返回後才開始傳送，使用獨立的 session 確保寫入歷史記錄時仍有效
+    fan_out_session = Session(engine)
+    try:
+        optimizer = PromptOptimizerService(
+            fan_out_session,
+            get_gemini_client(request.api_key),
+            result_cache=optimize_result_cache,
+            single_flight=optimize_single_flight,
+            token_budget=optimize_token_budget,
+            history_writer=history_writer,
+        )
+        results = await optimizer.optimize_prompt_fan_out(
+            user_id=user_id, request=request
+        )
+    except ValueError as e:
+        fan_out_session.close()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        ) from e
+    except PermissionError as e:
+        fan_out_session.close()
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e)) from e
+
+    async def ndjson_stream():
+        try:
+            async for result in results:
+                yield result.model_dump_json() + "\n"
+        finally:
+            await results.aclose()
+            fan_out_session.close()
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+
+def _unavailable_exception(error: GeminiUnavailableError) -> HTTPException:
+    """將上游暫時無法使用的錯誤轉換為 429/503，並附上 Retry-After"""
+    headers = None
+    if error.retry_after is not None:
+        headers = {"Retry-After": str(max(math.ceil(error.retry_after), 1))}
+    return HTTPException(
+        status_code=error.status_code, detail=str(error), headers=headers
+    )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """格式化一筆 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/optimize/stream")
+async def optimize_prompt_stream(
+    request: PromptOptimizeRequest,
+    http_request: Request,
+    current_user: OptionalVerifyUserDep,
+):
+    """
+    以 Server-Sent Events 串流優化 Prompt
+
+    事件類型：
+    - chunk: 上游產生的文字片段 `{"text": ...}`
+    - done: 完整結果，格式同 /optimize 回應
+    - error: 生成過程發生錯誤 `{"detail": ...}`
+
+    串流完成後才會將結果紀錄於資料庫（僅限登入用戶）；
+    用戶端中途斷線時會停止上游生成，且不寫入歷史記錄。
+    """
+    user_id = current_user.user_id if current_user else None
+
+    if not request.api_key:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="API 金鑰不能為空"
+        )
+
+    # 串流回應在端點返回後才開始傳送，使用獨立的 session 確保寫入歷史記錄時仍有效
+    stream_session = Session(engine)
+    try:
+        optimizer = PromptOptimizerService(
+            stream_session,
+            get_gemini_client(request.api_key),
+            token_budget=optimize_token_budget,
+            history_writer=history_writer,
+        )
+        stream = await optimizer.optimize_prompt_stream(
+            user_id=user_id, request=request
+        )
+    except ValueError as e:
+        stream_session.close()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        ) from e
+    except PermissionError as e:
+        stream_session.close()
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e)) from e
+
+    async def event_stream():
+        texts: list[str] = []
+        try:
+            async for text in stream.chunks:
+                if await http_request.is_disconnected():
+                    break
+                texts.append(text)
+                yield _sse_event("chunk", {"text": text})
+            else:
+                result = PromptOptimizeResponse(
+                    optimized_prompt="".join(texts),
+                    improvement_analysis="已根據模板進行優化",
+                    original_prompt=stream.original_prompt,
+                    model=stream.model,
+                )
+                yield _sse_event("done", result.model_dump())
+        except RuntimeError as e:
+            yield _sse_event("error", {"detail": str(e)})
+        finally:
+            # 關閉產生器會一併關閉上游串流，停止後續 token 生成
+            await stream.chunks.aclose()
+            stream_session.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/optimize/batch")
+async def optimize_prompts_batch(
+    request: PromptOptimizeBatchRequest,
+    current_user: OptionalVerifyUserDep,
+):
+    """
+    批次優化 Prompt
+
+    所有 Prompt 共用同一個模板與模型，模板只查詢一次。
+    以 NDJSON 串流回傳每筆結果（依完成順序，以 index 對應請求位置），
+    同時進行的上游呼叫數受 concurrency 限制。
+
+    登入情況下，所有成功項目的歷史記錄會在結束時以單一交易寫入。
+    """
+    user_id = current_user.user_id if current_user else None
+
+    if not request.api_key:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="API 金鑰不能為空"
+        )
+    if len(request.prompts) > settings.batch_optimize_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"單次批次最多 {settings.batch_optimize_max_items} 筆",
+        )
+
+    concurrency = min(
+        request.concurrency or settings.batch_optimize_concurrency,
+        settings.batch_optimize_max_concurrency,
+    )
+
+    # 串流回應在端點返回後才開始傳送，使用獨立的 session 確保寫入歷史記錄時仍有效
+    batch_session = Session(engine)
+    try:
+        optimizer = PromptOptimizerService(
+            batch_session,
+            get_gemini_client(request.api_key),
+            result_cache=optimize_result_cache,
+            single_flight=optimize_single_flight,
+            token_budget=optimize_token_budget,
+            history_writer=history_writer,
+        )
+        items = await optimizer.optimize_prompts_batch(
+            user_id=user_id, request=request, concurrency=concurrency
+        )
+    except ValueError as e:
+        batch_session.close()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        ) from e
+    except PermissionError as e:
+        batch_session.close()
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e)) from e
+
+    async def ndjson_stream():
+        try:
+            async for item in items:
+                yield item.model_dump_json() + "\n"
+        finally:
+            await items.aclose()
+            batch_session.close()
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+
+@router.post(
+    "/optimize/jobs",
+    response_model=OptimizeJobOut,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def submit_optimize_job(
+    request: PromptOptimizeRequest,
+    current_user: OptionalVerifyUserDep,
+):
+    """
+    以背景工作方式優化 Prompt
+
+    立即回傳 job_id，由 worker 執行優化；
+    透過 GET /optimize/jobs/{job_id} 查詢或長輪詢結果。
+    """
+    user_id = current_user.user_id if current_user else None
+
+    if not request.api_key:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="API 金鑰不能為空"
+        )
+
+    try:
+        job_id = await optimize_job_queue.submit(user_id=user_id, request=request)
+    except JobQueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "5"},
+        ) from e
+
+    return await optimize_job_queue.get(job_id)
+
+
+@router.get("/optimize/jobs/{job_id}", response_model=OptimizeJobOut)
+async def get_optimize_job(
+    job_id: str,
+    current_user: OptionalVerifyUserDep,
+    wait: float = Query(0, ge=0, description="長輪詢等待秒數，0 表示立即回傳"),
+):
+    """
+    查詢背景優化工作狀態
+
+    wait > 0 時會等待工作結束或逾時後才回傳（長輪詢），
+    等待時間上限為 JOB_LONG_POLL_MAX_SECONDS。
+    """
+    timeout = min(wait, settings.job_long_poll_max_seconds)
+    job = await optimize_job_queue.wait(job_id, timeout)
+
+    user_id = current_user.user_id if current_user else None
+    # 登入用戶提交的工作只有本人可以查詢
+    if job is None or (job["user_id"] is not None and job["user_id"] != user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="工作不存在")
+
+    return job
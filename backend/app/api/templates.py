@@ -11,6 +11,8 @@ from sqlmodel import and_, or_, select
 from app.dependencies import OptionalVerifyUserDep, SessionDep, VerifyUserDep
 from app.models import Template
 from app.schemas.template import TemplateCreate, TemplateOut, TemplateUpdate
+from app.services.gemini_client_pool import gemini_context_cache
+from app.services.token_budget import estimate_tokens
 
 router = APIRouter(
     prefix="/v1/templates",
@@ -93,6 +95,7 @@ async def create_template(
         name=template.name,
         description=template.description,
         content=template.content,
+        content_tokens=estimate_tokens(template.content),
         is_default=False,  # 預設不設為預設模板
         category=template.category or "Custom",  # 如果沒有指定分類，預設為 'Custom'
     )
@@ -129,9 +132,12 @@ async def update_template(
 
     # 只更新有傳入的欄位
     update_data = template.model_dump(exclude_unset=True)
+    previous_content = existing_template.content
 
     for field, value in update_data.items():
         setattr(existing_template, field, value)
+    if "content" in update_data:
+        existing_template.content_tokens = estimate_tokens(existing_template.content)
 
     # 更新時間戳
     existing_template.updated_at = datetime.now(timezone.utc)
@@ -140,6 +146,10 @@ async def update_template(
     session.commit()
     session.refresh(existing_template)
 
+    # 內容變更後舊內容的上游上下文快取不再使用
+    if existing_template.content != previous_content:
+        await gemini_context_cache.invalidate(previous_content)
+
     return existing_template
 
 
@@ -165,7 +175,9 @@ async def delete_template(
             detail=f"模板 ID {template_id} 不存在",
         )
 
+    content = existing_template.content
     session.delete(existing_template)
     session.commit()
+    await gemini_context_cache.invalidate(content)
 
     return {"message": f"模板 ID {template_id} 已成功刪除"}
@@ -22,6 +22,113 @@ class Settings(BaseSettings):
     database_type: str = "sqlite"
     database_url: str = ""
 
+    # Gemini 客戶端連線池設定
+    gemini_client_pool_size: int = 128
+    gemini_client_idle_seconds: float = 600.0
+    gemini_max_connections: int = 100
+    gemini_max_keepalive_connections: int = 20
+    gemini_keepalive_expiry_seconds: float = 60.0
+
+    # Gemini 重試與斷路器設定
+    gemini_retry_max_attempts: int = 3
+    gemini_retry_max_attempts_per_model: dict[str, int] = {}
+    gemini_retry_base_delay_seconds: float = 0.5
+    gemini_retry_max_delay_seconds: float = 8.0
+    gemini_retry_max_retry_after_seconds: float = 30.0
+    gemini_breaker_failure_threshold: int = 5
+    gemini_breaker_recovery_seconds: float = 30.0
+
+    # Gemini 依模型併發限制設定（AIMD 自適應，limits 為各模型上限）
+    gemini_concurrency_default_limit: int = 16
+    gemini_concurrency_limits: dict[str, int] = {}
+    gemini_concurrency_min_limit: int = 1
+    gemini_concurrency_max_queue: int = 100
+
+    # Gemini 請求對沖設定
+    gemini_hedge_enabled: bool = False
+    gemini_hedge_percentile: float = 0.95
+    gemini_hedge_min_samples: int = 20
+    gemini_hedge_min_delay_seconds: float = 0.05
+    gemini_hedge_max_ratio: float = 0.1
+
+    # Prompt 優化結果快取設定
+    optimize_cache_enabled: bool = True
+    optimize_cache_ttl_seconds: int = 3600
+    optimize_cache_max_entries: int = 10000
+    optimize_cache_max_temperature: float = 0.2
+
+    # Token 預算設定
+    # optimize_input_overflow: "reject"（回傳 400）或 "truncate"（截斷使用者輸入）
+    optimize_max_input_tokens: int = 32000
+    optimize_max_output_tokens: int = 8192
+    optimize_input_overflow: str = "reject"
+
+    # 相同請求合併（single-flight）設定
+    single_flight_enabled: bool = True
+    single_flight_redis: bool = False
+    single_flight_lock_ttl_seconds: float = 60.0
+    single_flight_result_ttl_seconds: float = 10.0
+
+    # 批次優化設定
+    batch_optimize_max_items: int = 1000
+    batch_optimize_concurrency: int = 8
+    batch_optimize_max_concurrency: int = 32
+
+    # 背景工作佇列設定
+    # job_queue_backend: "memory"（API 行程內執行）或 "redis"（獨立 worker 行程）
+    job_queue_backend: str = "memory"
+    job_queue_max_depth: int = 10000
+    job_worker_concurrency: int = 8
+    job_result_ttl_seconds: int = 3600
+    job_claim_idle_seconds: float = 300.0
+    job_long_poll_max_seconds: float = 30.0
+
+    # 上下文快取（cached content）設定：重複使用模板系統指令，會產生上游儲存費用
+    gemini_context_cache_enabled: bool = False
+    gemini_context_cache_ttl_seconds: int = 3600
+    gemini_context_cache_refresh_seconds: float = 300.0
+    gemini_context_cache_min_tokens: int = 1024
+
+    # 歷史記錄分頁與匯出設定
+    history_page_size: int = 50
+    history_page_max_size: int = 200
+    history_export_batch_size: int = 500
+    history_preview_chars: int = 200
+
+    # 歷史記錄保存期限設定：0 表示永久保存；用戶可另設較短的期限
+    # 背景工作每 interval 秒檢查一次，每批最多刪除 batch_size 筆，批次間暫停 pause 秒
+    history_retention_days: int = 0
+    history_retention_interval: float = 3600.0
+    history_retention_batch_size: int = 500
+    history_retention_pause: float = 0.05
+
+    # prompt_history 時間分區設定（僅 PostgreSQL，SQLite 不受影響）
+    # 啟用後依 created_at 每月一個分區，預先建立 months_ahead 個月的分區，
+    # 系統保存期限改以刪除整個過期的月份分區處理；需在執行遷移前啟用
+    history_partitioning_enabled: bool = False
+    history_partition_months_ahead: int = 3
+
+    # 歷史記錄內容去重設定：達門檻的內容以雜湊存於 prompt_blobs，相同內容只存一次
+    history_blob_min_bytes: int = 512
+
+    # 歷史記錄內容壓縮設定（僅 SQLite；PostgreSQL 由 TOAST 自動壓縮）
+    history_compression_enabled: bool = True
+    history_compression_min_bytes: int = 512
+    history_compression_level: int = 6
+
+    # 歷史記錄延遲寫入（write-behind）設定：啟用後記錄會延遲最多 flush_interval 秒才出現
+    history_write_behind_enabled: bool = False
+    history_write_behind_max_buffer: int = 10000
+    history_write_behind_batch_size: int = 500
+    history_write_behind_flush_interval: float = 1.0
+
+    # 模型目錄設定
+    # model_catalogue_api_key: 查詢上游模型列表用的金鑰；未設定時只提供內建模型
+    model_catalogue_api_key: str = ""
+    model_catalogue_ttl_seconds: float = 3600.0
+    model_catalogue_retry_seconds: float = 60.0
+    model_catalogue_max_age_seconds: int = 60
+
     model_config = SettingsConfigDict(env_file=".env")
 
     @field_validator("secret_key", mode="before")
@@ -13,9 +13,12 @@ from sqlmodel import Session, SQLModel, create_engine, select
 
 from app.config import settings
 from app.models import User
+from app.services.history_compression import history_compressor
 from app.utils import decode_token, is_token_blacklisted
 
 engine = create_engine(settings.database_url, connect_args={"check_same_thread": False})
+# SQLite 連線需註冊 history_text 函式（搜尋短詞時以 LIKE 比對壓縮內容）並載入字典
+history_compressor.bind(engine)
 
 
 def run_alembic_migration():
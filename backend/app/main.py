@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 import sys
 
@@ -12,7 +13,14 @@ from app.api import (
     prompt_router,
     template_router,
 )
+from app.config import settings
 from app.dependencies import create_db_and_tables
+from app.services.gemini_client_pool import gemini_client_pool, gemini_context_cache
+from app.services.history_compression import history_compressor
+from app.services.history_retention import history_retention
+from app.services.history_writer import history_writer
+from app.services.job_queue import optimize_job_queue
+from app.services.model_catalogue import model_catalogue
 from app.utils import get_redis_client
 
 
@@ -40,8 +48,39 @@ async def lifespan(_: FastAPI):
     """Create the database and tables"""
     create_db_and_tables()
     check_redis_connection()
+
+    # 尚無壓縮字典且已有足夠的歷史記錄時，訓練共用字典
+    await asyncio.to_thread(history_compressor.ensure_dictionary)
+
+    # 記憶體佇列由 API 行程內的 worker 執行；Redis 佇列由 app.worker 獨立執行
+    stop_workers = asyncio.Event()
+    worker_task = None
+    if settings.job_queue_backend == "memory":
+        worker_task = asyncio.create_task(
+            optimize_job_queue.run_worker(stop_workers, settings.job_worker_concurrency)
+        )
+
+    # 啟用延遲寫入時，歷史記錄由背景工作批次寫入
+    history_writer.start()
+
+    # 背景定期向上游更新模型目錄（未設定金鑰時只提供內建模型）
+    model_catalogue.start()
+
+    # 背景定期刪除超過保存期限的歷史記錄
+    history_retention.start()
+
     yield
-    # Cleanup code can be added here if needed
+
+    await history_retention.stop()
+    await model_catalogue.stop()
+    stop_workers.set()
+    if worker_task is not None:
+        await worker_task
+    # 所有產生歷史記錄的工作結束後，寫入緩衝區內剩餘的記錄
+    await history_writer.stop()
+    # 先刪除上游上下文快取（需要客戶端），再關閉連線池
+    await gemini_context_cache.aclose()
+    await gemini_client_pool.aclose()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -56,6 +95,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 讓前端讀取歷史記錄分頁游標
+    expose_headers=["X-Next-Cursor", "Link"],
 )
 
 app.include_router(
@@ -2,9 +2,20 @@
 PromptMaster AI 後端資料模型模組
 """
 
+from .history_dictionary import HistoryDictionary
+from .prompt_blob import PromptBlob
 from .prompt_history import PromptHistory
 from .template import Template
 from .token_blacklist import TokenBlacklist
+from .usage_rollup import UsageRollup
 from .user import User
 
-__all__ = ["User", "Template", "PromptHistory", "TokenBlacklist"]
+__all__ = [
+    "User",
+    "Template",
+    "PromptHistory",
+    "PromptBlob",
+    "HistoryDictionary",
+    "TokenBlacklist",
+    "UsageRollup",
+]
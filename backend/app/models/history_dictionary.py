@@ -0,0 +1,20 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import Column, LargeBinary
+from sqlmodel import Field, SQLModel
+
+
+class HistoryDictionary(SQLModel, table=True):
+    """
+    HistoryDictionary 類別，壓縮歷史記錄內容用的 zlib 預設字典。
+
+    字典由既有歷史記錄訓練而成，壓縮內容會記錄所使用的字典 ID，
+    因此字典只新增、不修改或刪除。
+    """
+
+    __tablename__: str = "history_dictionaries"
+
+    dictionary_id: int | None = Field(default=None, primary_key=True)
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    sample_count: int = 0
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
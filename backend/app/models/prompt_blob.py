@@ -0,0 +1,25 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import Column, LargeBinary
+from sqlmodel import Field, SQLModel
+
+
+class PromptBlob(SQLModel, table=True):
+    """
+    PromptBlob 類別，以內容雜湊（SHA-256）為鍵、只儲存一次的 Prompt 內容。
+
+    歷史記錄以雜湊參考內容，ref_count 為參考次數；
+    歸零時於刪除歷史記錄的同一交易內刪除。
+    """
+
+    __tablename__: str = "prompt_blobs"
+
+    blob_hash: str = Field(primary_key=True, max_length=64)
+    # 未壓縮時存於 body，壓縮時存於 body_z（兩者擇一）
+    body: str | None = None
+    body_z: bytes | None = Field(
+        default=None, sa_column=Column(LargeBinary, nullable=True)
+    )
+    size_bytes: int = 0
+    ref_count: int = 0
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
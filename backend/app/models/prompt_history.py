@@ -1,5 +1,6 @@
 from datetime import datetime, timezone
 
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
 
@@ -9,12 +10,31 @@ class PromptHistory(SQLModel, table=True):
     """
 
     __tablename__: str = "prompt_history"
+    __table_args__ = (
+        # 依用戶由新到舊的歷史記錄列表與游標分頁
+        Index("ix_prompt_history_user_created", "user_id", "created_at", "history_id"),
+    )
 
+    # PostgreSQL 啟用分區時，資料庫的主鍵為 (history_id, created_at)；
+    # history_id 仍由序列產生且唯一，ORM 以 history_id 識別
     history_id: int | None = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="users.user_id")
+    # 內容達門檻時，文字欄位只保留預覽，完整內容以雜湊參考 prompt_blobs
     original_prompt: str
     optimized_prompt: str
+    original_blob_hash: str | None = Field(
+        default=None, foreign_key="prompt_blobs.blob_hash", max_length=64
+    )
+    optimized_blob_hash: str | None = Field(
+        default=None, foreign_key="prompt_blobs.blob_hash", max_length=64
+    )
     template_id: int = Field(foreign_key="templates.template_id")
     model_used: str
     temperature: float
+    # 上游用量與延遲；命中快取或共用他人呼叫時 token 為 0、延遲為 None
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    total_tokens: int | None = None
+    latency_ms: int | None = None
+    cache_hit: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
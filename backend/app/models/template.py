@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
 
@@ -10,12 +11,19 @@ class Template(SQLModel, table=True):
     """
 
     __tablename__: str = "templates"  # 明確指定資料表名稱
+    __table_args__ = (
+        # 用戶模板查詢與同名檢查；與 is_default 索引合併處理 user_id OR is_default
+        Index("ix_templates_user_name", "user_id", "name"),
+        Index("ix_templates_is_default", "is_default"),
+    )
 
     template_id: Optional[int] = Field(default=None, primary_key=True)
     user_id: Optional[int] = Field(default=None, foreign_key="users.user_id")
     name: str
     description: Optional[str] = None
     content: str
+    # 建立/更新時預先計算的模板 token 估算值，供優化前的預算檢查使用
+    content_tokens: int | None = None
     is_default: bool = False
     category: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
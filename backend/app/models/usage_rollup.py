@@ -0,0 +1,33 @@
+from datetime import UTC, date, datetime
+
+from sqlalchemy import Index, UniqueConstraint, text
+from sqlmodel import Field, SQLModel
+
+
+class UsageRollup(SQLModel, table=True):
+    """
+    UsageRollup 類別，依用戶、模型與日期（UTC）累計的用量彙總。
+
+    寫入歷史記錄時於同一交易內遞增，查詢統計時不需掃描歷史記錄；
+    刪除歷史記錄不會扣回已發生的用量。
+    """
+
+    __tablename__: str = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "model", "day", name="uq_usage_rollups_key"),
+        # 用量統計依日期由新到舊、同日依模型排序
+        Index("ix_usage_rollups_user_day", "user_id", text("day DESC"), "model"),
+    )
+
+    rollup_id: int | None = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="users.user_id")
+    model: str
+    day: date
+    requests: int = 0
+    cache_hits: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+    upstream_calls: int = 0
+    latency_ms_total: int = 0
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
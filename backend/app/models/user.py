@@ -16,3 +16,5 @@ class User(SQLModel, table=True):
     password_hash: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     last_login: datetime | None = None
+    # 歷史記錄保存天數，None 時只套用系統設定（HISTORY_RETENTION_DAYS）
+    history_retention_days: int | None = None
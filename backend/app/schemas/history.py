@@ -3,9 +3,9 @@
 用於 Prompt 優化請求、回應與歷史紀錄的 API 資料驗證。
 """
 
-from datetime import datetime
+from datetime import date, datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 
 class PromptHistoryOut(BaseModel):
@@ -19,4 +19,92 @@ class PromptHistoryOut(BaseModel):
     optimized_prompt: str | None
     model_used: str
     temperature: float
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    total_tokens: int | None = None
+    latency_ms: int | None = None
+    cache_hit: bool = False
     created_at: datetime
+
+
+class PromptHistoryPreviewOut(PromptHistoryOut):
+    """
+    歷史紀錄列表 schema，對應 /api/prompts/history API 回傳格式。
+    original_prompt 與 optimized_prompt 只包含前 HISTORY_PREVIEW_CHARS 個字元，
+    truncated 為 True 時可由 /api/prompts/history/{history_id} 取得完整內容。
+    """
+
+    truncated: bool = False
+
+
+class PromptHistorySearchOut(PromptHistoryOut):
+    """
+    歷史紀錄搜尋結果 schema，對應 /api/prompts/history/search API 回傳格式。
+    score 為相關分數，越高越相關。
+    """
+
+    score: float
+
+
+class PromptHistoryBulkDelete(BaseModel):
+    """
+    歷史紀錄批次刪除請求 schema，對應 POST /api/prompts/history/delete API 輸入格式。
+    指定 history_ids 或日期範圍（UTC，結束日期包含當天），兩者同時指定時須都符合。
+    """
+
+    history_ids: list[int] | None = Field(None, min_length=1, max_length=1000)
+    start_date: date | None = None
+    end_date: date | None = None
+
+    @model_validator(mode="after")
+    def validate_selection(self) -> "PromptHistoryBulkDelete":
+        if self.history_ids is None and not (self.start_date or self.end_date):
+            raise ValueError("請指定 history_ids 或日期範圍")
+        if self.start_date and self.end_date and self.start_date > self.end_date:
+            raise ValueError("起始日期不能晚於結束日期")
+        return self
+
+
+class PromptHistoryBulkDeleteOut(BaseModel):
+    """
+    歷史紀錄批次刪除回應 schema，deleted 為實際刪除的筆數。
+    """
+
+    deleted: int
+
+
+class HistoryRetentionOut(BaseModel):
+    """
+    歷史紀錄保存期限 schema，對應 /api/prompts/history/retention API 回傳格式。
+    retention_days 為用戶設定，global_retention_days 為系統設定，
+    effective_days 為實際套用的天數（兩者取較短者），None 表示永久保存。
+    """
+
+    retention_days: int | None
+    global_retention_days: int | None
+    effective_days: int | None
+
+
+class HistoryRetentionUpdate(BaseModel):
+    """
+    歷史紀錄保存期限更新請求 schema，retention_days 為 None 時改用系統設定。
+    """
+
+    retention_days: int | None = Field(None, ge=1, le=36500)
+
+
+class UsageStatsOut(BaseModel):
+    """
+    用量統計 schema，對應 /api/prompts/usage API 回傳格式。
+    每筆為單一模型在單一日期（UTC）的彙總。
+    """
+
+    day: date
+    model: str
+    requests: int
+    cache_hits: int
+    input_tokens: int
+    output_tokens: int
+    total_tokens: int
+    upstream_calls: int
+    avg_latency_ms: float | None
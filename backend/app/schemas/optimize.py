@@ -3,29 +3,116 @@
 用於 Prompt 優化請求、回應與歷史紀錄的 API 資料驗證。
 """
 
-from pydantic import BaseModel
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+
+class OptimizeUsage(BaseModel):
+    """
+    單次優化的上游用量 schema，包含輸入/輸出/總 token 數與上游延遲（毫秒）。
+    命中快取或共用其他請求的上游呼叫時 token 為 0、延遲為 None。
+    """
+
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    total_tokens: int | None = None
+    latency_ms: int | None = None
+    # 命中上游上下文快取、以較低費率計費的輸入 token 數
+    cached_tokens: int | None = None
 
 
 class PromptOptimizeRequest(BaseModel):
     """
     Prompt 優化請求 schema，對應 /api/prompts/optimize API 輸入格式。
     包含原始 Prompt、模板 ID、模型名稱與溫度參數。
+    提供 models 時會同時呼叫多個模型：
+    - first: 回傳最快完成的有效結果，並取消其餘模型
+    - all: 以 NDJSON 依完成順序回傳每個模型的結果與延遲
     """
 
     api_key: str
     original_prompt: str
     template_id: int
-    model: str
+    model: str | None = None
+    models: list[str] | None = Field(None, min_length=1, max_length=5)
+    fan_out_mode: Literal["first", "all"] = "first"
     temperature: float | None = 0.2
-    max_output_tokens: int | None = None
+    max_output_tokens: int | None = Field(None, ge=1)
+    # None: 依溫度自動決定是否使用快取；True/False: 強制使用/不使用
+    use_cache: bool | None = None
 
 
 class PromptOptimizeResponse(BaseModel):
     """
     Prompt 優化回應 schema，對應 /api/prompts/optimize API 回傳格式。
-    包含優化後 Prompt、優化分析與原始 Prompt。
+    包含優化後 Prompt、優化分析、原始 Prompt、使用的模型與是否命中快取。
     """
 
     optimized_prompt: str
     improvement_analysis: str
     original_prompt: str
+    model: str | None = None
+    cache_hit: bool = False
+    usage: OptimizeUsage | None = None
+
+
+class PromptOptimizeModelResult(BaseModel):
+    """
+    多模型比較（fan_out_mode="all"）的單一模型結果 schema，以 NDJSON 逐行回傳。
+    失敗時 error 有值。
+    """
+
+    model: str
+    optimized_prompt: str | None = None
+    improvement_analysis: str | None = None
+    cache_hit: bool = False
+    usage: OptimizeUsage | None = None
+    latency_ms: int
+    error: str | None = None
+
+
+class PromptOptimizeBatchRequest(BaseModel):
+    """
+    批次 Prompt 優化請求 schema，對應 /api/prompts/optimize/batch API 輸入格式。
+    所有 Prompt 共用同一個模板、模型與溫度參數。
+    """
+
+    api_key: str
+    prompts: list[str] = Field(..., min_length=1)
+    template_id: int
+    model: str
+    temperature: float | None = 0.2
+    max_output_tokens: int | None = Field(None, ge=1)
+    use_cache: bool | None = None
+    concurrency: int | None = Field(None, ge=1, description="同時進行的上游呼叫數")
+
+
+class PromptOptimizeBatchItem(BaseModel):
+    """
+    批次 Prompt 優化單筆結果 schema，以 NDJSON 逐行回傳。
+    index 對應請求中 prompts 的位置；失敗時 error 有值。
+    """
+
+    index: int
+    original_prompt: str
+    optimized_prompt: str | None = None
+    improvement_analysis: str | None = None
+    cache_hit: bool = False
+    usage: OptimizeUsage | None = None
+    error: str | None = None
+
+
+class OptimizeJobOut(BaseModel):
+    """
+    背景優化工作 schema，對應 /api/prompts/optimize/jobs API 回傳格式。
+    status 為 queued、running、succeeded 或 failed；成功時 result 有值。
+    """
+
+    job_id: str
+    status: str
+    result: PromptOptimizeResponse | None = None
+    error: str | None = None
+    created_at: str
+    started_at: str | None = None
+    finished_at: str | None = None
@@ -20,6 +20,7 @@ class TemplateOut(BaseModel):
     is_default: bool
     category: str | None
     content: str
+    content_tokens: int | None = None
     created_at: datetime
 
 
@@ -2,14 +2,59 @@
 Google Gemini API 客戶端
 """
 
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, nullcontext
+from dataclasses import dataclass
 from enum import Enum
 import logging
+import time
 
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+import httpx
+
+from app.services.gemini_context_cache import GeminiContextCache
+from app.services.gemini_hedging import RequestHedger
+from app.services.gemini_limiter import ModelConcurrencyLimiter
+from app.services.gemini_resilience import GeminiResilience
 
 logger = logging.getLogger(__name__)
 
+# 關閉 HTTP 連線池時可能發生的錯誤（例如事件迴圈已關閉、連線已中斷）
+CLOSE_ERRORS = (OSError, RuntimeError, httpx.HTTPError)
+
+
+@dataclass
+class GenerationUsage:
+    """單次生成的 token 用量與上游延遲"""
+
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    total_tokens: int | None = None
+    latency_ms: int | None = None
+    # 命中上下文快取、以較低費率計費的輸入 token 數
+    cached_tokens: int | None = None
+
+    def update(
+        self,
+        metadata: types.GenerateContentResponseUsageMetadata | None,
+        latency_ms: int,
+    ) -> None:
+        """以上游回傳的 usage_metadata 更新用量（輸出包含思考 token）"""
+        self.latency_ms = latency_ms
+        if metadata is None:
+            return
+        self.input_tokens = metadata.prompt_token_count
+        if (
+            metadata.candidates_token_count is not None
+            or metadata.thoughts_token_count is not None
+        ):
+            self.output_tokens = (metadata.candidates_token_count or 0) + (
+                metadata.thoughts_token_count or 0
+            )
+        self.total_tokens = metadata.total_token_count
+        self.cached_tokens = metadata.cached_content_token_count
+
 
 class GeminiClient:
     """Gemini API 客戶端
@@ -24,17 +69,34 @@ class GeminiClient:
     def __init__(
         self,
         api_key: str,
+        http_options: types.HttpOptions | None = None,
+        resilience: GeminiResilience | None = None,
+        limiter: ModelConcurrencyLimiter | None = None,
+        hedger: RequestHedger | None = None,
+        context_cache: GeminiContextCache | None = None,
     ):
         """初始化 Gemini API 客戶端
 
         Args:
             api_key: API 密鑰（必需參數）
+            http_options: 傳遞給 SDK 的 HTTP 設定（例如自訂 base_url），可選
+            resilience: 重試與斷路器設定，可選；未提供時不重試
+            limiter: 依模型的併發限制器，可選；未提供時不限制
+            hedger: 請求對沖設定，可選；未提供時不對沖
+            context_cache: 模板系統指令的上游上下文快取，可選；未提供時不使用
         """
         if not api_key:
             raise ValueError("API 密鑰不能為空")
 
         self.api_key = api_key
+        self.http_options = http_options
+        self.resilience = resilience
+        self.limiter = limiter
+        self.hedger = hedger
+        self.context_cache = context_cache
         self._client = None
+        self._in_flight = 0
+        self._retired = False
         self.default_temperature = 0.2
         self.default_max_output_tokens = 2048
 
@@ -42,46 +104,108 @@ class GeminiClient:
     def client(self) -> genai.Client:
         """獲取 Gemini 客戶端實例（懶載入）"""
         if self._client is None:
-            self._client = genai.Client(api_key=self.api_key)
+            self._client = genai.Client(
+                api_key=self.api_key, http_options=self.http_options
+            )
         return self._client
 
+    @property
+    def is_retired(self) -> bool:
+        """是否已被連線池淘汰（不應再發出新的請求）"""
+        return self._retired
+
+    def close(self) -> None:
+        """關閉底層同步 HTTP 連線池"""
+        # 較舊版本的 SDK 沒有提供 close()，此時交由 GC 回收
+        if self._client is not None and hasattr(self._client, "close"):
+            self._client.close()
+
+    async def aclose(self) -> None:
+        """關閉底層同步與非同步 HTTP 連線池"""
+        if self._client is None:
+            return
+        if hasattr(self._client.aio, "aclose"):
+            await self._client.aio.aclose()
+        self.close()
+        self._client = None
+
+    async def retire(self) -> None:
+        """停止使用此客戶端（由連線池淘汰時呼叫）
+
+        沒有進行中的非同步請求時立即關閉同步與非同步連線池，
+        否則等最後一個請求結束後再關閉。
+        """
+        self._retired = True
+        if self._in_flight == 0:
+            await self._close_retired()
+
+    async def _close_retired(self) -> None:
+        try:
+            await self.aclose()
+        except CLOSE_ERRORS as e:
+            logger.warning("關閉 Gemini 客戶端失敗: %s", e)
+
+    @asynccontextmanager
+    async def _in_use(self) -> AsyncIterator[None]:
+        """標記進行中的非同步請求，避免請求途中連線池被關閉"""
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            if self._retired and self._in_flight == 0:
+                await self._close_retired()
+
+    def _slot(self, model: str) -> AbstractAsyncContextManager:
+        """取得模型的併發名額（未設定限制器時不限制）"""
+        if self.limiter is None:
+            return nullcontext()
+        return self.limiter.slot(model)
+
+    async def _use_context_cache(self, request_data: dict) -> str | None:
+        """改用上下文快取傳送系統指令，回傳使用的快取名稱（未使用時為 None）"""
+        if self.context_cache is None:
+            return None
+        config = request_data["config"]
+        cached_content = await self.context_cache.get_handle(
+            self, request_data["model"], config.system_instruction
+        )
+        if cached_content is not None:
+            # 使用快取時不可同時傳送 system_instruction
+            request_data["config"] = config.model_copy(
+                update={"system_instruction": None, "cached_content": cached_content}
+            )
+        return cached_content
+
     def get_model_list(self):
         """
         獲取可用的模型列表
         """
         return self.client.models.list()
 
-    def generate_content(
-        self,
-        model: str | None = None,
-        system_instruction: str | None = None,
-        content: str | None = None,
-        temperature: float | None = None,
-        max_output_tokens: int | None = None,
-    ) -> str | None:
+    async def list_models_async(self) -> list[types.Model]:
         """
-        生成內容
+        非同步獲取上游所有可用模型（自動處理分頁）
+        """
+        async with self._in_use():
+            pager = await self.client.aio.models.list()
+            return [model async for model in pager]
 
-        Args:
-            model: 要使用的模型名稱
-            system_instruction: 系統指令
-            content: 使用者輸入內容
-            temperature: 溫度參數（控制創造性），範圍 0.0-2.0
-            max_output_tokens: 最大輸出令牌數量
+    def _build_request(
+        self,
+        model: str | None,
+        system_instruction: str | None,
+        content: str | None,
+        temperature: float | None,
+        max_output_tokens: int | None,
+    ) -> dict:
+        """
+        驗證參數並建構請求資料
 
-        Returns:
-            包含生成結果的字典，格式：
-            {
-                "success": bool,
-                "content": str | None,
-                "model": str | None,
-                "usage": dict | None,
-                "error": str | None
-            }
+        同步與非同步生成共用此方法，確保兩條路徑的驗證規則一致。
 
         Raises:
             ValueError: 當參數無效時
-            Exception: 當 API 請求失敗時
         """
         # 參數驗證
         if model is None:
@@ -100,21 +224,243 @@ class GeminiClient:
             max_output_tokens
             if max_output_tokens is not None
             else self.default_max_output_tokens
-        )  # 建構請求資料
-        request_data = {
+        )
+        if max_output_tokens < 1:
+            raise ValueError(
+                f"max_output_tokens 必須大於 0，目前值：{max_output_tokens}"
+            )
+        # 建構請求資料
+        return {
             "model": model,
             "config": types.GenerateContentConfig(
-                system_instruction=system_instruction, temperature=temperature
+                system_instruction=system_instruction,
+                temperature=temperature,
+                max_output_tokens=max_output_tokens,
             ),
             "contents": content,
         }
 
+    def generate_content(
+        self,
+        model: str | None = None,
+        system_instruction: str | None = None,
+        content: str | None = None,
+        temperature: float | None = None,
+        max_output_tokens: int | None = None,
+    ) -> str | None:
+        """
+        生成內容（同步）
+
+        注意：此方法會阻塞呼叫端執行緒，請勿在事件迴圈中直接呼叫，
+        非同步環境請改用 `generate_content_async`。
+
+        Args:
+            model: 要使用的模型名稱
+            system_instruction: 系統指令
+            content: 使用者輸入內容
+            temperature: 溫度參數（控制創造性），範圍 0.0-2.0
+            max_output_tokens: 最大輸出令牌數量
+
+        Returns:
+            生成的文字內容
+
+        Raises:
+            ValueError: 當參數無效時
+            Exception: 當 API 請求失敗時
+        """
+        request_data = self._build_request(
+            model, system_instruction, content, temperature, max_output_tokens
+        )
+
         return self.client.models.generate_content(
             model=request_data["model"],
             contents=request_data["contents"],
             config=request_data["config"],
         ).text
 
+    async def generate_content_async(
+        self,
+        model: str | None = None,
+        system_instruction: str | None = None,
+        content: str | None = None,
+        temperature: float | None = None,
+        max_output_tokens: int | None = None,
+    ) -> str | None:
+        """
+        生成內容（非同步）
+
+        使用 SDK 的非同步客戶端 (`client.aio`)，等待上游回應時不會阻塞事件迴圈，
+        單一 worker 可同時處理大量進行中的請求。
+
+        Args:
+            model: 要使用的模型名稱
+            system_instruction: 系統指令
+            content: 使用者輸入內容
+            temperature: 溫度參數（控制創造性），範圍 0.0-2.0
+            max_output_tokens: 最大輸出令牌數量
+
+        Returns:
+            生成的文字內容
+
+        Raises:
+            ValueError: 當參數無效時
+            GeminiUnavailableError: 重試用盡、配額不足或斷路器開啟時
+            Exception: 當 API 請求失敗時
+        """
+        text, _ = await self.generate_content_with_usage_async(
+            model=model,
+            system_instruction=system_instruction,
+            content=content,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+        )
+        return text
+
+    async def generate_content_with_usage_async(
+        self,
+        model: str | None = None,
+        system_instruction: str | None = None,
+        content: str | None = None,
+        temperature: float | None = None,
+        max_output_tokens: int | None = None,
+    ) -> tuple[str | None, GenerationUsage]:
+        """
+        生成內容並回傳 token 用量與上游延遲（非同步）
+
+        參數與例外同 `generate_content_async`。延遲只計算實際採用的那次上游呼叫，
+        不含排隊等待併發名額與重試前的退避時間。
+
+        Returns:
+            (生成的文字內容, 用量)
+        """
+        request_data = self._build_request(
+            model, system_instruction, content, temperature, max_output_tokens
+        )
+        fallback_config = request_data["config"]
+        async with self._in_use():
+            cached_content = await self._use_context_cache(request_data)
+
+            async def send():
+                async with self._slot(request_data["model"]):
+                    started = time.monotonic()
+                    response = await self.client.aio.models.generate_content(
+                        model=request_data["model"],
+                        contents=request_data["contents"],
+                        config=request_data["config"],
+                    )
+                    return response, int((time.monotonic() - started) * 1000)
+
+            async def attempt():
+                # 每次嘗試（含重試）都可能發出對沖請求
+                if self.hedger is None:
+                    return await send()
+                return await self.hedger.run(request_data["model"], send)
+
+            async def call():
+                if self.resilience is None:
+                    return await attempt()
+                return await self.resilience.call(request_data["model"], attempt)
+
+            try:
+                response, latency_ms = await call()
+            except errors.APIError as e:
+                # 快取已過期或被刪除時，捨棄快取並改以完整系統指令重送一次
+                if cached_content is None or e.code not in (403, 404):
+                    raise
+                self.context_cache.discard(cached_content)
+                request_data["config"] = fallback_config
+                response, latency_ms = await call()
+
+            usage = GenerationUsage()
+            usage.update(response.usage_metadata, latency_ms)
+            if self.context_cache is not None:
+                self.context_cache.record_savings(usage.cached_tokens)
+            return response.text, usage
+
+    async def generate_content_stream_async(
+        self,
+        model: str | None = None,
+        system_instruction: str | None = None,
+        content: str | None = None,
+        temperature: float | None = None,
+        max_output_tokens: int | None = None,
+        usage: GenerationUsage | None = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        以串流方式生成內容（非同步）
+
+        上游每產生一段文字即 yield 一次。提前關閉此產生器（`aclose()`）
+        會同時關閉上游串流，停止後續的 token 生成。
+
+        Args:
+            model: 要使用的模型名稱
+            system_instruction: 系統指令
+            content: 使用者輸入內容
+            temperature: 溫度參數（控制創造性），範圍 0.0-2.0
+            max_output_tokens: 最大輸出令牌數量
+            usage: 串流結束後填入 token 用量與上游延遲，可選
+
+        Yields:
+            生成的文字片段
+
+        Raises:
+            ValueError: 當參數無效時
+            Exception: 當 API 請求失敗時
+        """
+        request_data = self._build_request(
+            model, system_instruction, content, temperature, max_output_tokens
+        )
+
+        async with self._in_use():
+            cached_content = await self._use_context_cache(request_data)
+
+            # 串流在送出第一段後無法安全重試，因此只套用斷路器
+            breaker = (
+                self.resilience.breaker(request_data["model"])
+                if self.resilience
+                else None
+            )
+            if breaker is not None:
+                breaker.before_call()
+
+            outcome: BaseException | None = None
+            stream = None
+            try:
+                # 串流期間持續佔用一個併發名額
+                async with self._slot(request_data["model"]):
+                    started = time.monotonic()
+                    stream = await self.client.aio.models.generate_content_stream(
+                        model=request_data["model"],
+                        contents=request_data["contents"],
+                        config=request_data["config"],
+                    )
+                    async for chunk in stream:
+                        # 每個片段都帶有累計用量，最後一個片段即為總用量
+                        if usage is not None:
+                            usage.update(
+                                chunk.usage_metadata,
+                                int((time.monotonic() - started) * 1000),
+                            )
+                        if chunk.text:
+                            yield chunk.text
+            except BaseException as e:
+                outcome = e
+                # 快取失效時捨棄，下一次請求會重新建立
+                if (
+                    cached_content is not None
+                    and isinstance(e, errors.APIError)
+                    and e.code in (403, 404)
+                ):
+                    self.context_cache.discard(cached_content)
+                raise
+            finally:
+                if breaker is not None:
+                    breaker.record(outcome)
+                if usage is not None and self.context_cache is not None:
+                    self.context_cache.record_savings(usage.cached_tokens)
+                if stream is not None:
+                    await stream.aclose()
+
     def health_check(self) -> bool:
         """檢查 API 連接狀態
 
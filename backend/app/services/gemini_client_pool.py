@@ -0,0 +1,247 @@
+"""
+Gemini 客戶端連線池
+"""
+
+import asyncio
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+import time
+
+from google.genai import types
+import httpx
+
+from app.config import settings
+from app.services.gemini_client import CLOSE_ERRORS, GeminiClient
+from app.services.gemini_context_cache import GeminiContextCache
+from app.services.gemini_hedging import RequestHedger
+from app.services.gemini_limiter import ModelConcurrencyLimiter
+from app.services.gemini_resilience import GeminiResilience
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiClientPool:
+    """以 API 金鑰雜湊為鍵的 GeminiClient LRU 連線池
+
+    重複使用同一把金鑰的請求會共用同一個 GeminiClient，
+    其底層 HTTP 連線池（keep-alive）得以保留，省去每次的 TCP + TLS 交握。
+
+    - 鍵值為 API 金鑰的 SHA-256 雜湊，不保存原始金鑰作為鍵
+    - 超過容量時淘汰最久未使用的客戶端
+    - 閒置超過 idle_ttl 秒的客戶端會在下次存取時被淘汰
+    - 淘汰的客戶端於進行中的請求結束後關閉同步與非同步連線池
+    """
+
+    def __init__(
+        self,
+        max_size: int = 128,
+        idle_ttl: float = 600.0,
+        http_options: types.HttpOptions | None = None,
+        resilience: GeminiResilience | None = None,
+        limiter: ModelConcurrencyLimiter | None = None,
+        hedger: RequestHedger | None = None,
+        context_cache: GeminiContextCache | None = None,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size 必須大於 0")
+
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.http_options = http_options
+        self.resilience = resilience
+        self.limiter = limiter
+        self.hedger = hedger
+        self.context_cache = context_cache
+        self._clients: OrderedDict[str, tuple[GeminiClient, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        # 背景關閉中的客戶端（保留參考，避免 task 被 GC）
+        self._retiring: set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def get(self, api_key: str) -> GeminiClient:
+        """取得（或建立）對應 API 金鑰的 GeminiClient"""
+        if not api_key:
+            raise ValueError("API 密鑰不能為空")
+
+        key = self._key(api_key)
+        now = time.monotonic()
+        evicted: list[GeminiClient] = []
+
+        with self._lock:
+            evicted.extend(self._pop_idle(now))
+
+            entry = self._clients.get(key)
+            if entry is not None:
+                self.hits += 1
+                client = entry[0]
+                self._clients.move_to_end(key)
+            else:
+                self.misses += 1
+                client = GeminiClient(
+                    api_key,
+                    http_options=self.http_options,
+                    resilience=self.resilience,
+                    limiter=self.limiter,
+                    hedger=self.hedger,
+                    context_cache=self.context_cache,
+                )
+                while len(self._clients) >= self.max_size:
+                    _, (old_client, _) = self._clients.popitem(last=False)
+                    evicted.append(old_client)
+                    self.evictions += 1
+            self._clients[key] = (client, now)
+
+        for old_client in evicted:
+            self._retire(old_client)
+
+        return client
+
+    def evict_idle(self) -> int:
+        """淘汰所有閒置逾時的客戶端，回傳淘汰數量"""
+        with self._lock:
+            evicted = self._pop_idle(time.monotonic())
+        for client in evicted:
+            self._retire(client)
+        return len(evicted)
+
+    def _pop_idle(self, now: float) -> list[GeminiClient]:
+        """移除閒置逾時的客戶端（呼叫端需持有鎖）"""
+        evicted: list[GeminiClient] = []
+        # OrderedDict 依最後使用時間排序，最舊的在最前面
+        while self._clients:
+            key, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            del self._clients[key]
+            evicted.append(client)
+            self.evictions += 1
+        return evicted
+
+    def _retire(self, client: GeminiClient) -> None:
+        """關閉被淘汰的客戶端
+
+        非同步連線池需在事件迴圈中關閉：有執行中的事件迴圈時於背景退役
+        （進行中的請求結束後才關閉）；否則只能關閉同步連線池，其餘交給 GC。
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            try:
+                client.close()
+            except CLOSE_ERRORS as e:
+                logger.warning("關閉 Gemini 客戶端失敗: %s", e)
+            return
+        task = loop.create_task(client.retire())
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    async def aclose(self) -> None:
+        """關閉並清空所有客戶端（應用程式關閉時呼叫）"""
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        if self._retiring:
+            await asyncio.gather(*self._retiring)
+        for client in clients:
+            try:
+                await client.aclose()
+            except CLOSE_ERRORS as e:
+                logger.warning("關閉 Gemini 客戶端失敗: %s", e)
+
+    def stats(self) -> dict:
+        """回傳連線池統計資訊"""
+        with self._lock:
+            size = len(self._clients)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def _keepalive_http_options() -> types.HttpOptions:
+    """建立啟用 keep-alive 連線重用的 HTTP 設定"""
+    limits = httpx.Limits(
+        max_connections=settings.gemini_max_connections,
+        max_keepalive_connections=settings.gemini_max_keepalive_connections,
+        keepalive_expiry=settings.gemini_keepalive_expiry_seconds,
+    )
+    return types.HttpOptions(
+        client_args={"limits": limits},
+        async_client_args={"limits": limits},
+    )
+
+
+# 建立全域重試與斷路器實例（斷路器狀態以模型為單位，跨 API 金鑰共用）
+gemini_resilience = GeminiResilience(
+    max_attempts=settings.gemini_retry_max_attempts,
+    base_delay=settings.gemini_retry_base_delay_seconds,
+    max_delay=settings.gemini_retry_max_delay_seconds,
+    max_retry_after=settings.gemini_retry_max_retry_after_seconds,
+    failure_threshold=settings.gemini_breaker_failure_threshold,
+    recovery_timeout=settings.gemini_breaker_recovery_seconds,
+    max_attempts_per_model=settings.gemini_retry_max_attempts_per_model,
+)
+
+# 建立全域併發限制器實例（以模型為單位，跨 API 金鑰共用）
+gemini_limiter = ModelConcurrencyLimiter(
+    default_limit=settings.gemini_concurrency_default_limit,
+    limits=settings.gemini_concurrency_limits,
+    min_limit=settings.gemini_concurrency_min_limit,
+    max_queue=settings.gemini_concurrency_max_queue,
+)
+
+# 建立全域請求對沖實例（未啟用時為 None）
+gemini_hedger = (
+    RequestHedger(
+        percentile=settings.gemini_hedge_percentile,
+        min_samples=settings.gemini_hedge_min_samples,
+        min_delay=settings.gemini_hedge_min_delay_seconds,
+        max_hedge_ratio=settings.gemini_hedge_max_ratio,
+    )
+    if settings.gemini_hedge_enabled
+    else None
+)
+
+# 建立全域上下文快取實例
+gemini_context_cache = GeminiContextCache(
+    enabled=settings.gemini_context_cache_enabled,
+    ttl_seconds=settings.gemini_context_cache_ttl_seconds,
+    refresh_margin=settings.gemini_context_cache_refresh_seconds,
+    min_tokens=settings.gemini_context_cache_min_tokens,
+)
+
+# 建立全域連線池實例
+gemini_client_pool = GeminiClientPool(
+    max_size=settings.gemini_client_pool_size,
+    idle_ttl=settings.gemini_client_idle_seconds,
+    http_options=_keepalive_http_options(),
+    resilience=gemini_resilience,
+    limiter=gemini_limiter,
+    hedger=gemini_hedger,
+    context_cache=gemini_context_cache,
+)
+
+
+def get_gemini_client(api_key: str) -> GeminiClient:
+    """從全域連線池取得 Gemini API 客戶端
+
+    Args:
+        api_key: API 密鑰
+
+    Returns:
+        GeminiClient: 可重複使用的 Gemini 客戶端實例
+    """
+    return gemini_client_pool.get(api_key)
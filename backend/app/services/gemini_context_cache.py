@@ -0,0 +1,265 @@
+"""
+Gemini 上下文快取（cached content）模組
+"""
+
+import asyncio
+from dataclasses import dataclass
+import hashlib
+import logging
+import time
+from typing import TYPE_CHECKING
+import weakref
+
+from google.genai import errors, types
+
+from app.services.token_budget import estimate_tokens
+
+if TYPE_CHECKING:
+    from app.services.gemini_client import GeminiClient
+
+logger = logging.getLogger(__name__)
+
+
+def _content_hash(system_instruction: str) -> str:
+    """計算系統指令（模板內容）的雜湊"""
+    return hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _CachedHandle:
+    """已建立的上游快取內容
+
+    只以弱參照保存建立快取的客戶端，避免連線池淘汰後的客戶端被快取留住；
+    客戶端已回收或已被淘汰時不再使用（淘汰的客戶端會重新建立未關閉的連線），
+    無法主動刪除的上游快取交由 TTL 到期自動清除。
+    """
+
+    name: str
+    expires_at: float
+    client: "weakref.ref[GeminiClient]"
+    content_hash: str
+
+
+class GeminiContextCache:
+    """以上游 cached content 重複使用模板系統指令
+
+    模板內容通常佔輸入 token 的大部分；建立快取後，後續請求只需傳送快取名稱，
+    命中部分的 token 以較低費率計費。
+
+    - 以 (API 金鑰雜湊, 模型, 模板內容雜湊) 為鍵，內容變更時自然對應到新的快取
+    - 剩餘時間少於 refresh_margin 時延長 TTL，延長失敗則重新建立
+    - 模板更新時以 invalidate 刪除舊內容的快取
+    - 模板估算 token 數低於 min_tokens 時不建立（上游有最小 token 數限制）
+    - 建立失敗的鍵在 failure_ttl 秒內不再嘗試，直接改用一般請求
+    - 快取資訊保存在各 worker 的記憶體中，到期的快取、失敗記錄與閒置的鎖會被清除
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        ttl_seconds: int = 3600,
+        refresh_margin: float = 300.0,
+        min_tokens: int = 1024,
+        failure_ttl: float = 600.0,
+    ):
+        """初始化上下文快取
+
+        Args:
+            enabled: 是否啟用
+            ttl_seconds: 上游快取的存活時間（秒）
+            refresh_margin: 剩餘時間少於此秒數時延長 TTL
+            min_tokens: 模板估算 token 數的最小值，低於此值不建立快取
+            failure_ttl: 建立失敗後暫停嘗試的秒數
+        """
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self.failure_ttl = failure_ttl
+        self._handles: dict[tuple[str, str, str], _CachedHandle] = {}
+        self._locks: dict[tuple[str, str, str], asyncio.Lock] = {}
+        self._failed_until: dict[tuple[str, str, str], float] = {}
+        self.hits = 0
+        self.created = 0
+        self.refreshed = 0
+        self.invalidated = 0
+        self.failures = 0
+        self.tokens_saved = 0
+
+    @staticmethod
+    def _key(
+        client: "GeminiClient", model: str, system_instruction: str
+    ) -> tuple[str, str, str]:
+        api_key_hash = hashlib.sha256(client.api_key.encode("utf-8")).hexdigest()
+        return api_key_hash, model, _content_hash(system_instruction)
+
+    async def get_handle(
+        self, client: "GeminiClient", model: str, system_instruction: str
+    ) -> str | None:
+        """取得可用的快取名稱，無法使用快取時回傳 None"""
+        if not self.enabled or estimate_tokens(system_instruction) < self.min_tokens:
+            return None
+
+        key = self._key(client, model, system_instruction)
+        handle = self._handles.get(key)
+        if handle is not None and handle.expires_at - time.time() > self.refresh_margin:
+            self.hits += 1
+            return handle.name
+        self._prune(time.time())
+        if self._failed_until.get(key, 0.0) > time.time():
+            return None
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # 等待鎖期間其他請求可能已建立或延長
+            handle = self._handles.get(key)
+            now = time.time()
+            if handle is not None and handle.expires_at - now > self.refresh_margin:
+                self.hits += 1
+                return handle.name
+            if (
+                handle is not None
+                and handle.expires_at > now
+                and await self._extend(handle, client)
+            ):
+                self.hits += 1
+                return handle.name
+            return await self._create(key, client, model, system_instruction)
+
+    def _prune(self, now: float) -> None:
+        """移除已到期的快取、已過期的失敗記錄，以及不再對應任何快取的閒置鎖"""
+        for key, handle in list(self._handles.items()):
+            if handle.expires_at <= now:
+                del self._handles[key]
+        for key, until in list(self._failed_until.items()):
+            if until <= now:
+                del self._failed_until[key]
+        for key, lock in list(self._locks.items()):
+            if key not in self._handles and not lock.locked():
+                del self._locks[key]
+
+    async def _extend(self, handle: _CachedHandle, client: "GeminiClient") -> bool:
+        """以目前請求的客戶端延長快取 TTL，回傳是否成功"""
+        if client.is_retired:
+            return False
+        try:
+            async with client._in_use():
+                updated = await client.client.aio.caches.update(
+                    name=handle.name,
+                    config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+                )
+        except (errors.APIError, OSError) as e:
+            logger.warning("延長上下文快取失敗，改為重新建立: %s", str(e))
+            return False
+        handle.expires_at = self._expires_at(updated)
+        handle.client = weakref.ref(client)
+        self.refreshed += 1
+        return True
+
+    async def _create(
+        self,
+        key: tuple[str, str, str],
+        client: "GeminiClient",
+        model: str,
+        system_instruction: str,
+    ) -> str | None:
+        """建立新的上游快取"""
+        if client.is_retired:
+            return None
+        try:
+            async with client._in_use():
+                cached = await client.client.aio.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=system_instruction,
+                        ttl=f"{self.ttl_seconds}s",
+                    ),
+                )
+        except (errors.APIError, OSError) as e:
+            self.failures += 1
+            self._failed_until[key] = time.time() + self.failure_ttl
+            self._handles.pop(key, None)
+            logger.warning("建立上下文快取失敗，改用一般請求: %s", str(e))
+            return None
+
+        self._handles[key] = _CachedHandle(
+            name=cached.name,
+            expires_at=self._expires_at(cached),
+            client=weakref.ref(client),
+            content_hash=key[2],
+        )
+        self.created += 1
+        return cached.name
+
+    def _expires_at(self, cached: types.CachedContent) -> float:
+        """取得快取到期時間（上游未回傳時以 TTL 推算）"""
+        if cached.expire_time is not None:
+            return cached.expire_time.timestamp()
+        return time.time() + self.ttl_seconds
+
+    def discard(self, name: str) -> None:
+        """移除已失效的快取名稱（例如上游回傳找不到快取）"""
+        for key, handle in list(self._handles.items()):
+            if handle.name == name:
+                self._handles.pop(key, None)
+
+    def record_savings(self, cached_tokens: int | None) -> None:
+        """累計因命中快取而以較低費率計費的輸入 token 數"""
+        if cached_tokens:
+            self.tokens_saved += cached_tokens
+
+    async def invalidate(self, system_instruction: str) -> int:
+        """刪除指定模板內容的所有快取（模板更新或刪除時呼叫），回傳刪除數量"""
+        content_hash = _content_hash(system_instruction)
+        stale = [
+            self._handles.pop(key)
+            for key, handle in list(self._handles.items())
+            if handle.content_hash == content_hash
+        ]
+        self.invalidated += len(stale)
+        await self._delete_upstream(stale)
+        return len(stale)
+
+    async def aclose(self) -> None:
+        """刪除所有上游快取，避免持續產生儲存費用"""
+        handles = list(self._handles.values())
+        self._handles.clear()
+        await self._delete_upstream(handles)
+
+    @staticmethod
+    async def _delete_upstream(handles: list[_CachedHandle]) -> None:
+        """盡力刪除上游快取
+
+        客戶端已回收、已被淘汰或刪除失敗時交由 TTL 到期自動清除。
+        """
+
+        async def delete(client: "GeminiClient", name: str) -> None:
+            async with client._in_use():
+                await client.client.aio.caches.delete(name=name)
+
+        clients = [(handle, handle.client()) for handle in handles]
+        results = await asyncio.gather(
+            *(
+                delete(client, handle.name)
+                for handle, client in clients
+                if client is not None and not client.is_retired
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("刪除上下文快取失敗: %s", str(result))
+
+    def stats(self) -> dict:
+        """回傳快取統計"""
+        return {
+            "enabled": self.enabled,
+            "handles": len(self._handles),
+            "locks": len(self._locks),
+            "hits": self.hits,
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "invalidated": self.invalidated,
+            "failures": self.failures,
+            "tokens_saved": self.tokens_saved,
+        }
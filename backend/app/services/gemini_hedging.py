@@ -0,0 +1,146 @@
+"""
+Gemini 請求對沖（hedged requests）模組
+"""
+
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable
+import time
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """記錄最近 N 次成功呼叫延遲的滑動視窗"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def percentile(self, p: float) -> float | None:
+        """回傳第 p 百分位（0-1）的延遲，沒有樣本時回傳 None"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(p * len(ordered)), len(ordered) - 1)
+        return ordered[index]
+
+
+class RequestHedger:
+    """對沖請求以降低尾端延遲
+
+    呼叫超過該模型近期延遲的指定百分位仍未回應時，發出第二個相同請求，
+    採用先完成者的結果並取消另一個。
+
+    - 樣本數不足 min_samples 時不對沖
+    - 對沖比例超過 max_hedge_ratio 時不再對沖，避免上游整體變慢時放大負載
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        min_delay: float = 0.05,
+        max_hedge_ratio: float = 0.1,
+        window: int = 200,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.window = window
+        self._trackers: dict[str, LatencyTracker] = {}
+        self._counters: dict[str, dict[str, int]] = {}
+
+    def _tracker(self, model: str) -> LatencyTracker:
+        if model not in self._trackers:
+            self._trackers[model] = LatencyTracker(self.window)
+            self._counters[model] = {"requests": 0, "hedges_fired": 0, "hedges_won": 0}
+        return self._trackers[model]
+
+    def hedge_delay(self, model: str) -> float | None:
+        """回傳目前的對沖延遲，不應對沖時回傳 None"""
+        tracker = self._tracker(model)
+        if len(tracker) < self.min_samples:
+            return None
+        counters = self._counters[model]
+        if counters["hedges_fired"] >= self.max_hedge_ratio * max(
+            counters["requests"], 1
+        ):
+            return None
+        delay = tracker.percentile(self.percentile)
+        return max(delay, self.min_delay) if delay is not None else None
+
+    async def run(self, model: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """執行 fn，必要時發出對沖請求"""
+        tracker = self._tracker(model)
+        counters = self._counters[model]
+        counters["requests"] += 1
+        delay = self.hedge_delay(model)
+
+        started = time.monotonic()
+        primary = asyncio.ensure_future(fn())
+        if delay is None:
+            result = await primary
+            tracker.record(time.monotonic() - started)
+            return result
+
+        hedge: asyncio.Future | None = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                result = primary.result()
+                tracker.record(time.monotonic() - started)
+                return result
+
+            counters["hedges_fired"] += 1
+            hedge = asyncio.ensure_future(fn())
+            pending = {primary, hedge}
+            first_error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    # 請求在內部被取消時 exception() 會拋出 CancelledError
+                    if task.cancelled():
+                        continue
+                    if task.exception() is not None:
+                        first_error = first_error or task.exception()
+                        continue
+                    if task is hedge:
+                        counters["hedges_won"] += 1
+                    tracker.record(time.monotonic() - started)
+                    return task.result()
+            if first_error is None:
+                raise RuntimeError("對沖的請求皆已被取消")
+            raise first_error
+        finally:
+            # 取消仍在進行的請求（對沖落敗者，或呼叫端被取消時的全部請求），
+            # 並等待其結束，讓併發限制與連線的釋放在回傳前完成
+            tasks = [task for task in (primary, hedge) if task is not None]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """回傳每個模型的延遲百分位與對沖統計"""
+        result = {}
+        for model, tracker in self._trackers.items():
+            percentiles = {
+                f"p{int(p * 100)}_seconds": tracker.percentile(p)
+                for p in (0.5, 0.95, 0.99)
+            }
+            result[model] = {
+                **self._counters[model],
+                "samples": len(tracker),
+                **percentiles,
+                "hedge_delay_seconds": self.hedge_delay(model),
+            }
+        return result
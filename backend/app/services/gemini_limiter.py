@@ -0,0 +1,165 @@
+"""
+Gemini 模型併發限制與自適應節流模組
+"""
+
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from google.genai import errors
+
+from app.services.gemini_resilience import GeminiUnavailableError
+
+
+class LoadShedError(GeminiUnavailableError):
+    """等待佇列過長，請求被直接拒絕（回傳 429 + Retry-After）"""
+
+
+class AdaptiveLimiter:
+    """單一模型的 AIMD 自適應併發限制器
+
+    - 同時進行的呼叫數不超過目前的 limit
+    - 每次成功：limit += 1 / limit（約每一輪 limit 次成功加 1），上限 max_limit
+    - 遇到 429：limit *= decrease_factor，下限 min_limit
+    - 等待中的請求超過 max_queue 時直接拒絕（LoadShedError）
+    """
+
+    def __init__(
+        self,
+        max_limit: int = 16,
+        min_limit: int = 1,
+        max_queue: int = 100,
+        decrease_factor: float = 0.5,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.max_queue = max_queue
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.shed = 0
+        self.throttled = 0
+        self.avg_latency = 1.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _capacity(self) -> int:
+        return max(int(self.limit), self.min_limit)
+
+    def estimated_wait(self) -> float:
+        """以平均延遲估算排隊中的請求需要等待的秒數"""
+        return self.avg_latency * (self.queued + 1) / self._capacity()
+
+    async def acquire(self) -> None:
+        """取得一個呼叫名額
+
+        Raises:
+            LoadShedError: 等待佇列已滿時
+        """
+        if self.in_flight < self._capacity() and not self._waiters:
+            self.in_flight += 1
+            return
+
+        if self.queued >= self.max_queue:
+            self.shed += 1
+            raise LoadShedError(
+                "模型請求量過大，請稍後再試",
+                status_code=429,
+                retry_after=max(self.estimated_wait(), 1.0),
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 已取得名額但呼叫端被取消，歸還名額
+                self._release_slot()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, error: BaseException | None, latency: float) -> None:
+        """歸還名額並依結果調整 limit"""
+        if error is None:
+            self.limit = min(self.limit + 1 / self.limit, float(self.max_limit))
+            self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency
+        elif isinstance(error, errors.APIError) and error.code == 429:
+            self.throttled += 1
+            self.limit = max(self.limit * self.decrease_factor, float(self.min_limit))
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < self._capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "shed": self.shed,
+            "throttled": self.throttled,
+            "avg_latency_seconds": round(self.avg_latency, 3),
+        }
+
+
+class ModelConcurrencyLimiter:
+    """依模型分開管理的併發限制器
+
+    每個模型的上限可個別設定（例如 pro 較低、flash-lite 較高），
+    避免單一模型的突發流量耗盡配額而影響其他模型。
+    """
+
+    def __init__(
+        self,
+        default_limit: int = 16,
+        limits: dict[str, int] | None = None,
+        min_limit: int = 1,
+        max_queue: int = 100,
+    ):
+        self.default_limit = default_limit
+        self.limits = limits or {}
+        self.min_limit = min_limit
+        self.max_queue = max_queue
+        self._limiters: dict[str, AdaptiveLimiter] = {}
+
+    def limiter(self, model: str) -> AdaptiveLimiter:
+        """取得模型的限制器"""
+        if model not in self._limiters:
+            self._limiters[model] = AdaptiveLimiter(
+                max_limit=self.limits.get(model, self.default_limit),
+                min_limit=self.min_limit,
+                max_queue=self.max_queue,
+            )
+        return self._limiters[model]
+
+    @asynccontextmanager
+    async def slot(self, model: str) -> AsyncIterator[None]:
+        """在名額內執行一次上游呼叫，結束時依結果調整 limit"""
+        limiter = self.limiter(model)
+        await limiter.acquire()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        error: BaseException | None = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            limiter.release(error, loop.time() - started)
+
+    def stats(self) -> dict:
+        """回傳每個模型的限制與排隊狀態"""
+        return {model: limiter.stats() for model, limiter in self._limiters.items()}
@@ -0,0 +1,278 @@
+"""
+Gemini API 重試、退避與斷路器模組
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import re
+import threading
+import time
+from typing import TypeVar
+
+from google.genai import errors
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class GeminiUnavailableError(RuntimeError):
+    """上游暫時無法使用（重試用盡、配額不足或斷路器開啟）
+
+    Attributes:
+        status_code: 建議回傳給用戶端的 HTTP 狀態碼（429 或 503）
+        retry_after: 建議用戶端等待的秒數，未知時為 None
+    """
+
+    def __init__(
+        self, message: str, status_code: int = 503, retry_after: float | None = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(GeminiUnavailableError):
+    """斷路器開啟中，請求被快速拒絕"""
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """解析 Retry-After 標頭（秒數或 HTTP 日期）"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(UTC)).total_seconds(), 0.0)
+
+
+def _retry_delay_from_details(details) -> float | None:
+    """解析 Gemini 錯誤內容中的 RetryInfo.retryDelay（例如 "30s"）"""
+    if not isinstance(details, dict):
+        return None
+    error = details.get("error", details)
+    for item in error.get("details") or []:
+        delay = item.get("retryDelay") if isinstance(item, dict) else None
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)s", delay or "")
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def classify_error(error: BaseException) -> tuple[bool, int | None, float | None]:
+    """分類上游錯誤
+
+    Returns:
+        (是否可重試, HTTP 狀態碼（網路錯誤時為 None）, 建議等待秒數)
+    """
+    if isinstance(error, errors.APIError):
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        retry_after = _parse_retry_after(headers.get("Retry-After"))
+        if retry_after is None:
+            retry_after = _retry_delay_from_details(error.details)
+        return error.code in RETRYABLE_STATUS_CODES, error.code, retry_after
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+        return True, None, None
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True, None, None
+    return False, None, None
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """判斷錯誤是否代表上游異常（5xx 或網路錯誤）"""
+    if not isinstance(error, Exception):
+        return False
+    retryable, status_code, _ = classify_error(error)
+    return retryable and (status_code is None or status_code >= 500)
+
+
+class CircuitBreaker:
+    """單一模型的斷路器
+
+    - closed：正常放行，連續失敗達 failure_threshold 次時轉為 open
+    - open：快速拒絕，經過 recovery_timeout 秒後轉為 half_open
+    - half_open：只放行一個探測請求，成功則 closed，失敗則重新 open
+
+    只有上游 5xx 與網路錯誤視為失敗；429 通常是單一 API 金鑰的配額問題，
+    不代表模型本身異常，因此不計入。
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        """距離可再次嘗試的秒數"""
+        return max(self._opened_at + self.recovery_timeout - time.monotonic(), 0.0)
+
+    def before_call(self) -> None:
+        """呼叫前檢查，斷路器開啟時拋出 CircuitOpenError"""
+        with self._lock:
+            if self.state == "open" and self.retry_after() <= 0:
+                self.state = "half_open"
+            if self.state == "closed":
+                return
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected += 1
+            retry_after = self.retry_after() or 1.0
+        raise CircuitOpenError(
+            "模型暫時無法使用，請稍後再試", status_code=503, retry_after=retry_after
+        )
+
+    def record(self, error: BaseException | None) -> None:
+        """記錄呼叫結果（error 為 None 表示成功）"""
+        with self._lock:
+            self._probe_in_flight = False
+            if error is None or not is_upstream_failure(error):
+                # 成功或上游有明確回應（例如 4xx）代表模型可正常處理請求；
+                # 取消等非 Exception 的中斷只釋放探測名額，不改變狀態
+                if error is None or isinstance(error, errors.APIError):
+                    self.state = "closed"
+                    self.consecutive_failures = 0
+                return
+
+            self.consecutive_failures += 1
+            if (
+                self.state == "half_open"
+                or self.consecutive_failures >= self.failure_threshold
+            ):
+                if self.state != "open":
+                    self.opened_count += 1
+                    logger.warning(
+                        "斷路器開啟，連續失敗 %d 次", self.consecutive_failures
+                    )
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_count": self.opened_count,
+            "rejected": self.rejected,
+        }
+
+
+class GeminiResilience:
+    """Gemini 呼叫的彈性處理層
+
+    - 依模型設定的最大嘗試次數，以帶抖動的指數退避重試可重試錯誤
+    - 上游回傳 Retry-After（或 RetryInfo）時依其等待；
+      等待時間超過 max_retry_after 時不重試，直接將建議等待時間回傳給用戶端
+    - 每個模型有獨立的斷路器
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        max_retry_after: float = 30.0,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        max_attempts_per_model: dict[str, int] | None = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_attempts_per_model = max_attempts_per_model or {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._counters: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        """取得模型的斷路器"""
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(
+                    self.failure_threshold, self.recovery_timeout
+                )
+                self._counters[model] = {"calls": 0, "retries": 0, "failures": 0}
+            return self._breakers[model]
+
+    def _count(self, model: str, name: str) -> None:
+        with self._lock:
+            self._counters[model][name] += 1
+
+    def backoff_delay(self, attempt: int) -> float:
+        """第 attempt 次重試前的等待秒數（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def call(self, model: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """以重試與斷路器保護執行上游呼叫"""
+        breaker = self.breaker(model)
+        max_attempts = self.max_attempts_per_model.get(model, self.max_attempts)
+        self._count(model, "calls")
+
+        for attempt in range(max_attempts):
+            breaker.before_call()
+            try:
+                result = await fn()
+            except BaseException as e:
+                breaker.record(e)
+                if not isinstance(e, Exception):
+                    raise
+                retryable, status_code, retry_after = classify_error(e)
+                if not retryable:
+                    raise
+                if attempt + 1 >= max_attempts or (
+                    retry_after is not None and retry_after > self.max_retry_after
+                ):
+                    self._count(model, "failures")
+                    raise GeminiUnavailableError(
+                        f"Gemini API 暫時無法使用: {e}",
+                        status_code=429 if status_code == 429 else 503,
+                        retry_after=retry_after,
+                    ) from e
+
+                delay = self.backoff_delay(attempt)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                self._count(model, "retries")
+                logger.info(
+                    "Gemini 呼叫失敗（%s），%.2f 秒後第 %d 次重試",
+                    status_code or type(e).__name__,
+                    delay,
+                    attempt + 1,
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            breaker.record(None)
+            return result
+
+        raise AssertionError("unreachable")
+
+    def stats(self) -> dict:
+        """回傳每個模型的重試次數與斷路器狀態"""
+        with self._lock:
+            models = list(self._breakers)
+        return {
+            model: {**self._counters[model], **self._breakers[model].stats()}
+            for model in models
+        }
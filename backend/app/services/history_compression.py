@@ -0,0 +1,272 @@
+"""
+歷史記錄內容壓縮模組
+"""
+
+from collections import Counter
+from collections.abc import Iterable
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+from sqlalchemy import Connection, Engine, desc, event, insert, select
+
+from app.config import settings
+from app.models import HistoryDictionary, PromptBlob
+
+logger = logging.getLogger(__name__)
+
+# 壓縮內容格式：版本（1 byte）+ 字典 ID（4 bytes，0 表示未使用字典）+ raw deflate
+_FORMAT_VERSION = 1
+_HEADER_SIZE = 5
+_NO_DICTIONARY = 0
+
+# zlib 預設字典只會使用最後 32KB
+MAX_DICTIONARY_SIZE = 32 * 1024
+# 少於此數量的樣本不訓練字典
+MIN_TRAINING_SAMPLES = 20
+
+
+def train_dictionary(samples: Iterable[str], size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """以樣本中重複出現的行建立 zlib 預設字典
+
+    模板產生的內容常有固定的標題與句型；只取在兩個以上樣本中出現的行，
+    出現次數越多的越靠近字典結尾（距離越近，引用的編碼越短）。
+    """
+    counts: Counter[str] = Counter()
+    for sample in samples:
+        counts.update(
+            {line.strip() for line in sample.splitlines() if len(line.strip()) >= 4}
+        )
+
+    chosen: list[bytes] = []
+    total = 0
+    for line, count in counts.most_common():
+        if count < 2:
+            break
+        data = (line + "\n").encode()
+        if total + len(data) > size:
+            continue
+        chosen.append(data)
+        total += len(data)
+    return b"".join(reversed(chosen))
+
+
+class HistoryCompressor:
+    """歷史記錄內容的 zlib 壓縮（可搭配共用的預設字典）
+
+    - 內容達 min_bytes 才壓縮，且壓縮後較小時才採用
+    - 壓縮對象為 prompt_blobs 中去重後的內容（見 prompt_blobs 模組）
+    - 只在需要完整內容時（詳細內容、匯出、搜尋結果）才解壓縮
+    - SQLite 連線會註冊 `history_text(text, blob)` 函式，只供應用程式的查詢
+      （例如搜尋短詞的 LIKE 過濾）使用；資料庫架構與觸發器不依賴此函式
+    - 字典只新增不修改；遇到未載入的字典 ID 時重新由資料庫載入
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        min_bytes: int = 512,
+        level: int = 6,
+        preview_chars: int = 200,
+    ):
+        """初始化壓縮器
+
+        Args:
+            enabled: 是否壓縮新寫入的內容（解壓縮不受影響）
+            min_bytes: 內容（UTF-8）達此大小才壓縮
+            level: zlib 壓縮等級（1-9）
+            preview_chars: 文字欄位保留的預覽字元數（遷移使用）
+        """
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.level = level
+        self.preview_chars = preview_chars
+        self._dictionaries: dict[int, bytes] = {}
+        self._engine: Engine | None = None
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.decompressed = 0
+        self.decompress_seconds_total = 0.0
+
+    def bind(self, engine: Engine) -> None:
+        """綁定資料庫引擎，SQLite 連線建立時註冊 history_text 函式並載入字典"""
+        self._engine = engine
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", self._on_connect)
+
+    def _on_connect(self, dbapi_connection, _) -> None:
+        self.register_sqlite_function(dbapi_connection)
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT dictionary_id, data FROM history_dictionaries")
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError:
+            # 尚未執行遷移
+            return
+        finally:
+            cursor.close()
+        for dictionary_id, data in rows:
+            self.add_dictionary(dictionary_id, data)
+
+    def register_sqlite_function(self, dbapi_connection) -> None:
+        """在 SQLite 連線上註冊 history_text(text, blob)，回傳完整內容"""
+        dbapi_connection.create_function(
+            "history_text", 2, self.full_text, deterministic=True
+        )
+
+    def add_dictionary(self, dictionary_id: int, data: bytes) -> None:
+        with self._lock:
+            self._dictionaries[dictionary_id] = bytes(data)
+
+    def load_dictionaries(self, connection: Connection) -> None:
+        """由資料庫載入所有字典"""
+        rows = connection.execute(
+            select(HistoryDictionary.dictionary_id, HistoryDictionary.data)
+        ).all()
+        for dictionary_id, data in rows:
+            self.add_dictionary(dictionary_id, data)
+
+    def _dictionary(self, dictionary_id: int) -> bytes:
+        """取得字典，未載入時重新由資料庫載入
+
+        Raises:
+            ValueError: 字典不存在時
+        """
+        data = self._dictionaries.get(dictionary_id)
+        if data is None and self._engine is not None:
+            with self._engine.connect() as connection:
+                self.load_dictionaries(connection)
+            data = self._dictionaries.get(dictionary_id)
+        if data is None:
+            raise ValueError(f"找不到壓縮字典 {dictionary_id}")
+        return data
+
+    def compress(self, text: str) -> bytes | None:
+        """壓縮內容，未達門檻或壓縮後未變小時回傳 None"""
+        raw = text.encode("utf-8")
+        if not self.enabled or len(raw) < self.min_bytes:
+            return None
+
+        dictionary_id = max(self._dictionaries, default=_NO_DICTIONARY)
+        if dictionary_id == _NO_DICTIONARY:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        else:
+            compressor = zlib.compressobj(
+                self.level,
+                zlib.DEFLATED,
+                -zlib.MAX_WBITS,
+                zdict=self._dictionaries[dictionary_id],
+            )
+        header = bytes([_FORMAT_VERSION]) + dictionary_id.to_bytes(4, "big")
+        blob = header + compressor.compress(raw) + compressor.flush()
+        if len(blob) >= len(raw):
+            return None
+
+        self.compressed += 1
+        self.bytes_in += len(raw)
+        self.bytes_out += len(blob)
+        return blob
+
+    def decompress(self, blob: bytes) -> str:
+        """解壓縮內容
+
+        Raises:
+            ValueError: 格式不支援或字典不存在時
+        """
+        started = time.perf_counter()
+        if blob[0] != _FORMAT_VERSION:
+            raise ValueError(f"不支援的壓縮格式版本 {blob[0]}")
+        dictionary_id = int.from_bytes(blob[1:_HEADER_SIZE], "big")
+        if dictionary_id == _NO_DICTIONARY:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        else:
+            decompressor = zlib.decompressobj(
+                -zlib.MAX_WBITS, zdict=self._dictionary(dictionary_id)
+            )
+        raw = decompressor.decompress(blob[_HEADER_SIZE:]) + decompressor.flush()
+
+        self.decompressed += 1
+        self.decompress_seconds_total += time.perf_counter() - started
+        return raw.decode("utf-8")
+
+    def full_text(self, text: str | None, blob: bytes | None) -> str | None:
+        """由文字欄位與壓縮欄位取得完整內容"""
+        return text if blob is None else self.decompress(blob)
+
+    def ensure_dictionary(self, sample_size: int = 1000) -> int | None:
+        """尚無字典且已有足夠的樣本時，以最近儲存的內容訓練字典
+
+        回傳新字典的 ID，未訓練時回傳 None。
+        """
+        if not self.enabled or self._engine is None:
+            return None
+        with self._engine.connect() as connection:
+            self.load_dictionaries(connection)
+            if self._dictionaries:
+                return None
+            dictionary_id = self.train(connection, sample_size)
+            connection.commit()
+        return dictionary_id
+
+    def train(self, connection: Connection, sample_size: int = 1000) -> int | None:
+        """以最近達壓縮門檻的內容訓練新字典並寫入資料庫（不提交交易）"""
+        rows = connection.execute(
+            select(PromptBlob.body, PromptBlob.body_z)
+            .order_by(desc(PromptBlob.created_at))
+            .limit(sample_size)
+        ).all()
+        samples = [
+            body
+            for body in (self.full_text(text, blob) for text, blob in rows)
+            if body and len(body.encode("utf-8")) >= self.min_bytes
+        ]
+        if len(samples) < MIN_TRAINING_SAMPLES:
+            return None
+
+        data = train_dictionary(samples)
+        if not data:
+            return None
+        dictionary_id = connection.execute(
+            insert(HistoryDictionary)
+            .values(data=data, sample_count=len(samples))
+            .returning(HistoryDictionary.dictionary_id)
+        ).scalar_one()
+        self.add_dictionary(dictionary_id, data)
+        logger.info(
+            "已訓練歷史記錄壓縮字典 %d（%d 個樣本）", dictionary_id, len(samples)
+        )
+        return dictionary_id
+
+    def stats(self) -> dict:
+        """回傳壓縮統計"""
+        return {
+            "enabled": self.enabled,
+            "dictionaries": len(self._dictionaries),
+            "compressed": self.compressed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 3)
+            if self.bytes_in
+            else None,
+            "decompressed": self.decompressed,
+            "avg_decompress_ms": (
+                round(self.decompress_seconds_total / self.decompressed * 1000, 3)
+                if self.decompressed
+                else 0.0
+            ),
+        }
+
+
+# 建立全域壓縮器實例
+# PostgreSQL 會以 TOAST 自動壓縮大型文字欄位，且全文檢索欄位需要資料庫內的完整內容，
+# 因此只在 SQLite 上啟用
+history_compressor = HistoryCompressor(
+    enabled=settings.history_compression_enabled and settings.database_type == "sqlite",
+    min_bytes=settings.history_compression_min_bytes,
+    level=settings.history_compression_level,
+    preview_chars=settings.history_preview_chars,
+)
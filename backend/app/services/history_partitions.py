@@ -0,0 +1,190 @@
+"""
+prompt_history 時間分區管理模組（PostgreSQL）
+"""
+
+from collections import Counter
+from datetime import UTC, date, datetime
+import logging
+import re
+
+from sqlalchemy import Connection, text
+from sqlmodel import Session
+
+from app.config import settings
+from app.services.prompt_blobs import prompt_blob_store
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_NAME = re.compile(r"^prompt_history_p(\d{4})(\d{2})$")
+# 建立分區時使用的 advisory lock，避免多個行程同時建立相同的分區
+_PARTITION_LOCK = "prompt_history_partitions"
+
+
+def add_months(month: date, months: int) -> date:
+    """回傳 month 所在月份往後 months 個月的第一天"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_month(value: datetime) -> date:
+    """時間所屬月份分區的第一天（以 UTC 計，未帶時區的時間視為 UTC）"""
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC)
+    return date(value.year, value.month, 1)
+
+
+def partition_name(month: date) -> str:
+    """月份分區的資料表名稱，例如 prompt_history_p202610"""
+    return f"prompt_history_p{month:%Y%m}"
+
+
+def create_partition_sql(month: date) -> str:
+    """建立月份分區的 DDL（範圍以 UTC 計，包含起點、不含終點）"""
+    month = month.replace(day=1)
+    upper = add_months(month, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} "
+        f"PARTITION OF prompt_history FOR VALUES "
+        f"FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+    )
+
+
+def is_partitioned(connection: Connection) -> bool:
+    """prompt_history 是否為分區資料表（非 PostgreSQL 一律為 False）"""
+    if connection.dialect.name != "postgresql":
+        return False
+    return bool(
+        connection.execute(
+            text(
+                "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass('prompt_history'))"
+            )
+        ).scalar()
+    )
+
+
+class HistoryPartitionManager:
+    """依 created_at 每月一個分區的 prompt_history 維護
+
+    - 預先建立當月起 months_ahead 個月的分區；新記錄寫入不存在的月份會失敗，
+      因此由保存期限背景工作定期檢查，並不設預設分區
+    - 系統保存期限以刪除整個過期月份的分區處理，不需逐列 DELETE 與 VACUUM；
+      刪除前先釋放分區內記錄參考的內容
+    - 資料表是否已分區由遷移決定（需在遷移前啟用設定），執行時只檢查實際狀態
+    """
+
+    def __init__(self, enabled: bool = False, months_ahead: int = 3):
+        """初始化分區管理
+
+        Args:
+            enabled: 是否啟用（僅 PostgreSQL）
+            months_ahead: 預先建立的未來月份數
+        """
+        self.enabled = enabled
+        self.months_ahead = months_ahead
+        self.active: bool | None = None
+        self.created = 0
+        self.dropped = 0
+        self.dropped_rows = 0
+
+    def check(self, session: Session) -> bool:
+        """確認 prompt_history 已分區（結果會快取）"""
+        if not self.enabled:
+            return False
+        if self.active is None:
+            self.active = is_partitioned(session.connection())
+            if not self.active:
+                logger.warning(
+                    "已啟用 HISTORY_PARTITIONING_ENABLED，但 prompt_history 尚未分區；"
+                    "請在 PostgreSQL 上啟用設定後執行遷移"
+                )
+        return self.active
+
+    def partitions(self, session: Session) -> list[date]:
+        """回傳現有月份分區（由舊到新）"""
+        names = session.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = 'prompt_history'::regclass"
+            )
+        ).scalars()
+        months = []
+        for name in names:
+            match = _PARTITION_NAME.match(name)
+            if match:
+                months.append(date(int(match[1]), int(match[2]), 1))
+        return sorted(months)
+
+    def ensure_partitions(self, session: Session, today: date) -> int:
+        """建立當月起 months_ahead 個月內缺少的分區並提交，回傳新建的分區數"""
+        session.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+            {"key": _PARTITION_LOCK},
+        )
+        existing = set(self.partitions(session))
+        created = 0
+        for offset in range(self.months_ahead + 1):
+            month = add_months(today, offset)
+            if month not in existing:
+                session.execute(text(create_partition_sql(month)))
+                created += 1
+        session.commit()
+        if created:
+            self.created += created
+            logger.info("已建立 %d 個 prompt_history 月份分區", created)
+        return created
+
+    def drop_expired(self, session: Session, cutoff: datetime) -> int:
+        """刪除整個月份都早於 cutoff 的分區，回傳刪除的記錄筆數
+
+        每個分區一個交易：先刪除分區，再釋放其記錄參考的內容。
+        """
+        total = 0
+        for month in self.partitions(session):
+            upper = datetime.combine(add_months(month, 1), datetime.min.time())
+            if upper.replace(tzinfo=UTC) > cutoff:
+                break
+            name = partition_name(month)
+            rows = session.execute(text(f"SELECT count(*) FROM {name}")).scalar_one()
+            refs = Counter(
+                dict(
+                    session.execute(
+                        text(
+                            f"SELECT blob_hash, count(*) FROM ("
+                            f"SELECT original_blob_hash AS blob_hash FROM {name} "
+                            f"UNION ALL "
+                            f"SELECT optimized_blob_hash FROM {name}"
+                            f") AS refs WHERE blob_hash IS NOT NULL GROUP BY blob_hash"
+                        )
+                    ).all()
+                )
+            )
+            session.execute(text(f"DROP TABLE {name}"))
+            prompt_blob_store.release_counts(session, refs)
+            session.commit()
+
+            total += rows
+            self.dropped += 1
+            self.dropped_rows += rows
+            logger.info("已刪除過期的分區 %s（%d 筆記錄）", name, rows)
+        return total
+
+    def stats(self) -> dict:
+        """回傳分區維護統計"""
+        return {
+            "enabled": self.enabled,
+            "active": bool(self.active),
+            "months_ahead": self.months_ahead,
+            "created": self.created,
+            "dropped": self.dropped,
+            "dropped_rows": self.dropped_rows,
+        }
+
+
+# 建立全域分區管理實例
+history_partitions = HistoryPartitionManager(
+    enabled=settings.history_partitioning_enabled
+    and settings.database_type == "postgres",
+    months_ahead=settings.history_partition_months_ahead,
+)
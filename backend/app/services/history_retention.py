@@ -0,0 +1,227 @@
+"""
+歷史記錄保存期限與刪除服務
+"""
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+import logging
+import time
+
+from sqlalchemy import delete
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.dependencies import engine
+from app.models import PromptHistory, User
+from app.services.history_partitions import (
+    HistoryPartitionManager,
+    history_partitions,
+)
+from app.services.prompt_blobs import prompt_blob_store
+
+logger = logging.getLogger(__name__)
+
+_HASH_COLUMNS = (PromptHistory.original_blob_hash, PromptHistory.optimized_blob_hash)
+
+
+def delete_history(session: Session, conditions: list) -> int:
+    """以單一 DELETE 刪除符合條件的歷史記錄並釋放其內容，回傳刪除筆數
+
+    只執行 SQL，不提交交易。支援 RETURNING 的資料庫（SQLite 3.35+、PostgreSQL）
+    由 DELETE 直接回傳內容雜湊，其他資料庫則先查詢雜湊再刪除。
+    用量彙總不會因刪除歷史記錄而遞減。
+    """
+    statement = (
+        delete(PromptHistory)
+        .where(*conditions)
+        .execution_options(synchronize_session=False)
+    )
+    if session.get_bind().dialect.delete_returning:
+        rows = session.execute(statement.returning(*_HASH_COLUMNS)).all()
+    else:
+        rows = session.exec(select(*_HASH_COLUMNS).where(*conditions)).all()
+        session.execute(statement)
+    # 刪除後才釋放內容，避免刪除仍被參考（外鍵）的內容
+    prompt_blob_store.release(session, (digest for row in rows for digest in row))
+    return len(rows)
+
+
+def effective_retention_days(
+    user_days: int | None, global_days: int | None
+) -> int | None:
+    """實際套用的保存天數：用戶與系統設定取較短者，None 表示永久保存"""
+    days = [value for value in (user_days, global_days) if value]
+    return min(days) if days else None
+
+
+class HistoryRetention:
+    """依保存期限定期刪除過期的歷史記錄
+
+    - 系統設定（global_days）套用於所有用戶；用戶可另設較短的期限
+    - 逐一用戶以 (user_id, created_at) 索引找出過期記錄，每批最多 batch_size 筆，
+      每批為一個短交易，批次之間暫停 pause 秒，避免長時間佔用寫入鎖
+    - PostgreSQL 啟用分區時，每次執行先建立未來月份的分區，並以刪除整個月份分區
+      處理系統保存期限；跨月份剩餘的過期記錄與用戶期限仍逐批刪除
+    - 多個 API 行程同時執行時只會重複檢查，不會重複刪除
+    """
+
+    def __init__(
+        self,
+        global_days: int = 0,
+        interval: float = 3600.0,
+        batch_size: int = 500,
+        pause: float = 0.05,
+        partitions: HistoryPartitionManager | None = None,
+    ):
+        """初始化保存期限工作
+
+        Args:
+            global_days: 系統保存天數，0 表示永久保存
+            interval: 檢查間隔（秒）
+            batch_size: 每批刪除的最大筆數
+            pause: 批次之間的暫停秒數
+            partitions: 分區管理（未啟用分區時為 None）
+        """
+        self.global_days = global_days or None
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.partitions = partitions
+        self._stop = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.failures = 0
+        self.deleted = 0
+        self.batches = 0
+        self.last_run_at: datetime | None = None
+        self.last_run_seconds = 0.0
+
+    def start(self) -> None:
+        """啟動背景工作"""
+        if self._task is None:
+            # asyncio.Event 綁定首次等待的事件迴圈；每次啟動重新建立
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """停止背景工作（進行中的批次完成後結束）"""
+        if self._task is None:
+            return
+        self._stop.set()
+        await self._task
+        self._task = None
+
+    async def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await self.prune()
+            except SQLAlchemyError as e:
+                self.failures += 1
+                logger.warning("刪除過期歷史記錄失敗，稍後重試: %s", str(e))
+            except Exception:
+                # 背景工作不可因單次錯誤而停止
+                self.failures += 1
+                logger.exception("刪除過期歷史記錄時發生未預期的錯誤")
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except TimeoutError:
+                pass
+
+    def _policies(self) -> list[tuple[int, int]]:
+        """回傳需要檢查的 (用戶, 保存天數)"""
+        statement = select(User.user_id, User.history_retention_days)
+        if self.global_days is None:
+            statement = statement.where(User.history_retention_days.is_not(None))
+        with Session(engine) as session:
+            rows = session.exec(statement).all()
+        return [
+            (user_id, days)
+            for user_id, user_days in rows
+            if (days := effective_retention_days(user_days, self.global_days))
+        ]
+
+    def delete_expired(self, session: Session, user_id: int, cutoff: datetime) -> int:
+        """刪除用戶一批早於 cutoff 的記錄（不提交交易），回傳刪除筆數"""
+        ids = session.exec(
+            select(PromptHistory.history_id)
+            .where(PromptHistory.user_id == user_id, PromptHistory.created_at < cutoff)
+            .order_by(PromptHistory.created_at, PromptHistory.history_id)
+            .limit(self.batch_size)
+        ).all()
+        if not ids:
+            return 0
+        return delete_history(session, [PromptHistory.history_id.in_(ids)])
+
+    def _prune_batch(self, user_id: int, cutoff: datetime) -> int:
+        """以獨立交易刪除一批過期記錄"""
+        with Session(engine) as session:
+            deleted = self.delete_expired(session, user_id, cutoff)
+            session.commit()
+        return deleted
+
+    def _maintain_partitions(self, now: datetime) -> int:
+        """建立未來月份的分區並刪除過期的分區，回傳刪除的記錄筆數"""
+        with Session(engine) as session:
+            if not self.partitions.check(session):
+                return 0
+            self.partitions.ensure_partitions(session, now.date())
+            if self.global_days is None:
+                return 0
+            return self.partitions.drop_expired(
+                session, now - timedelta(days=self.global_days)
+            )
+
+    async def prune(self) -> int:
+        """刪除所有用戶過期的歷史記錄，回傳刪除筆數"""
+        started = time.perf_counter()
+        now = datetime.now(UTC)
+
+        total = 0
+        if self.partitions is not None and self.partitions.enabled:
+            total = await asyncio.to_thread(self._maintain_partitions, now)
+            self.deleted += total
+
+        policies = await asyncio.to_thread(self._policies)
+        for user_id, days in policies:
+            cutoff = now - timedelta(days=days)
+            while not self._stop.is_set():
+                deleted = await asyncio.to_thread(self._prune_batch, user_id, cutoff)
+                if not deleted:
+                    break
+                total += deleted
+                self.batches += 1
+                self.deleted += deleted
+                if deleted < self.batch_size:
+                    break
+                await asyncio.sleep(self.pause)
+
+        self.runs += 1
+        self.last_run_at = now
+        self.last_run_seconds = time.perf_counter() - started
+        if total:
+            logger.info("已刪除 %d 筆過期的歷史記錄", total)
+        return total
+
+    def stats(self) -> dict:
+        """回傳刪除統計"""
+        return {
+            "global_days": self.global_days,
+            "running": self._task is not None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "deleted": self.deleted,
+            "batches": self.batches,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_ms": round(self.last_run_seconds * 1000, 3),
+        }
+
+
+# 建立全域保存期限工作實例
+history_retention = HistoryRetention(
+    global_days=settings.history_retention_days,
+    interval=settings.history_retention_interval,
+    batch_size=settings.history_retention_batch_size,
+    pause=settings.history_retention_pause,
+    partitions=history_partitions,
+)
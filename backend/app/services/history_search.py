@@ -0,0 +1,176 @@
+"""
+歷史記錄全文檢索服務
+"""
+
+from collections.abc import Iterable
+
+from sqlalchemy import (
+    ColumnElement,
+    and_,
+    column,
+    func,
+    insert,
+    literal_column,
+    or_,
+    table,
+)
+from sqlmodel import Session, desc, select
+
+from app.models import PromptHistory
+from app.services.prompt_blobs import BODY_FIELDS, full_text_expression
+
+# SQLite trigram 分詞器只能比對至少 3 個字元的詞，較短的詞改以 LIKE 過濾
+_TRIGRAM_MIN_LENGTH = 3
+
+_sqlite_fts = table(
+    "prompt_history_fts",
+    column("rowid"),
+    column("rank"),
+    column("original_prompt"),
+    column("optimized_prompt"),
+)
+
+
+def index_history_bodies(
+    session: Session, entries: Iterable[tuple[int, str, str]]
+) -> None:
+    """SQLite：將新增歷史記錄的完整內容寫入 FTS5 表
+
+    文字欄位可能只剩預覽，必須在 store_bodies 之前取得完整內容，
+    並在新增歷史記錄的同一交易內呼叫。刪除時由資料庫觸發器移除索引。
+
+    Args:
+        session: 資料庫 session
+        entries: (history_id, 完整原始 Prompt, 完整優化後 Prompt)
+    """
+    if session.get_bind().dialect.name != "sqlite":
+        return
+    rows = [
+        {
+            "rowid": history_id,
+            "original_prompt": original,
+            "optimized_prompt": optimized,
+        }
+        for history_id, original, optimized in entries
+    ]
+    if rows:
+        session.execute(insert(_sqlite_fts), rows)
+
+
+def _search_terms(query: str) -> list[str]:
+    """以空白切分搜尋字串
+
+    Raises:
+        ValueError: 搜尋字串為空時
+    """
+    terms = query.split()
+    if not terms:
+        raise ValueError("搜尋關鍵字不能為空")
+    return terms
+
+
+def _like_condition(term: str, columns: tuple) -> ColumnElement[bool]:
+    """任一欄位包含指定字串"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = f"%{escaped}%"
+    return or_(*(column.like(pattern, escape="\\") for column in columns))
+
+
+def _body_columns(dialect: str) -> tuple:
+    """在資料庫內取得完整內容的欄位運算式（存於 prompt_blobs 的內容以子查詢取得）"""
+    return tuple(
+        full_text_expression(
+            getattr(PromptHistory, text_field),
+            getattr(PromptHistory, hash_field),
+            dialect,
+        )
+        for text_field, hash_field in BODY_FIELDS
+    )
+
+
+def _sqlite_search(terms: list[str], conditions: list):
+    """SQLite：FTS5 trigram 索引，以 bm25 排序（分數越高越相關）"""
+    long_terms = [term for term in terms if len(term) >= _TRIGRAM_MIN_LENGTH]
+    short_terms = [term for term in terms if len(term) < _TRIGRAM_MIN_LENGTH]
+    columns = _body_columns("sqlite")
+    conditions = [
+        *conditions,
+        *(_like_condition(term, columns) for term in short_terms),
+    ]
+
+    if not long_terms:
+        # 沒有可用索引比對的詞，只在該用戶的記錄中過濾，依時間排序
+        return (
+            select(PromptHistory, literal_column("0.0").label("score"))
+            .where(*conditions)
+            .order_by(desc(PromptHistory.created_at), desc(PromptHistory.history_id))
+        )
+
+    # 每個詞視為片語（以雙引號包住），詞與詞之間為 AND
+    match = " ".join('"' + term.replace('"', '""') + '"' for term in long_terms)
+    # FTS5 的 rank 隱藏欄位預設為 bm25（越小越相關），依 rank 排序由 FTS5 直接處理
+    rank = _sqlite_fts.c.rank
+    return (
+        select(PromptHistory, (-rank).label("score"))
+        .join(_sqlite_fts, _sqlite_fts.c.rowid == PromptHistory.history_id)
+        .where(literal_column("prompt_history_fts").op("MATCH")(match), *conditions)
+        .order_by(rank)
+    )
+
+
+def _postgres_search(query: str, conditions: list):
+    """PostgreSQL：tsvector 產生欄位與 GIN 索引，以 ts_rank_cd 排序"""
+    vector = literal_column("prompt_history.search_vector")
+    tsquery = func.websearch_to_tsquery("simple", query)
+    rank = func.ts_rank_cd(vector, tsquery)
+    return (
+        select(PromptHistory, rank.label("score"))
+        .where(vector.op("@@")(tsquery), *conditions)
+        .order_by(desc(rank), desc(PromptHistory.history_id))
+    )
+
+
+def _fallback_search(terms: list[str], conditions: list, dialect: str):
+    """其他資料庫：逐詞 LIKE 過濾，依時間排序"""
+    columns = _body_columns(dialect)
+    return (
+        select(PromptHistory, literal_column("0.0").label("score"))
+        .where(and_(*conditions, *(_like_condition(term, columns) for term in terms)))
+        .order_by(desc(PromptHistory.created_at), desc(PromptHistory.history_id))
+    )
+
+
+def search_history(
+    session: Session,
+    query: str,
+    conditions: list,
+    limit: int,
+    offset: int = 0,
+) -> list[tuple[PromptHistory, float]]:
+    """全文檢索歷史記錄，回傳 (歷史記錄, 相關分數) 並依相關程度排序
+
+    SQLite 的 FTS5 表由寫入歷史記錄的程式以 index_history_bodies 新增完整內容，
+    刪除歷史記錄時由觸發器移除；PostgreSQL 則由觸發器讀取 prompt_blobs 中的
+    完整內容計算 tsvector 欄位，不需額外同步。
+
+    Args:
+        session: 資料庫 session
+        query: 搜尋字串，以空白分隔的詞皆須出現
+        conditions: 額外的查詢條件（至少應包含用戶條件）
+        limit: 回傳筆數
+        offset: 略過的筆數
+
+    Raises:
+        ValueError: 搜尋字串為空時
+    """
+    terms = _search_terms(query)
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        statement = _sqlite_search(terms, conditions)
+    elif dialect == "postgresql":
+        statement = _postgres_search(query, conditions)
+    else:
+        statement = _fallback_search(terms, conditions, dialect)
+
+    rows = session.exec(statement.limit(limit).offset(offset)).all()
+    return [(history, float(score)) for history, score in rows]
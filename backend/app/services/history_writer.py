@@ -0,0 +1,249 @@
+"""
+歷史記錄延遲寫入（write-behind）模組
+"""
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
+from sqlmodel import Session
+
+from app.config import settings
+from app.dependencies import engine
+from app.models import PromptHistory
+from app.services.history_search import index_history_bodies
+from app.services.prompt_blobs import prompt_blob_store
+from app.services.usage_rollup import record_usage
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryWriter:
+    """將歷史記錄放入行程內緩衝區，由背景工作批次寫入資料庫
+
+    優化請求不再等待資料庫寫入（SQLite 上還需取得寫入鎖），改由背景工作
+    在累積 batch_size 筆或每 flush_interval 秒時，以單一交易的多列 INSERT
+    寫入歷史記錄並遞增用量彙總。
+
+    - 緩衝區達到 max_buffer 筆時，提交端會等待騰出空間（背壓）
+    - 關閉時寫入緩衝區內的所有記錄
+    - 批次寫入失敗時改為逐筆寫入：資料本身有問題的記錄被捨棄並記錄錯誤，
+      資料庫暫時無法使用時未寫入的記錄放回緩衝區下次再試（最多保留 max_buffer 筆）
+    - 未啟用或背景工作未執行（例如獨立的 worker 行程）時，submit 回傳 False，
+      由呼叫端直接寫入
+    - 記錄寫入前不會出現在歷史列表中；行程異常終止時緩衝區內的記錄會遺失
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_buffer: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+    ):
+        """初始化延遲寫入器
+
+        Args:
+            enabled: 是否啟用
+            max_buffer: 緩衝區最大筆數
+            batch_size: 單次寫入的最大筆數，累積到此數量時立即寫入
+            flush_interval: 最長寫入間隔（秒）
+        """
+        self.enabled = enabled
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: list[PromptHistory] = []
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failures = 0
+        self.dropped = 0
+        self.backpressure_waits = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+    async def submit(self, histories: list[PromptHistory]) -> bool:
+        """放入緩衝區，回傳是否已接受（False 時應由呼叫端直接寫入）"""
+        if self._task is None or self._task.done() or self._stopping:
+            return False
+
+        # 緩衝區已滿時等待背景工作騰出空間
+        while self._buffer and len(self._buffer) + len(histories) > self.max_buffer:
+            self.backpressure_waits += 1
+            self._space.clear()
+            self._wakeup.set()
+            await self._space.wait()
+            if self._stopping or self._task.done():
+                return False
+
+        self._buffer.extend(histories)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        """啟動背景寫入（未啟用時不啟動）"""
+        if self.enabled and self._task is None:
+            self._stopping = False
+            # asyncio.Event 會綁定第一次使用的事件迴圈，每次啟動時重新建立
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """停止背景寫入，並寫入緩衝區內的所有記錄"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._space.set()
+        await self._task
+        self._task = None
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                flushed = await self.flush()
+            except Exception:
+                # 背景工作不可因單次錯誤而停止
+                self.failures += 1
+                logger.exception("寫入歷史記錄時發生未預期的錯誤")
+                flushed = False
+            if self._stopping:
+                if not flushed:
+                    logger.error(
+                        "關閉時寫入歷史記錄失敗，%d 筆記錄遺失", len(self._buffer)
+                    )
+                    self._buffer.clear()
+                return
+
+    async def flush(self) -> bool:
+        """分批寫入緩衝區內的記錄，回傳是否全部寫入成功"""
+        while self._buffer:
+            batch = self._buffer[: self.batch_size]
+            del self._buffer[: self.batch_size]
+            self._space.set()
+
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:  # noqa: BLE001 - 改為逐筆寫入以找出有問題的記錄
+                self.failures += 1
+                logger.warning("批次寫入歷史記錄失敗，改為逐筆寫入: %s", str(e))
+                if not await self._write_each(batch):
+                    return False
+                continue
+
+            elapsed = time.perf_counter() - started
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+        return True
+
+    async def _write_each(self, batch: list[PromptHistory]) -> bool:
+        """逐筆寫入批次內的記錄
+
+        資料本身有問題（例如違反約束）的記錄會被捨棄；資料庫暫時無法使用時，
+        尚未寫入的記錄放回緩衝區並回傳 False。
+        """
+        for index, history in enumerate(batch):
+            try:
+                await asyncio.to_thread(self._write, [history])
+            except (IntegrityError, DataError) as e:
+                self._drop(history, e)
+            except SQLAlchemyError as e:
+                self._requeue(batch[index:])
+                logger.warning("寫入歷史記錄失敗，稍後重試: %s", str(e))
+                return False
+            except Exception as e:  # noqa: BLE001 - 無法寫入的記錄不應阻塞其他記錄
+                self._drop(history, e)
+            else:
+                self.flushed_rows += 1
+        return True
+
+    def _drop(self, history: PromptHistory, error: Exception) -> None:
+        """捨棄無法寫入的記錄"""
+        self.dropped += 1
+        logger.error(
+            "無法寫入歷史記錄，已捨棄（user_id=%s, model=%s）: %s",
+            history.user_id,
+            history.model_used,
+            str(error),
+        )
+
+    def _requeue(self, histories: list[PromptHistory]) -> None:
+        """將未寫入的記錄放回緩衝區前端；超過 max_buffer 時捨棄最舊的記錄"""
+        self._buffer[:0] = histories
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.dropped += overflow
+            logger.error("歷史記錄緩衝區已滿，捨棄 %d 筆最舊的記錄", overflow)
+
+    @staticmethod
+    def _write(histories: list[PromptHistory]) -> None:
+        """以單一交易寫入內容、歷史記錄（多列 INSERT）、全文檢索索引與用量彙總"""
+        # store_bodies 會將內容改為預覽；以副本寫入，失敗重試時緩衝區仍保有完整內容
+        bodies = [
+            (history.original_prompt, history.optimized_prompt) for history in histories
+        ]
+        histories = [PromptHistory(**history.model_dump()) for history in histories]
+        with Session(engine) as session:
+            prompt_blob_store.store_bodies(session, histories)
+            rows = [history.model_dump(exclude={"history_id"}) for history in histories]
+            history_ids = session.scalars(
+                insert(PromptHistory).returning(
+                    PromptHistory.history_id, sort_by_parameter_order=True
+                ),
+                rows,
+            ).all()
+            index_history_bodies(
+                session,
+                (
+                    (history_id, *body)
+                    for history_id, body in zip(history_ids, bodies, strict=True)
+                ),
+            )
+            record_usage(session, histories)
+            session.commit()
+
+    def stats(self) -> dict:
+        """回傳緩衝區深度與寫入延遲統計"""
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None,
+            "depth": len(self._buffer),
+            "max_buffer": self.max_buffer,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "backpressure_waits": self.backpressure_waits,
+            "avg_flush_ms": (
+                round(self.flush_seconds_total / self.flushes * 1000, 3)
+                if self.flushes
+                else 0.0
+            ),
+            "max_flush_ms": round(self.flush_seconds_max * 1000, 3),
+        }
+
+
+# 建立全域延遲寫入器實例
+history_writer = HistoryWriter(
+    enabled=settings.history_write_behind_enabled,
+    max_buffer=settings.history_write_behind_max_buffer,
+    batch_size=settings.history_write_behind_batch_size,
+    flush_interval=settings.history_write_behind_flush_interval,
+)
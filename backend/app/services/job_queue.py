@@ -0,0 +1,481 @@
+"""
+Prompt 優化背景工作佇列模組
+"""
+
+from abc import ABC, abstractmethod
+import asyncio
+from datetime import UTC, datetime
+from enum import Enum
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+from redis.exceptions import RedisError, ResponseError
+from sqlmodel import Session
+
+from app.config import settings
+from app.dependencies import engine
+from app.schemas.optimize import PromptOptimizeRequest
+from app.services.gemini_client_pool import get_gemini_client
+from app.services.history_writer import history_writer
+from app.services.optimize_cache import optimize_result_cache
+from app.services.prompt_optimizer import PromptOptimizerService
+from app.services.single_flight import optimize_single_flight
+from app.services.token_budget import optimize_token_budget
+from app.utils import get_async_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    """工作狀態"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+FINISHED_STATUSES = {JobStatus.SUCCEEDED.value, JobStatus.FAILED.value}
+
+
+class JobQueueFullError(Exception):
+    """佇列已滿，無法再接受新工作"""
+
+
+def _now() -> str:
+    return datetime.now(UTC).isoformat()
+
+
+async def execute_optimize_job(user_id: int | None, payload: dict) -> dict:
+    """執行單一優化工作，回傳 PromptOptimizeResponse 的 dict"""
+    request = PromptOptimizeRequest.model_validate(payload)
+    with Session(engine) as session:
+        optimizer = PromptOptimizerService(
+            session,
+            get_gemini_client(request.api_key),
+            result_cache=optimize_result_cache,
+            single_flight=optimize_single_flight,
+            token_budget=optimize_token_budget,
+            history_writer=history_writer,
+        )
+        result = await optimizer.optimize_prompt(user_id=user_id, request=request)
+    return result.model_dump()
+
+
+class OptimizeJobQueue(ABC):
+    """優化工作佇列抽象基底類別
+
+    工作記錄格式：
+    {
+        "job_id": str,
+        "status": "queued" | "running" | "succeeded" | "failed",
+        "user_id": int | None,
+        "result": dict | None,
+        "error": str | None,
+        "created_at": str,
+        "started_at": str | None,
+        "finished_at": str | None,
+    }
+    """
+
+    def __init__(self, max_depth: int = 10000, result_ttl_seconds: int = 3600):
+        self.max_depth = max_depth
+        self.result_ttl_seconds = result_ttl_seconds
+
+    @abstractmethod
+    async def submit(self, user_id: int | None, request: PromptOptimizeRequest) -> str:
+        """提交工作，回傳 job_id
+
+        Raises:
+            JobQueueFullError: 佇列深度已達上限時
+        """
+
+    @abstractmethod
+    async def get(self, job_id: str) -> dict | None:
+        """取得工作記錄，不存在時回傳 None"""
+
+    @abstractmethod
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        """長輪詢：等待工作結束或逾時，回傳最新的工作記錄"""
+
+    @abstractmethod
+    async def run_worker(self, stop_event: asyncio.Event, concurrency: int) -> None:
+        """執行 worker 迴圈直到 stop_event 被設定"""
+
+    @abstractmethod
+    async def stats(self) -> dict:
+        """回傳佇列深度與工作延遲統計"""
+
+    async def _execute(self, job: dict, payload: dict) -> dict:
+        """執行工作並回傳需更新的欄位"""
+        try:
+            result = await execute_optimize_job(job.get("user_id"), payload)
+        except (ValueError, PermissionError, RuntimeError) as e:
+            return {"status": JobStatus.FAILED.value, "error": str(e)}
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception("優化工作 %s 執行失敗", job["job_id"])
+            return {"status": JobStatus.FAILED.value, "error": f"內部錯誤: {e}"}
+        return {"status": JobStatus.SUCCEEDED.value, "result": result}
+
+
+class InMemoryJobQueue(OptimizeJobQueue):
+    """行程內的工作佇列（未設定 Redis 佇列時的備援）
+
+    工作由 API 行程內的 worker task 執行，行程重啟時未完成的工作會遺失。
+    """
+
+    def __init__(self, max_depth: int = 10000, result_ttl_seconds: int = 3600):
+        super().__init__(max_depth, result_ttl_seconds)
+        self._queue: asyncio.Queue[tuple[str, dict]] = asyncio.Queue()
+        self._jobs: dict[str, dict] = {}
+        self._events: dict[str, asyncio.Event] = {}
+        self._enqueued_at: dict[str, float] = {}
+        self._finished_at: dict[str, float] = {}
+        self._running = 0
+        self._counters = {
+            "submitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "wait_seconds_total": 0.0,
+            "latency_seconds_total": 0.0,
+        }
+
+    def _purge_expired(self) -> None:
+        deadline = time.monotonic() - self.result_ttl_seconds
+        for job_id, finished in list(self._finished_at.items()):
+            if finished < deadline:
+                self._jobs.pop(job_id, None)
+                self._events.pop(job_id, None)
+                del self._finished_at[job_id]
+
+    async def submit(self, user_id: int | None, request: PromptOptimizeRequest) -> str:
+        self._purge_expired()
+        if self._queue.qsize() >= self.max_depth:
+            raise JobQueueFullError("工作佇列已滿，請稍後再試")
+
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "status": JobStatus.QUEUED.value,
+            "user_id": user_id,
+            "result": None,
+            "error": None,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        self._events[job_id] = asyncio.Event()
+        self._enqueued_at[job_id] = time.monotonic()
+        self._queue.put_nowait((job_id, request.model_dump()))
+        self._counters["submitted"] += 1
+        return job_id
+
+    async def get(self, job_id: str) -> dict | None:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        event = self._events.get(job_id)
+        if event is not None and timeout > 0:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except TimeoutError:
+                pass
+        return await self.get(job_id)
+
+    async def run_worker(self, stop_event: asyncio.Event, concurrency: int) -> None:
+        async def consume():
+            while not stop_event.is_set():
+                try:
+                    job_id, payload = await asyncio.wait_for(self._queue.get(), 1.0)
+                except TimeoutError:
+                    continue
+                try:
+                    await self._process(job_id, payload)
+                finally:
+                    self._queue.task_done()
+
+        await asyncio.gather(*(consume() for _ in range(concurrency)))
+
+    async def _process(self, job_id: str, payload: dict) -> None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+
+        enqueued = self._enqueued_at.pop(job_id, time.monotonic())
+        self._counters["wait_seconds_total"] += time.monotonic() - enqueued
+
+        job.update(status=JobStatus.RUNNING.value, started_at=_now())
+        self._running += 1
+        try:
+            job.update(await self._execute(job, payload))
+        finally:
+            self._running -= 1
+        job["finished_at"] = _now()
+
+        finished = time.monotonic()
+        self._counters["latency_seconds_total"] += finished - enqueued
+        self._counters[job["status"]] += 1
+        self._finished_at[job_id] = finished
+        self._events[job_id].set()
+
+    async def stats(self) -> dict:
+        finished = self._counters["succeeded"] + self._counters["failed"]
+        return _format_stats(
+            backend="memory",
+            depth=self._queue.qsize(),
+            running=self._running,
+            counters=self._counters,
+            finished=finished,
+        )
+
+
+class RedisJobQueue(OptimizeJobQueue):
+    """以 Redis Stream 為後端的工作佇列
+
+    API 行程只負責寫入 stream，由獨立的 worker 行程（`python -m app.worker`）
+    透過 consumer group 取出並執行，可與 API 行程分開水平擴展。
+    worker 異常終止時，閒置過久的未確認工作會被其他 worker 重新認領。
+    """
+
+    STREAM_KEY = "optimize_jobs:stream"
+    GROUP_NAME = "optimize_workers"
+    STATS_KEY = "optimize_jobs:stats"
+    JOB_KEY_PREFIX = "optimize_jobs:job"
+
+    def __init__(
+        self,
+        max_depth: int = 10000,
+        result_ttl_seconds: int = 3600,
+        claim_idle_seconds: float = 300.0,
+        poll_interval_seconds: float = 0.25,
+    ):
+        super().__init__(max_depth, result_ttl_seconds)
+        self.claim_idle_seconds = claim_idle_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self._running = 0
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.JOB_KEY_PREFIX}:{job_id}"
+
+    @staticmethod
+    def _decode(raw: dict) -> dict:
+        job = dict(raw)
+        user_id = job.get("user_id")
+        job["user_id"] = int(user_id) if user_id else None
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        for field in ("error", "started_at", "finished_at"):
+            job[field] = job.get(field) or None
+        return job
+
+    async def submit(self, user_id: int | None, request: PromptOptimizeRequest) -> str:
+        r = get_async_redis_client()
+        if await r.xlen(self.STREAM_KEY) >= self.max_depth:
+            raise JobQueueFullError("工作佇列已滿，請稍後再試")
+
+        job_id = uuid.uuid4().hex
+        job_key = self._job_key(job_id)
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                job_key,
+                mapping={
+                    "job_id": job_id,
+                    "status": JobStatus.QUEUED.value,
+                    "user_id": "" if user_id is None else str(user_id),
+                    "created_at": _now(),
+                    "enqueued_at": str(time.time()),
+                },
+            )
+            pipe.expire(job_key, self.result_ttl_seconds)
+            # 請求內容（含 API 金鑰）只存在 stream 中，工作完成後即刪除
+            pipe.xadd(
+                self.STREAM_KEY,
+                {"job_id": job_id, "payload": request.model_dump_json()},
+            )
+            pipe.hincrby(self.STATS_KEY, "submitted", 1)
+            await pipe.execute()
+        return job_id
+
+    async def get(self, job_id: str) -> dict | None:
+        r = get_async_redis_client()
+        raw = await r.hgetall(self._job_key(job_id))
+        if not raw:
+            return None
+        job = self._decode(raw)
+        job.pop("enqueued_at", None)
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        job = await self.get(job_id)
+        while (
+            job is not None
+            and job["status"] not in FINISHED_STATUSES
+            and loop.time() < deadline
+        ):
+            await asyncio.sleep(self.poll_interval_seconds)
+            job = await self.get(job_id)
+        return job
+
+    async def _ensure_group(self) -> None:
+        r = get_async_redis_client()
+        try:
+            await r.xgroup_create(
+                self.STREAM_KEY, self.GROUP_NAME, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def run_worker(self, stop_event: asyncio.Event, concurrency: int) -> None:
+        await self._ensure_group()
+        consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+        async def consume(index: int):
+            consumer = f"{consumer_prefix}-{index}"
+            r = get_async_redis_client()
+            while not stop_event.is_set():
+                try:
+                    response = await r.xreadgroup(
+                        self.GROUP_NAME,
+                        consumer,
+                        {self.STREAM_KEY: ">"},
+                        count=1,
+                        block=1000,
+                    )
+                    messages = response[0][1] if response else []
+                    if not messages:
+                        messages = await self._claim_stale(consumer)
+                    for message_id, fields in messages:
+                        await self._process(message_id, fields)
+                except RedisError as e:
+                    logger.warning("讀取工作佇列失敗: %s", e)
+                    await asyncio.sleep(1.0)
+
+        await asyncio.gather(*(consume(index) for index in range(concurrency)))
+
+    async def _claim_stale(self, consumer: str) -> list:
+        """認領其他 worker 閒置過久、未確認的工作"""
+        r = get_async_redis_client()
+        claimed = await r.xautoclaim(
+            self.STREAM_KEY,
+            self.GROUP_NAME,
+            consumer,
+            min_idle_time=int(self.claim_idle_seconds * 1000),
+            start_id="0-0",
+            count=1,
+        )
+        return claimed[1] if claimed else []
+
+    async def _process(self, message_id: str, fields: dict) -> None:
+        r = get_async_redis_client()
+        job_id = fields.get("job_id", "")
+        job_key = self._job_key(job_id)
+        raw = await r.hgetall(job_key)
+
+        if raw and raw.get("status") not in FINISHED_STATUSES:
+            job = self._decode(raw)
+            started = time.time()
+            await r.hset(
+                job_key,
+                mapping={"status": JobStatus.RUNNING.value, "started_at": _now()},
+            )
+            self._running += 1
+            try:
+                update = await self._execute(job, json.loads(fields["payload"]))
+            finally:
+                self._running -= 1
+
+            finished = time.time()
+            mapping = {"status": update["status"], "finished_at": _now()}
+            if update.get("result") is not None:
+                mapping["result"] = json.dumps(update["result"], ensure_ascii=False)
+            if update.get("error"):
+                mapping["error"] = update["error"]
+
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.hset(job_key, mapping=mapping)
+                pipe.expire(job_key, self.result_ttl_seconds)
+                pipe.hincrby(self.STATS_KEY, update["status"], 1)
+                pipe.hincrbyfloat(
+                    self.STATS_KEY,
+                    "wait_seconds_total",
+                    started - float(raw.get("enqueued_at") or started),
+                )
+                pipe.hincrbyfloat(
+                    self.STATS_KEY,
+                    "latency_seconds_total",
+                    finished - float(raw.get("enqueued_at") or started),
+                )
+                await pipe.execute()
+
+        # 確認並刪除訊息，避免 API 金鑰留存在 stream 中
+        await r.xack(self.STREAM_KEY, self.GROUP_NAME, message_id)
+        await r.xdel(self.STREAM_KEY, message_id)
+
+    async def stats(self) -> dict:
+        r = get_async_redis_client()
+        try:
+            depth = await r.xlen(self.STREAM_KEY)
+            raw = await r.hgetall(self.STATS_KEY)
+        except RedisError as e:
+            logger.warning("讀取工作佇列統計失敗: %s", e)
+            return {"backend": "redis", "available": False}
+
+        counters = {
+            "submitted": int(raw.get("submitted", 0)),
+            "succeeded": int(raw.get("succeeded", 0)),
+            "failed": int(raw.get("failed", 0)),
+            "wait_seconds_total": float(raw.get("wait_seconds_total", 0)),
+            "latency_seconds_total": float(raw.get("latency_seconds_total", 0)),
+        }
+        return _format_stats(
+            backend="redis",
+            depth=depth,
+            running=self._running,
+            counters=counters,
+            finished=counters["succeeded"] + counters["failed"],
+        )
+
+
+def _format_stats(
+    backend: str, depth: int, running: int, counters: dict, finished: int
+) -> dict:
+    return {
+        "backend": backend,
+        "available": True,
+        "depth": depth,
+        "running": running,
+        "submitted": counters["submitted"],
+        "succeeded": counters["succeeded"],
+        "failed": counters["failed"],
+        "avg_wait_seconds": (
+            counters["wait_seconds_total"] / finished if finished else 0.0
+        ),
+        "avg_latency_seconds": (
+            counters["latency_seconds_total"] / finished if finished else 0.0
+        ),
+    }
+
+
+def create_job_queue() -> OptimizeJobQueue:
+    """依設定建立工作佇列"""
+    if settings.job_queue_backend == "redis":
+        return RedisJobQueue(
+            max_depth=settings.job_queue_max_depth,
+            result_ttl_seconds=settings.job_result_ttl_seconds,
+            claim_idle_seconds=settings.job_claim_idle_seconds,
+        )
+    return InMemoryJobQueue(
+        max_depth=settings.job_queue_max_depth,
+        result_ttl_seconds=settings.job_result_ttl_seconds,
+    )
+
+
+# 建立全域工作佇列實例
+optimize_job_queue = create_job_queue()
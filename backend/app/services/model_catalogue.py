@@ -0,0 +1,166 @@
+"""
+模型目錄服務
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from app.config import settings
+from app.schemas.model import Model
+from app.services.gemini_client import GeminiModel
+from app.services.gemini_client_pool import get_gemini_client
+from app.utils import compute_etag
+
+logger = logging.getLogger(__name__)
+
+
+def _display_name(model: GeminiModel) -> str:
+    """由枚舉名稱產生顯示名稱，例如 FLASH_LITE -> "Flash Lite" """
+    # 將底線替換為空格，然後轉換為標題格式，並將 "2 5" 替換為 "2.5"
+    return model.name.replace("_", " ").title().replace("2 5", "2.5")
+
+
+class ModelCatalogue:
+    """模型目錄
+
+    以 GeminiModel 枚舉作為後備，背景定期向上游取得模型列表並合併：
+    - 預先序列化回應內容並計算 ETag，讀取時不需任何運算
+    - 上游取得失敗時保留前一次的目錄，並以較短間隔重試
+    - 未設定 API 金鑰時只提供枚舉中的模型
+    """
+
+    def __init__(
+        self,
+        api_key: str = "",
+        ttl_seconds: float = 3600.0,
+        retry_seconds: float = 60.0,
+    ):
+        """初始化模型目錄
+
+        Args:
+            api_key: 用於查詢上游模型列表的 API 金鑰；空字串表示不查詢上游
+            ttl_seconds: 上游模型列表的重新整理間隔（秒）
+            retry_seconds: 上游查詢失敗後的重試間隔（秒）
+        """
+        self.api_key = api_key
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self._task: asyncio.Task | None = None
+        self._source = "fallback"
+        self._refreshed_at: float | None = None
+        self._refreshes = 0
+        self._failures = 0
+        self._publish(self._fallback_models())
+
+    @staticmethod
+    def _fallback_models() -> list[Model]:
+        """由 GeminiModel 枚舉產生後備模型列表"""
+        return [
+            Model(name=model.value, displayName=_display_name(model))
+            for model in GeminiModel
+        ]
+
+    def _publish(self, models: list[Model]) -> None:
+        """預先序列化模型列表並計算 ETag"""
+        body = json.dumps(
+            [model.model_dump() for model in models],
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode()
+        self._models = models
+        self._body = body
+        self._etag = compute_etag(body)
+
+    @property
+    def body(self) -> bytes:
+        """預先序列化的 JSON 回應內容"""
+        return self._body
+
+    @property
+    def etag(self) -> str:
+        """目前目錄內容的 ETag"""
+        return self._etag
+
+    def models(self) -> list[Model]:
+        """目前的模型列表"""
+        return list(self._models)
+
+    async def _fetch_upstream(self) -> list[Model]:
+        """向上游查詢支援 generateContent 的 Gemini 模型"""
+        upstream = await get_gemini_client(self.api_key).list_models_async()
+        models = []
+        for model in upstream:
+            name = (model.name or "").removeprefix("models/")
+            if not name.startswith("gemini"):
+                continue
+            if "generateContent" not in (model.supported_actions or []):
+                continue
+            models.append(Model(name=name, displayName=model.display_name or name))
+        return models
+
+    def _merge(self, upstream: list[Model]) -> list[Model]:
+        """合併枚舉與上游模型：枚舉模型在前並保持順序，上游新增的模型依名稱排序在後"""
+        upstream_by_name = {model.name: model for model in upstream}
+        merged = [
+            upstream_by_name.pop(model.name, model) for model in self._fallback_models()
+        ]
+        merged.extend(sorted(upstream_by_name.values(), key=lambda m: m.name))
+        return merged
+
+    async def refresh(self) -> bool:
+        """立即重新整理目錄，回傳是否成功"""
+        try:
+            upstream = await self._fetch_upstream()
+        except Exception as e:  # noqa: BLE001 - 上游失敗時保留既有目錄
+            self._failures += 1
+            logger.warning("模型目錄更新失敗，沿用現有列表: %s", str(e))
+            return False
+
+        self._publish(self._merge(upstream))
+        self._source = "upstream"
+        self._refreshed_at = time.time()
+        self._refreshes += 1
+        return True
+
+    async def _refresh_loop(self) -> None:
+        """背景定期重新整理目錄"""
+        while True:
+            ok = await self.refresh()
+            await asyncio.sleep(self.ttl_seconds if ok else self.retry_seconds)
+
+    def start(self) -> None:
+        """啟動背景重新整理（未設定 API 金鑰時不啟動）"""
+        if self.api_key and self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """停止背景重新整理"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        """回傳目錄狀態"""
+        return {
+            "source": self._source,
+            "models": len(self._models),
+            "etag": self._etag,
+            "refreshed_at": self._refreshed_at,
+            "refreshes": self._refreshes,
+            "failures": self._failures,
+        }
+
+
+# 建立全域模型目錄實例
+model_catalogue = ModelCatalogue(
+    api_key=settings.model_catalogue_api_key,
+    ttl_seconds=settings.model_catalogue_ttl_seconds,
+    retry_seconds=settings.model_catalogue_retry_seconds,
+)
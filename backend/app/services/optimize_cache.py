@@ -0,0 +1,182 @@
+"""
+Prompt 優化結果快取模組
+"""
+
+import hashlib
+import json
+import logging
+import time
+import unicodedata
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.utils import get_async_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """正規化原始 Prompt：Unicode NFC、去除前後空白並壓縮連續空白"""
+    return " ".join(unicodedata.normalize("NFC", prompt).split())
+
+
+def api_key_hash(api_key: str) -> str:
+    """計算 API 金鑰的雜湊，作為快取與請求合併的隔離範圍（不保存原始金鑰）"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def optimize_fingerprint(
+    template_content: str,
+    original_prompt: str,
+    model: str,
+    temperature: float,
+    max_output_tokens: int | None,
+) -> str:
+    """計算優化請求的指紋
+
+    輸入相同（模板內容、正規化後的 Prompt、模型、溫度、最大輸出令牌數）
+    的請求會得到相同的指紋，供結果快取與請求合併使用。
+    """
+    template_hash = hashlib.sha256(template_content.encode("utf-8")).hexdigest()
+    payload = json.dumps(
+        [
+            template_hash,
+            normalize_prompt(original_prompt),
+            model,
+            round(temperature, 4),
+            max_output_tokens,
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class OptimizeResultCache:
+    """以 Redis 儲存的 Prompt 優化結果快取
+
+    同一把 API 金鑰下，相同的模板內容、正規化後的原始 Prompt、模型、
+    溫度與最大輸出令牌數會對應到同一個快取項目；不同金鑰之間不共用結果，
+    避免以一把金鑰（可能無效或已停用）取得另一把金鑰產生的結果。
+
+    - 每個項目有 TTL，過期自動刪除
+    - 以 sorted set 記錄寫入時間，超過 max_entries 時淘汰最舊的項目
+    - Redis 發生錯誤時視為未命中，不影響優化流程
+    """
+
+    KEY_PREFIX = "optimize_cache"
+
+    def __init__(
+        self,
+        ttl_seconds: int = 3600,
+        max_entries: int = 10000,
+        max_temperature: float = 0.2,
+        enabled: bool = True,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_temperature = max_temperature
+        self.enabled = enabled
+
+    @property
+    def _index_key(self) -> str:
+        return f"{self.KEY_PREFIX}:index"
+
+    @property
+    def _stats_key(self) -> str:
+        return f"{self.KEY_PREFIX}:stats"
+
+    def should_use(self, temperature: float, use_cache: bool | None) -> bool:
+        """判斷此請求是否適用快取
+
+        - use_cache 為 True：強制使用快取
+        - use_cache 為 False：不使用快取
+        - use_cache 為 None：溫度不高於 max_temperature 時使用
+        """
+        if not self.enabled or use_cache is False:
+            return False
+        if use_cache:
+            return True
+        return temperature <= self.max_temperature
+
+    def build_key(
+        self,
+        api_key: str,
+        template_content: str,
+        original_prompt: str,
+        model: str,
+        temperature: float,
+        max_output_tokens: int | None,
+    ) -> str:
+        """建立快取鍵（以 API 金鑰雜湊區隔）"""
+        fingerprint = optimize_fingerprint(
+            template_content, original_prompt, model, temperature, max_output_tokens
+        )
+        return f"{self.KEY_PREFIX}:entry:{api_key_hash(api_key)}:{fingerprint}"
+
+    async def get(self, key: str) -> dict | None:
+        """讀取快取結果，未命中時回傳 None"""
+        r = get_async_redis_client()
+        try:
+            cached = await r.get(key)
+            await r.hincrby(self._stats_key, "hits" if cached else "misses", 1)
+        except RedisError as e:
+            logger.warning("讀取優化快取失敗: %s", e)
+            return None
+        return json.loads(cached) if cached else None
+
+    async def set(self, key: str, result: dict) -> None:
+        """寫入快取結果，並淘汰超過容量上限的舊項目"""
+        r = get_async_redis_client()
+        now = time.time()
+        try:
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.set(
+                    key, json.dumps(result, ensure_ascii=False), ex=self.ttl_seconds
+                )
+                pipe.zadd(self._index_key, {key: now})
+                # 索引中已過期的項目一併移除
+                pipe.zremrangebyscore(self._index_key, 0, now - self.ttl_seconds)
+                pipe.zcard(self._index_key)
+                results = await pipe.execute()
+
+            overflow = results[-1] - self.max_entries
+            if overflow > 0:
+                evicted = await r.zpopmin(self._index_key, overflow)
+                if evicted:
+                    await r.delete(*(member for member, _ in evicted))
+                    await r.hincrby(self._stats_key, "evictions", len(evicted))
+        except RedisError as e:
+            logger.warning("寫入優化快取失敗: %s", e)
+
+    async def stats(self) -> dict:
+        """回傳快取命中統計（跨 worker 共用）"""
+        r = get_async_redis_client()
+        try:
+            raw = await r.hgetall(self._stats_key)
+            size = await r.zcard(self._index_key)
+        except RedisError as e:
+            logger.warning("讀取優化快取統計失敗: %s", e)
+            return {"available": False}
+
+        hits = int(raw.get("hits", 0))
+        misses = int(raw.get("misses", 0))
+        total = hits + misses
+        return {
+            "available": True,
+            "size": size,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "evictions": int(raw.get("evictions", 0)),
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+# 建立全域快取實例
+optimize_result_cache = OptimizeResultCache(
+    ttl_seconds=settings.optimize_cache_ttl_seconds,
+    max_entries=settings.optimize_cache_max_entries,
+    max_temperature=settings.optimize_cache_max_temperature,
+    enabled=settings.optimize_cache_enabled,
+)
@@ -0,0 +1,248 @@
+"""
+Prompt 內容去重服務
+"""
+
+from collections import Counter
+from collections.abc import Iterable
+import hashlib
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.models import PromptBlob, PromptHistory
+from app.services.history_compression import HistoryCompressor, history_compressor
+
+# 去重的欄位：(文字欄位, 雜湊欄位)
+BODY_FIELDS = (
+    ("original_prompt", "original_blob_hash"),
+    ("optimized_prompt", "optimized_blob_hash"),
+)
+
+# 釋放內容時每個 SQL 陳述式處理的雜湊數
+_RELEASE_CHUNK_SIZE = 500
+
+
+def body_hash(text: str) -> str:
+    """內容的 SHA-256 雜湊（十六進位）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def full_text_expression(text_column, hash_column, dialect: str):
+    """在資料庫內取得完整內容的運算式（供 LIKE 過濾使用）"""
+    if dialect == "sqlite":
+        body = func.history_text(PromptBlob.body, PromptBlob.body_z)
+    else:
+        body = PromptBlob.body
+    return func.coalesce(
+        select(body).where(PromptBlob.blob_hash == hash_column).scalar_subquery(),
+        text_column,
+    )
+
+
+class PromptBlobStore:
+    """以內容雜湊儲存長內容，相同內容只存一次
+
+    - 內容（UTF-8）達 min_bytes 時存入 prompt_blobs，歷史記錄只保留
+      前 preview_chars 個字元的預覽與內容雜湊
+    - 每個參考遞增 ref_count；刪除歷史記錄時遞減，歸零即刪除內容
+    - 新內容寫入前先交給壓縮器壓縮；已存在的內容只遞增計數，不重複壓縮
+    - 所有操作只執行 SQL、不提交交易，由呼叫端與歷史記錄在同一交易內提交
+    """
+
+    def __init__(
+        self,
+        min_bytes: int = 512,
+        preview_chars: int = 200,
+        compressor: HistoryCompressor = history_compressor,
+    ):
+        """初始化內容儲存
+
+        Args:
+            min_bytes: 內容（UTF-8）達此大小才移至 prompt_blobs
+            preview_chars: 歷史記錄文字欄位保留的字元數
+            compressor: 新內容使用的壓縮器
+        """
+        self.min_bytes = min_bytes
+        self.preview_chars = preview_chars
+        self.compressor = compressor
+        self.stored = 0
+        self.deduplicated = 0
+        self.released = 0
+        self.deleted = 0
+
+    def store_bodies(self, session: Session, histories: list[PromptHistory]) -> None:
+        """將尚未寫入的歷史記錄中的長內容移至 prompt_blobs（原地修改）
+
+        必須在歷史記錄加入 session 之前呼叫：內容需先於歷史記錄寫入，
+        外鍵與 PostgreSQL 的 tsvector 觸發器才能取得完整內容。SQLite 的全文檢索
+        索引由呼叫端以原本的完整內容另外寫入（見 history_search.index_history_bodies）。
+        """
+        refs: Counter[str] = Counter()
+        contents: dict[str, str] = {}
+        for history in histories:
+            for text_field, hash_field in BODY_FIELDS:
+                text = getattr(history, text_field)
+                if getattr(history, hash_field) is not None or text is None:
+                    continue
+                if len(text.encode("utf-8")) < self.min_bytes:
+                    continue
+                digest = body_hash(text)
+                contents[digest] = text
+                refs[digest] += 1
+                setattr(history, hash_field, digest)
+                setattr(history, text_field, text[: self.preview_chars])
+        if refs:
+            self._acquire(session, refs, contents)
+
+    def _acquire(
+        self, session: Session, refs: Counter[str], contents: dict[str, str]
+    ) -> None:
+        """遞增參考計數，不存在的內容才壓縮並新增
+
+        依雜湊排序處理，讓並行的交易以相同順序鎖定資料列。
+        """
+        dialect = session.get_bind().dialect.name
+        insert = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}.get(dialect)
+        table = PromptBlob.__table__
+
+        for digest in sorted(refs):
+            result = session.execute(
+                update(table)
+                .where(table.c.blob_hash == digest)
+                .values(ref_count=table.c.ref_count + refs[digest])
+            )
+            if result.rowcount:
+                self.deduplicated += refs[digest]
+                continue
+
+            text = contents[digest]
+            blob = self.compressor.compress(text)
+            values = {
+                "blob_hash": digest,
+                "body": text if blob is None else None,
+                "body_z": blob,
+                "size_bytes": len(text.encode("utf-8")),
+                "ref_count": refs[digest],
+            }
+            if insert is not None:
+                # 並行交易可能已新增相同內容
+                statement = insert(table).values(**values)
+                statement = statement.on_conflict_do_update(
+                    index_elements=["blob_hash"],
+                    set_={
+                        "ref_count": table.c.ref_count + statement.excluded.ref_count
+                    },
+                )
+                session.execute(statement)
+            else:
+                session.add(PromptBlob(**values))
+            self.stored += 1
+            self.deduplicated += refs[digest] - 1
+
+    def release(self, session: Session, hashes: Iterable[str | None]) -> None:
+        """遞減參考計數並刪除已無參考的內容
+
+        必須在歷史記錄刪除之後呼叫，內容才不會在仍被參考（外鍵）時刪除。
+
+        Args:
+            session: 資料庫 session
+            hashes: 已刪除歷史記錄的內容雜湊（可含 None）
+        """
+        self.release_counts(
+            session, Counter(digest for digest in hashes if digest is not None)
+        )
+
+    def release_counts(self, session: Session, refs: Counter[str]) -> None:
+        """依 {雜湊: 參考數} 遞減參考計數並刪除已無參考的內容"""
+        table = PromptBlob.__table__
+        digests = sorted(refs)
+
+        # 分段處理，避免批次刪除時 IN 清單超過資料庫的參數上限
+        for index in range(0, len(digests), _RELEASE_CHUNK_SIZE):
+            chunk = digests[index : index + _RELEASE_CHUNK_SIZE]
+            # 相同遞減量的雜湊合併為同一個 UPDATE
+            by_count: dict[int, list[str]] = {}
+            for digest in chunk:
+                by_count.setdefault(refs[digest], []).append(digest)
+            for count, same_count in by_count.items():
+                session.execute(
+                    update(table)
+                    .where(table.c.blob_hash.in_(same_count))
+                    .values(ref_count=table.c.ref_count - count)
+                )
+            result = session.execute(
+                delete(table).where(
+                    table.c.blob_hash.in_(chunk), table.c.ref_count <= 0
+                )
+            )
+            self.deleted += result.rowcount
+        self.released += sum(refs.values())
+
+    def release_histories(
+        self, session: Session, histories: Iterable[PromptHistory]
+    ) -> None:
+        """釋放已刪除歷史記錄所參考的內容"""
+        self.release(
+            session,
+            (
+                getattr(history, hash_field)
+                for history in histories
+                for _, hash_field in BODY_FIELDS
+            ),
+        )
+
+    def load_bodies(
+        self, session: Session, histories: Iterable[PromptHistory]
+    ) -> dict[str, str]:
+        """以單一查詢取得歷史記錄參考的完整內容，回傳 {雜湊: 內容}"""
+        hashes = {
+            digest
+            for history in histories
+            for _, hash_field in BODY_FIELDS
+            if (digest := getattr(history, hash_field)) is not None
+        }
+        if not hashes:
+            return {}
+        rows = session.exec(
+            select(PromptBlob.blob_hash, PromptBlob.body, PromptBlob.body_z).where(
+                PromptBlob.blob_hash.in_(hashes)
+            )
+        ).all()
+        return {
+            digest: self.compressor.full_text(body, body_z)
+            for digest, body, body_z in rows
+        }
+
+    @staticmethod
+    def bodies(history: PromptHistory, loaded: dict[str, str]) -> tuple[str, str]:
+        """由 load_bodies 的結果取得歷史記錄的完整原始與優化後 Prompt"""
+        original, optimized = (
+            loaded.get(getattr(history, hash_field), getattr(history, text_field))
+            if getattr(history, hash_field) is not None
+            else getattr(history, text_field)
+            for text_field, hash_field in BODY_FIELDS
+        )
+        return original, optimized
+
+    def stats(self) -> dict:
+        """回傳去重統計"""
+        references = self.stored + self.deduplicated
+        return {
+            "min_bytes": self.min_bytes,
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "dedup_ratio": round(self.deduplicated / references, 3)
+            if references
+            else None,
+            "released": self.released,
+            "deleted": self.deleted,
+        }
+
+
+# 建立全域內容儲存實例
+prompt_blob_store = PromptBlobStore(
+    min_bytes=settings.history_blob_min_bytes,
+    preview_chars=settings.history_preview_chars,
+)
@@ -2,11 +2,59 @@
 Prompt 優化服務模組
 """
 
+import asyncio
+from collections.abc import AsyncGenerator, Callable, Coroutine, Iterable
+from dataclasses import asdict, dataclass
+import time
+from typing import TypeVar
+
 from sqlmodel import Session, select
 
 from app.models import PromptHistory, Template
-from app.schemas.optimize import PromptOptimizeRequest, PromptOptimizeResponse
-from app.services.gemini_client import GeminiClient
+from app.schemas.optimize import (
+    OptimizeUsage,
+    PromptOptimizeBatchItem,
+    PromptOptimizeBatchRequest,
+    PromptOptimizeModelResult,
+    PromptOptimizeRequest,
+    PromptOptimizeResponse,
+)
+from app.services.gemini_client import GeminiClient, GenerationUsage
+from app.services.gemini_resilience import GeminiUnavailableError
+from app.services.history_search import index_history_bodies
+from app.services.history_writer import HistoryWriter
+from app.services.optimize_cache import (
+    OptimizeResultCache,
+    api_key_hash,
+    optimize_fingerprint,
+)
+from app.services.prompt_blobs import prompt_blob_store
+from app.services.single_flight import SingleFlight
+from app.services.token_budget import TokenBudget
+from app.services.usage_rollup import record_usage
+
+T = TypeVar("T")
+
+# 命中快取或共用其他請求的上游呼叫時，本次請求沒有產生上游用量
+_NO_UPSTREAM_USAGE = {
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "total_tokens": 0,
+    "latency_ms": None,
+    "cached_tokens": 0,
+}
+
+# 寫入歷史記錄的用量欄位
+_HISTORY_USAGE_FIELDS = ("input_tokens", "output_tokens", "total_tokens", "latency_ms")
+
+
+@dataclass
+class OptimizeStream:
+    """串流優化的文字片段產生器、實際使用的模型與（依預算截斷後的）輸入"""
+
+    chunks: AsyncGenerator[str, None]
+    model: str
+    original_prompt: str
 
 
 class PromptOptimizerService:
@@ -14,9 +62,21 @@ class PromptOptimizerService:
     提供 Prompt 優化的服務
     """
 
-    def __init__(self, session: Session, gemini_client: GeminiClient):
+    def __init__(
+        self,
+        session: Session,
+        gemini_client: GeminiClient,
+        result_cache: OptimizeResultCache | None = None,
+        single_flight: SingleFlight | None = None,
+        token_budget: TokenBudget | None = None,
+        history_writer: HistoryWriter | None = None,
+    ):
         self.session = session
         self.gemini_client = gemini_client
+        self.result_cache = result_cache
+        self.single_flight = single_flight
+        self.token_budget = token_budget
+        self.history_writer = history_writer
 
     async def optimize_prompt(
         self, user_id: int | None, request: PromptOptimizeRequest
@@ -30,47 +90,447 @@ class PromptOptimizerService:
         4. 儲存歷史記錄(如果用戶已登入)
         5. 返回結果
         """
-        # 1. 獲取模板
+        # 1. 獲取模板並驗證必要參數
+        template, model, temperature, template_id = await self._prepare_request(
+            user_id, request
+        )
+        if request.fan_out_mode == "all":
+            raise ValueError("all 模式需以串流方式回傳，請改用 optimize_prompt_fan_out")
+        prompt = self._fit_prompt(template, request.original_prompt)
+        max_output_tokens = self._output_tokens(request.max_output_tokens)
+
+        # 2. 查詢快取，未命中時調用 Gemini API 進行優化
+        models = self._resolve_models(request)
+        if len(models) > 1:
+            model, optimized_result, cache_hit = await self._optimize_first(
+                template.content,
+                prompt,
+                models,
+                temperature,
+                max_output_tokens=max_output_tokens,
+                use_cache=request.use_cache,
+            )
+        else:
+            optimized_result, cache_hit = await self._optimize_text(
+                template.content,
+                prompt,
+                model,
+                temperature,
+                max_output_tokens=max_output_tokens,
+                use_cache=request.use_cache,
+            )
+
+        # 3. 儲存歷史記錄（命中快取時同樣寫入）
+        if user_id is not None:
+            await self._save_history(
+                user_id=user_id,
+                original_prompt=prompt,
+                optimized_prompt=optimized_result["optimized_prompt"],
+                template_id=template_id,
+                model_used=model,
+                temperature=temperature,
+                usage=optimized_result["usage"],
+                cache_hit=cache_hit,
+            )  # 4. 返回結果
+        return PromptOptimizeResponse(
+            optimized_prompt=optimized_result["optimized_prompt"],
+            improvement_analysis=optimized_result["improvement_analysis"],
+            original_prompt=prompt,
+            model=model,
+            cache_hit=cache_hit,
+            usage=OptimizeUsage(**optimized_result["usage"]),
+        )
+
+    async def optimize_prompt_stream(
+        self, user_id: int | None, request: PromptOptimizeRequest
+    ) -> OptimizeStream:
+        """
+        以串流方式優化 Prompt
+
+        模板與參數驗證在 await 時即完成（錯誤會直接拋出），
+        回傳的產生器逐段 yield 優化結果；串流完整結束後才儲存歷史記錄。
+        提前關閉產生器會停止上游生成，且不會寫入歷史記錄；
+        上游未回傳任何文字時拋出 RuntimeError，同樣不寫入歷史記錄。
+        """
+        template, model, temperature, template_id = await self._prepare_request(
+            user_id, request
+        )
+        if len(self._resolve_models(request)) > 1:
+            raise ValueError("串流模式僅支援單一模型")
+        prompt = self._fit_prompt(template, request.original_prompt)
+        chunks = self._stream_and_save(
+            user_id=user_id,
+            template_content=template.content,
+            original_prompt=prompt,
+            template_id=template_id,
+            model=model,
+            temperature=temperature,
+            max_output_tokens=self._output_tokens(request.max_output_tokens),
+        )
+        return OptimizeStream(chunks=chunks, model=model, original_prompt=prompt)
+
+    async def optimize_prompt_fan_out(
+        self, user_id: int | None, request: PromptOptimizeRequest
+    ) -> AsyncGenerator[PromptOptimizeModelResult, None]:
+        """
+        同時以多個模型優化同一個 Prompt（fan_out_mode="all"）
+
+        驗證在 await 時即完成（錯誤會直接拋出）。
+        回傳的產生器依完成順序 yield 每個模型的結果與延遲；
+        所有成功結果的歷史記錄在結束時以單一交易寫入。
+        """
+        template, _, temperature, template_id = await self._prepare_request(
+            user_id, request
+        )
+        models = self._resolve_models(request)
+        prompt = self._fit_prompt(template, request.original_prompt)
+        max_output_tokens = self._output_tokens(request.max_output_tokens)
+
+        async def run_model(model: str) -> PromptOptimizeModelResult:
+            started = time.monotonic()
+            try:
+                result, cache_hit = await self._optimize_text(
+                    template.content,
+                    prompt,
+                    model,
+                    temperature,
+                    max_output_tokens=max_output_tokens,
+                    use_cache=request.use_cache,
+                )
+            except (ValueError, RuntimeError) as e:
+                return PromptOptimizeModelResult(
+                    model=model,
+                    latency_ms=int((time.monotonic() - started) * 1000),
+                    error=str(e),
+                )
+            return PromptOptimizeModelResult(
+                model=model,
+                optimized_prompt=result["optimized_prompt"],
+                improvement_analysis=result["improvement_analysis"],
+                cache_hit=cache_hit,
+                usage=OptimizeUsage(**result["usage"]),
+                latency_ms=int((time.monotonic() - started) * 1000),
+            )
+
+        def to_history(item: PromptOptimizeModelResult) -> PromptHistory | None:
+            if user_id is None or item.optimized_prompt is None:
+                return None
+            return PromptHistory(
+                user_id=user_id,
+                original_prompt=prompt,
+                optimized_prompt=item.optimized_prompt,
+                template_id=template_id,
+                model_used=item.model,
+                temperature=temperature,
+                **self._usage_columns(item.usage, item.cache_hit),
+            )
+
+        return self._yield_as_completed(
+            (run_model(model) for model in models), to_history
+        )
+
+    async def optimize_prompts_batch(
+        self,
+        user_id: int | None,
+        request: PromptOptimizeBatchRequest,
+        concurrency: int,
+    ) -> AsyncGenerator[PromptOptimizeBatchItem, None]:
+        """
+        批次優化多個 Prompt
+
+        模板只查詢一次，驗證在 await 時即完成（錯誤會直接拋出）。
+        回傳的產生器依完成順序 yield 每筆結果，同時最多 concurrency 個上游呼叫；
+        單筆失敗不影響其他項目。所有成功項目的歷史記錄在結束時以單一交易寫入。
+        """
+        if concurrency < 1:
+            raise ValueError("併發數必須大於 0")
+
+        template, model, temperature, template_id = await self._prepare_request(
+            user_id, request
+        )
+        return self._run_batch(
+            user_id=user_id,
+            template=template,
+            prompts=request.prompts,
+            template_id=template_id,
+            model=model,
+            temperature=temperature,
+            max_output_tokens=self._output_tokens(request.max_output_tokens),
+            use_cache=request.use_cache,
+            concurrency=concurrency,
+        )
+
+    async def _prepare_request(
+        self,
+        user_id: int | None,
+        request: PromptOptimizeRequest | PromptOptimizeBatchRequest,
+    ) -> tuple[Template, str, float, int]:
+        """獲取模板並驗證必要參數"""
         template = await self._get_template(user_id, request.template_id)
 
-        # 驗證必要參數
-        if not request.model:
+        # 驗證必要參數（提供 models 時以第一個模型為主要模型）
+        models = getattr(request, "models", None) or []
+        model = request.model or (models[0] if models else None)
+        if not model:
             raise ValueError("模型名稱不能為空")
 
         if request.temperature is None:
             raise ValueError("溫度參數不能為空")
 
-        model = request.model
-        temperature = request.temperature
         # template_id 已在 _get_template 中驗證，確保不為 None
         template_id = request.template_id
         if template_id is None:
             raise ValueError("模板 ID 不能為空")
 
-        # 2. 調用 Gemini API 進行優化
-        optimized_result = await self._call_gemini_api(
-            template.content,
-            request.original_prompt,
+        return template, model, request.temperature, template_id
+
+    @staticmethod
+    def _resolve_models(request: PromptOptimizeRequest) -> list[str]:
+        """回傳要呼叫的模型列表（去除重複並保留順序）"""
+        models = request.models or ([request.model] if request.model else [])
+        return list(dict.fromkeys(models))
+
+    def _fit_prompt(self, template: Template, prompt: str) -> str:
+        """依 token 預算檢查輸入，必要時截斷（未設定預算時原樣回傳）"""
+        if self.token_budget is None:
+            return prompt
+        return self.token_budget.fit_prompt(template, prompt)
+
+    def _output_tokens(self, requested: int | None) -> int | None:
+        """依 token 預算決定最大輸出 token 數（未設定預算時原樣回傳）"""
+        if self.token_budget is None:
+            return requested
+        return self.token_budget.output_tokens(requested)
+
+    @staticmethod
+    def _usage_columns(usage: OptimizeUsage | None, cache_hit: bool) -> dict:
+        """將用量轉換為歷史記錄欄位"""
+        columns = usage.model_dump(include=set(_HISTORY_USAGE_FIELDS)) if usage else {}
+        return {**columns, "cache_hit": cache_hit}
+
+    async def _optimize_text(
+        self,
+        template_content: str,
+        original_prompt: str,
+        model: str,
+        temperature: float,
+        max_output_tokens: int | None = None,
+        use_cache: bool | None = None,
+    ) -> tuple[dict, bool]:
+        """查詢快取，未命中時調用 Gemini API，回傳 (優化結果, 是否命中快取)"""
+        cache_key = None
+        if self.result_cache and self.result_cache.should_use(temperature, use_cache):
+            cache_key = self.result_cache.build_key(
+                self.gemini_client.api_key,
+                template_content,
+                original_prompt,
+                model,
+                temperature,
+                max_output_tokens,
+            )
+            cached_result = await self.result_cache.get(cache_key)
+            if cached_result is not None:
+                return {**cached_result, "usage": _NO_UPSTREAM_USAGE}, True
+
+        optimized_result = await self._call_gemini_api_shared(
+            template_content,
+            original_prompt,
             model,
             temperature,
-            max_output_tokens=request.max_output_tokens,
+            max_output_tokens=max_output_tokens,
+        )
+        if cache_key and self.result_cache:
+            # 用量屬於本次呼叫，不寫入快取
+            await self.result_cache.set(
+                cache_key,
+                {k: v for k, v in optimized_result.items() if k != "usage"},
+            )
+        return optimized_result, False
+
+    async def _run_batch(
+        self,
+        user_id: int | None,
+        template: Template,
+        prompts: list[str],
+        template_id: int,
+        model: str,
+        temperature: float,
+        max_output_tokens: int | None,
+        use_cache: bool | None,
+        concurrency: int,
+    ) -> AsyncGenerator[PromptOptimizeBatchItem, None]:
+        """以有限併發執行批次優化，依完成順序 yield 結果"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_item(index: int, prompt: str) -> PromptOptimizeBatchItem:
+            async with semaphore:
+                try:
+                    # 超過輸入預算的單筆項目回傳錯誤，不影響其他項目
+                    prompt = self._fit_prompt(template, prompt)
+                    result, cache_hit = await self._optimize_text(
+                        template.content,
+                        prompt,
+                        model,
+                        temperature,
+                        max_output_tokens=max_output_tokens,
+                        use_cache=use_cache,
+                    )
+                except (ValueError, RuntimeError) as e:
+                    return PromptOptimizeBatchItem(
+                        index=index, original_prompt=prompt, error=str(e)
+                    )
+            return PromptOptimizeBatchItem(
+                index=index,
+                original_prompt=prompt,
+                optimized_prompt=result["optimized_prompt"],
+                improvement_analysis=result["improvement_analysis"],
+                cache_hit=cache_hit,
+                usage=OptimizeUsage(**result["usage"]),
+            )
+
+        def to_history(item: PromptOptimizeBatchItem) -> PromptHistory | None:
+            if user_id is None or item.optimized_prompt is None:
+                return None
+            return PromptHistory(
+                user_id=user_id,
+                original_prompt=item.original_prompt,
+                optimized_prompt=item.optimized_prompt,
+                template_id=template_id,
+                model_used=model,
+                temperature=temperature,
+                **self._usage_columns(item.usage, item.cache_hit),
+            )
+
+        async for item in self._yield_as_completed(
+            (run_item(index, prompt) for index, prompt in enumerate(prompts)),
+            to_history,
+        ):
+            yield item
+
+    async def _yield_as_completed(
+        self,
+        coroutines: Iterable[Coroutine[None, None, T]],
+        to_history: Callable[[T], PromptHistory | None],
+    ) -> AsyncGenerator[T, None]:
+        """同時執行多個工作並依完成順序 yield 結果
+
+        結束時（包含用戶端中斷）取消尚未完成的工作，
+        已完成結果的歷史記錄以單一交易寫入。
+        """
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        histories: list[PromptHistory] = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                history = to_history(item)
+                if history is not None:
+                    histories.append(history)
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            if histories:
+                await self._save_history_batch(histories)
+
+    async def _optimize_first(
+        self,
+        template_content: str,
+        prompt: str,
+        models: list[str],
+        temperature: float,
+        max_output_tokens: int | None = None,
+        use_cache: bool | None = None,
+    ) -> tuple[str, dict, bool]:
+        """同時呼叫多個模型，回傳最快完成的有效結果 (模型, 優化結果, 是否命中快取)
+
+        取得結果後取消其餘模型並等待其結束；全部失敗時拋出最後一個錯誤。
+        """
+        tasks = {
+            asyncio.ensure_future(
+                self._optimize_text(
+                    template_content,
+                    prompt,
+                    model,
+                    temperature,
+                    max_output_tokens=max_output_tokens,
+                    use_cache=use_cache,
+                )
+            ): model
+            for model in models
+        }
+        pending = set(tasks)
+        last_error: BaseException | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    result, cache_hit = task.result()
+                    if result["optimized_prompt"]:
+                        return tasks[task], result, cache_hit
+        finally:
+            # 等待被取消的模型結束（釋放併發限制與連線），並取回所有錯誤，
+            # 避免回應送出後才清理或出現未取回的例外
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("所有模型皆未回傳有效結果")
+
+    async def _stream_and_save(
+        self,
+        user_id: int | None,
+        template_content: str,
+        original_prompt: str,
+        template_id: int,
+        model: str,
+        temperature: float,
+        max_output_tokens: int | None = None,
+    ) -> AsyncGenerator[str, None]:
+        """轉送上游串流，完成後儲存歷史記錄"""
+        chunks: list[str] = []
+        usage = GenerationUsage()
+        stream = self.gemini_client.generate_content_stream_async(
+            model=model,
+            system_instruction=template_content,
+            content=original_prompt,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            usage=usage,
         )
+        try:
+            async for text in stream:
+                chunks.append(text)
+                yield text
+        except GeminiUnavailableError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Gemini API 呼叫失敗: {e}") from e
+        finally:
+            await stream.aclose()
+
+        if not chunks:
+            # 例如輸出 token 上限過低或內容被安全過濾，不儲存空白結果
+            raise RuntimeError("模型未回傳任何內容")
 
-        # 3. 儲存歷史記錄
         if user_id is not None:
             await self._save_history(
                 user_id=user_id,
-                original_prompt=request.original_prompt,
-                optimized_prompt=optimized_result["optimized_prompt"],
+                original_prompt=original_prompt,
+                optimized_prompt="".join(chunks),
                 template_id=template_id,
                 model_used=model,
                 temperature=temperature,
-            )  # 4. 返回結果
-        return PromptOptimizeResponse(
-            optimized_prompt=optimized_result["optimized_prompt"],
-            improvement_analysis=optimized_result["improvement_analysis"],
-            original_prompt=request.original_prompt,
-        )
+                usage=asdict(usage),
+            )
 
     async def _get_template(
         self, user_id: int | None, template_id: int | None
@@ -114,7 +574,8 @@ class PromptOptimizerService:
     ) -> dict:
         """調用 Gemini API"""
         try:
-            optimized_text = self.gemini_client.generate_content(
+            client = self.gemini_client
+            optimized_text, usage = await client.generate_content_with_usage_async(
                 model=model,
                 system_instruction=template_content,
                 content=user_prompt,
@@ -122,15 +583,59 @@ class PromptOptimizerService:
                 max_output_tokens=max_output_tokens,
             )
 
+            # 輸出全被思考 token 用完或觸發截斷時，上游不會回傳文字
+            if not optimized_text:
+                raise RuntimeError("模型未回傳內容，可能已達輸出 token 上限")
+
             # 這裡需要進一步處理 Gemini 回應，提取優化後的 prompt 和分析
             # 暫時簡化處理
             return {
                 "optimized_prompt": optimized_text,
                 "improvement_analysis": "已根據模板進行優化",
+                "usage": asdict(usage),
             }
 
+        except GeminiUnavailableError:
+            raise
         except Exception as e:
-            raise RuntimeError(f"Gemini API 呼叫失敗: {str(e)}") from e
+            raise RuntimeError(f"Gemini API 呼叫失敗: {e!s}") from e
+
+    async def _call_gemini_api_shared(
+        self,
+        template_content: str,
+        user_prompt: str,
+        model: str,
+        temperature: float,
+        max_output_tokens: int | None = None,
+    ) -> dict:
+        """調用 Gemini API，並與相同的進行中請求共用同一次上游呼叫"""
+
+        leader = False
+
+        def call():
+            nonlocal leader
+            leader = True
+            return self._call_gemini_api(
+                template_content,
+                user_prompt,
+                model,
+                temperature,
+                max_output_tokens=max_output_tokens,
+            )
+
+        if self.single_flight is None:
+            return await call()
+
+        # 只合併同一把 API 金鑰的請求，避免共用其他呼叫者的結果
+        fingerprint = optimize_fingerprint(
+            template_content, user_prompt, model, temperature, max_output_tokens
+        )
+        key = f"{api_key_hash(self.gemini_client.api_key)}:{fingerprint}"
+        result = await self.single_flight.do(key, call)
+        # 共用其他請求的結果時，上游用量已記在該請求上
+        if not leader:
+            return {**result, "usage": _NO_UPSTREAM_USAGE}
+        return result
 
     async def _save_history(
         self,
@@ -140,8 +645,13 @@ class PromptOptimizerService:
         template_id: int,
         model_used: str,
         temperature: float,
+        usage: dict | None = None,
+        cache_hit: bool = False,
     ) -> PromptHistory:
-        """儲存優化歷史記錄"""
+        """儲存優化歷史記錄，並在同一交易內遞增用量彙總
+
+        啟用延遲寫入時只放入緩衝區，回傳的記錄尚未有 history_id。
+        """
         history = PromptHistory(
             user_id=user_id,
             original_prompt=original_prompt,
@@ -149,10 +659,40 @@ class PromptOptimizerService:
             template_id=template_id,
             model_used=model_used,
             temperature=temperature,
+            **{field: (usage or {}).get(field) for field in _HISTORY_USAGE_FIELDS},
+            cache_hit=cache_hit,
         )
+        if self.history_writer and await self.history_writer.submit([history]):
+            return history
 
-        self.session.add(history)
+        self._write_histories([history])
         self.session.commit()
         self.session.refresh(history)
 
         return history
+
+    async def _save_history_batch(self, histories: list[PromptHistory]) -> None:
+        """以單一交易批次寫入多筆優化歷史記錄與用量彙總"""
+        if self.history_writer and await self.history_writer.submit(histories):
+            return
+
+        self._write_histories(histories)
+        self.session.commit()
+
+    def _write_histories(self, histories: list[PromptHistory]) -> None:
+        """在目前交易內寫入內容、歷史記錄、全文檢索索引與用量彙總（不提交）"""
+        # store_bodies 會將長內容改為預覽，索引需使用原本的完整內容
+        bodies = [
+            (history.original_prompt, history.optimized_prompt) for history in histories
+        ]
+        prompt_blob_store.store_bodies(self.session, histories)
+        self.session.add_all(histories)
+        self.session.flush()
+        index_history_bodies(
+            self.session,
+            (
+                (history.history_id, *body)
+                for history, body in zip(histories, bodies, strict=True)
+            ),
+        )
+        record_usage(self.session, histories)
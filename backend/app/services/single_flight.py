@@ -0,0 +1,171 @@
+"""
+相同請求合併（single-flight）模組
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+import json
+import logging
+import uuid
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.utils import get_async_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """合併指紋相同的進行中請求
+
+    同一時間指紋相同的呼叫只會有一個真正執行（leader），
+    其餘呼叫等待並共用其結果。
+
+    - worker 內：以 asyncio.Task 合併，等待者取消不影響共用的呼叫
+    - 跨 worker（可選）：以 Redis 鎖選出 leader，結果寫入短效結果鍵，
+      其他 worker 輪詢讀取
+    - leader 失敗（RuntimeError、ValueError）時，等待者各自重新執行，
+      避免單一次暫時性的上游錯誤影響所有等待者
+
+    結果必須可 JSON 序列化（跨 worker 模式需要）。
+    """
+
+    KEY_PREFIX = "single_flight"
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        use_redis: bool = False,
+        lock_ttl_seconds: float = 60.0,
+        result_ttl_seconds: float = 10.0,
+        poll_interval_seconds: float = 0.05,
+    ):
+        self.enabled = enabled
+        self.use_redis = use_redis
+        self.lock_ttl_seconds = lock_ttl_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.remote_shared = 0
+        self.fallbacks = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[dict]]) -> dict:
+        """執行 fn，若已有相同 key 的呼叫進行中則共用其結果"""
+        if not self.enabled:
+            return await fn()
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(self._run(key, fn))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            # shield：leader 的呼叫端取消時，其他等待者仍能取得結果
+            return await asyncio.shield(task)
+
+        self.shared += 1
+        try:
+            return await asyncio.shield(task)
+        except (RuntimeError, ValueError):
+            self.fallbacks += 1
+            return await fn()
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[dict]]) -> dict:
+        if not self.use_redis:
+            return await fn()
+        return await self._run_across_workers(key, fn)
+
+    async def _run_across_workers(
+        self, key: str, fn: Callable[[], Awaitable[dict]]
+    ) -> dict:
+        """透過 Redis 鎖與結果鍵在 worker 之間合併請求"""
+        r = get_async_redis_client()
+        lock_key = f"{self.KEY_PREFIX}:lock:{key}"
+        result_key = f"{self.KEY_PREFIX}:result:{key}"
+        token = uuid.uuid4().hex
+
+        try:
+            acquired = await r.set(
+                lock_key, token, nx=True, px=int(self.lock_ttl_seconds * 1000)
+            )
+        except RedisError as e:
+            logger.warning("取得 single-flight 鎖失敗: %s", e)
+            return await fn()
+
+        if acquired:
+            try:
+                result = await fn()
+                await self._publish(result_key, result)
+                return result
+            finally:
+                await self._release(lock_key, token)
+
+        result = await self._wait_for_result(lock_key, result_key)
+        if result is not None:
+            self.remote_shared += 1
+            return result
+
+        # leader 失敗或逾時，自行執行
+        self.fallbacks += 1
+        return await fn()
+
+    async def _publish(self, result_key: str, result: dict) -> None:
+        r = get_async_redis_client()
+        try:
+            await r.set(
+                result_key,
+                json.dumps(result, ensure_ascii=False),
+                px=int(self.result_ttl_seconds * 1000),
+            )
+        except RedisError as e:
+            logger.warning("寫入 single-flight 結果失敗: %s", e)
+
+    async def _release(self, lock_key: str, token: str) -> None:
+        r = get_async_redis_client()
+        try:
+            # 只釋放自己持有的鎖（鎖可能已逾時並被其他 worker 取得）
+            if await r.get(lock_key) == token:
+                await r.delete(lock_key)
+        except RedisError as e:
+            logger.warning("釋放 single-flight 鎖失敗: %s", e)
+
+    async def _wait_for_result(self, lock_key: str, result_key: str) -> dict | None:
+        """輪詢其他 worker 的結果，leader 放棄或逾時時回傳 None"""
+        r = get_async_redis_client()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl_seconds
+        try:
+            while loop.time() < deadline:
+                cached = await r.get(result_key)
+                if cached:
+                    return json.loads(cached)
+                if not await r.exists(lock_key):
+                    # 鎖已釋放：再確認一次結果，避免錯過剛寫入的結果
+                    cached = await r.get(result_key)
+                    return json.loads(cached) if cached else None
+                await asyncio.sleep(self.poll_interval_seconds)
+        except RedisError as e:
+            logger.warning("讀取 single-flight 結果失敗: %s", e)
+        return None
+
+    def stats(self) -> dict:
+        """回傳合併統計資訊"""
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "remote_shared": self.remote_shared,
+            "fallbacks": self.fallbacks,
+        }
+
+
+# 建立全域實例
+optimize_single_flight = SingleFlight(
+    enabled=settings.single_flight_enabled,
+    use_redis=settings.single_flight_redis,
+    lock_ttl_seconds=settings.single_flight_lock_ttl_seconds,
+    result_ttl_seconds=settings.single_flight_result_ttl_seconds,
+)
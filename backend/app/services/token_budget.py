@@ -0,0 +1,121 @@
+"""
+Token 預算與預估模組
+"""
+
+import math
+import re
+
+from app.config import settings
+from app.models import Template
+
+# 中日韓文字與全形字元：約 1 字 1 token；其餘字元約 4 字元 1 token
+_WIDE_CHARS = re.compile(
+    r"[\u1100-\u11ff\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]"
+)
+
+
+def estimate_tokens(text: str | None) -> int:
+    """以字元類型快速估算 token 數（偏保守，不呼叫上游 countTokens）"""
+    if not text:
+        return 0
+    narrow = len(_WIDE_CHARS.sub("", text))
+    return len(text) - narrow + math.ceil(narrow / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截斷文字，使估算的 token 數不超過 max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # 以 1/4 token 為單位累計，與 estimate_tokens 的估算方式一致
+    budget = max_tokens * 4
+    used = 0
+    for index, char in enumerate(text):
+        used += 4 if _WIDE_CHARS.match(char) else 1
+        if used > budget:
+            return text[:index]
+    return text
+
+
+class TokenBudget:
+    """優化請求的 token 預算
+
+    - 輸入：模板 token 數（建立/更新模板時預先計算）加上使用者輸入的估算值，
+      超過上限時依設定拒絕（ValueError）或截斷使用者輸入，不浪費上游往返
+    - 輸出：未指定時使用預設上限，指定值超過上限時以上限為準
+    """
+
+    def __init__(
+        self,
+        max_input_tokens: int = 32000,
+        max_output_tokens: int = 8192,
+        overflow: str = "reject",
+    ):
+        """初始化 token 預算
+
+        Args:
+            max_input_tokens: 模板與使用者輸入合計的 token 上限
+            max_output_tokens: 輸出 token 的預設值與上限
+            overflow: 輸入超過上限時的處理方式，"reject" 或 "truncate"
+        """
+        if overflow not in ("reject", "truncate"):
+            raise ValueError("overflow 必須為 'reject' 或 'truncate'")
+
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.overflow = overflow
+        self._rejected = 0
+        self._truncated = 0
+
+    @staticmethod
+    def template_tokens(template: Template) -> int:
+        """取得模板的 token 數（優先使用寫入時預先計算的值）"""
+        if template.content_tokens is not None:
+            return template.content_tokens
+        return estimate_tokens(template.content)
+
+    def fit_prompt(self, template: Template, prompt: str) -> str:
+        """確認模板與輸入在預算內，必要時截斷輸入
+
+        Raises:
+            ValueError: 超過輸入上限且設定為拒絕，或模板本身已超過上限時
+        """
+        available = self.max_input_tokens - self.template_tokens(template)
+        if available <= 0:
+            self._rejected += 1
+            raise ValueError(f"模板超過輸入 token 上限 {self.max_input_tokens}")
+
+        prompt_tokens = estimate_tokens(prompt)
+        if prompt_tokens <= available:
+            return prompt
+        if self.overflow == "truncate":
+            self._truncated += 1
+            return truncate_to_tokens(prompt, available)
+
+        self._rejected += 1
+        raise ValueError(
+            f"輸入約 {prompt_tokens} tokens，超過可用上限 {available} tokens"
+        )
+
+    def output_tokens(self, requested: int | None) -> int:
+        """決定實際使用的最大輸出 token 數"""
+        if requested is None:
+            return self.max_output_tokens
+        return min(requested, self.max_output_tokens)
+
+    def stats(self) -> dict:
+        """回傳預算設定與統計"""
+        return {
+            "max_input_tokens": self.max_input_tokens,
+            "max_output_tokens": self.max_output_tokens,
+            "overflow": self.overflow,
+            "rejected": self._rejected,
+            "truncated": self._truncated,
+        }
+
+
+# 建立全域 token 預算實例
+optimize_token_budget = TokenBudget(
+    max_input_tokens=settings.optimize_max_input_tokens,
+    max_output_tokens=settings.optimize_max_output_tokens,
+    overflow=settings.optimize_input_overflow,
+)
@@ -0,0 +1,96 @@
+"""
+用量彙總服務
+"""
+
+from collections import defaultdict
+from datetime import UTC, date, datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+from app.models import PromptHistory, UsageRollup
+
+# 每筆歷史記錄累加到彙總列的計數欄位
+_COUNTER_COLUMNS = (
+    "requests",
+    "cache_hits",
+    "input_tokens",
+    "output_tokens",
+    "total_tokens",
+    "upstream_calls",
+    "latency_ms_total",
+)
+
+
+def _rollup_deltas(
+    histories: list[PromptHistory],
+) -> dict[tuple[int, str, date], dict[str, int]]:
+    """將歷史記錄依 (用戶, 模型, UTC 日期) 彙總成遞增量"""
+    deltas: dict[tuple[int, str, date], dict[str, int]] = defaultdict(
+        lambda: dict.fromkeys(_COUNTER_COLUMNS, 0)
+    )
+    for history in histories:
+        created_at = history.created_at
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(UTC)
+        delta = deltas[(history.user_id, history.model_used, created_at.date())]
+        delta["requests"] += 1
+        delta["cache_hits"] += int(history.cache_hit)
+        delta["input_tokens"] += history.input_tokens or 0
+        delta["output_tokens"] += history.output_tokens or 0
+        delta["total_tokens"] += history.total_tokens or 0
+        if history.latency_ms is not None:
+            delta["upstream_calls"] += 1
+            delta["latency_ms_total"] += history.latency_ms
+    return deltas
+
+
+def record_usage(session: Session, histories: list[PromptHistory]) -> None:
+    """遞增歷史記錄對應的用量彙總列
+
+    只執行 SQL，不提交交易；呼叫端應與歷史記錄在同一交易內提交。
+    SQLite 與 PostgreSQL 以單一 INSERT ... ON CONFLICT DO UPDATE 原子遞增，
+    其他資料庫則先查詢再更新。
+    """
+    deltas = _rollup_deltas(histories)
+    if not deltas:
+        return
+
+    now = datetime.now(UTC)
+    dialect = session.get_bind().dialect.name
+    insert = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}.get(dialect)
+
+    for (user_id, model, day), delta in deltas.items():
+        if insert is not None:
+            table = UsageRollup.__table__
+            statement = insert(table).values(
+                user_id=user_id, model=model, day=day, updated_at=now, **delta
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=["user_id", "model", "day"],
+                set_={
+                    **{
+                        column: table.c[column] + statement.excluded[column]
+                        for column in _COUNTER_COLUMNS
+                    },
+                    "updated_at": now,
+                },
+            )
+            session.execute(statement)
+            continue
+
+        rollup = session.exec(
+            select(UsageRollup)
+            .where(
+                UsageRollup.user_id == user_id,
+                UsageRollup.model == model,
+                UsageRollup.day == day,
+            )
+            .with_for_update()
+        ).first()
+        if rollup is None:
+            rollup = UsageRollup(user_id=user_id, model=model, day=day)
+        for column, value in delta.items():
+            setattr(rollup, column, getattr(rollup, column) + value)
+        rollup.updated_at = now
+        session.add(rollup)
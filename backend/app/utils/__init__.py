@@ -1,5 +1,6 @@
 from .blacklist import add_token_to_blacklist, is_token_blacklisted
-from .redis_client import get_redis_client
+from .etag import compute_etag, etag_matches
+from .redis_client import get_async_redis_client, get_redis_client
 from .security import hash_password, verify_password
 from .token import (
     create_access_token,
@@ -14,4 +15,7 @@ __all__ = [
     "is_token_blacklisted",
     "add_token_to_blacklist",
     "get_redis_client",
+    "get_async_redis_client",
+    "compute_etag",
+    "etag_matches",
 ]
@@ -0,0 +1,18 @@
+"""
+HTTP ETag 相關邏輯模組
+"""
+
+import hashlib
+
+
+def compute_etag(body: bytes) -> str:
+    """以回應內容的雜湊計算強 ETag"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """判斷 If-None-Match 是否符合目前的 ETag（忽略弱比對前綴）"""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
@@ -3,9 +3,12 @@ Redis
 """
 
 import redis
+import redis.asyncio
 
 from app.config import settings
 
+_async_redis_client: redis.asyncio.Redis | None = None
+
 
 def get_redis_client():
     """
@@ -16,3 +19,23 @@ def get_redis_client():
     return redis.Redis(
         host=settings.redis_host, port=settings.redis_port, db=0, decode_responses=True
     )
+
+
+def get_async_redis_client() -> redis.asyncio.Redis:
+    """
+    獲取共用的非同步 Redis 客戶端（懶載入）
+
+    非同步路徑（例如 Prompt 優化）使用此客戶端，避免阻塞事件迴圈，
+    並共用同一個連線池。
+    Returns:
+        redis.asyncio.Redis: 非同步 Redis 客戶端實例
+    """
+    global _async_redis_client  # pylint: disable=global-statement
+    if _async_redis_client is None:
+        _async_redis_client = redis.asyncio.Redis(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            db=0,
+            decode_responses=True,
+        )
+    return _async_redis_client
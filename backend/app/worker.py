@@ -0,0 +1,43 @@
+"""
+背景優化工作 worker 入口
+
+使用 Redis 工作佇列時，以獨立行程執行，可與 API 行程分開擴展：
+    python -m app.worker
+"""
+
+import asyncio
+import signal
+import sys
+
+from app.config import settings
+from app.services.gemini_client_pool import gemini_client_pool
+from app.services.job_queue import optimize_job_queue
+
+
+async def run_worker() -> None:
+    """執行 worker 直到收到 SIGINT / SIGTERM"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows 不支援 add_signal_handler，改由 KeyboardInterrupt 結束
+            pass
+
+    print(
+        f"🚀 優化工作 worker 啟動（併發數 {settings.job_worker_concurrency}）",
+        flush=True,
+    )
+    try:
+        await optimize_job_queue.run_worker(stop_event, settings.job_worker_concurrency)
+    finally:
+        await gemini_client_pool.aclose()
+        print("👋 優化工作 worker 已停止", flush=True)
+
+
+if __name__ == "__main__":
+    if settings.job_queue_backend != "redis":
+        print("❌ 獨立 worker 需要 JOB_QUEUE_BACKEND=redis")
+        sys.exit(1)
+    asyncio.run(run_worker())
@@ -0,0 +1,249 @@
+"""
+本機假 Gemini 服務
+
+模擬 Gemini REST API 的 `generateContent` 端點，固定延遲後回傳文字，
+供效能基準測試使用，不需要真實 API 金鑰，也不會產生費用。
+另外模擬 `cachedContents`（上下文快取）的建立、延長與刪除。
+"""
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+import json
+import socket
+import threading
+import time
+from typing import Self
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+
+def create_fake_gemini_app(
+    latency: float = 0.2,
+    failures: list[int] | None = None,
+    cache_min_tokens: int = 0,
+    retry_after: str = "0",
+    empty_stream: bool = False,
+) -> FastAPI:
+    """建立假 Gemini 應用程式
+
+    收到的請求依序記錄於 `fake_app.state.requests`（動作、模型與 API 金鑰），
+    供測試確認實際送往上游的呼叫。
+
+    Args:
+        latency: 每個請求的模擬上游延遲（秒）
+        failures: 依序回傳的錯誤狀態碼（例如 [503, 429]），用完後恢復正常
+        cache_min_tokens: 建立上下文快取所需的最小 token 數
+        retry_after: 429 回應的 Retry-After 標頭值
+        empty_stream: 串流回應只送出結束原因，不含任何文字
+    """
+    fake_app = FastAPI()
+    fake_app.state.requests = []
+    pending_failures = list(failures or [])
+    # 快取名稱 -> (系統指令 token 數, 到期時間)
+    cached_contents: dict[str, tuple[int, datetime]] = {}
+
+    def _tokens(text: str) -> int:
+        return len(text) // 4
+
+    def _error(code: int, message: str) -> JSONResponse:
+        return JSONResponse(
+            status_code=code, content={"error": {"code": code, "message": message}}
+        )
+
+    def _cached_content(name: str, model: str, tokens: int) -> dict:
+        return {
+            "name": name,
+            "model": model,
+            "expireTime": cached_contents[name][1].isoformat(),
+            "usageMetadata": {"totalTokenCount": tokens},
+        }
+
+    def _record(request: Request, action: str, model: str = "") -> None:
+        fake_app.state.requests.append(
+            {
+                "action": action,
+                "model": model,
+                "api_key": request.headers.get("x-goog-api-key"),
+            }
+        )
+
+    def _expire_time(ttl: str | None) -> datetime:
+        seconds = float((ttl or "3600s").rstrip("s"))
+        return datetime.now(UTC) + timedelta(seconds=seconds)
+
+    def _response(
+        model: str, text: str, finish: bool = True, cached_tokens: int = 0
+    ) -> dict:
+        candidate: dict = {"content": {"role": "model", "parts": [{"text": text}]}}
+        if finish:
+            candidate["finishReason"] = "STOP"
+        usage = {
+            "promptTokenCount": _tokens(text) + cached_tokens,
+            "candidatesTokenCount": _tokens(text) + 2,
+            "totalTokenCount": _tokens(text) * 2 + cached_tokens + 2,
+        }
+        if cached_tokens:
+            usage["cachedContentTokenCount"] = cached_tokens
+        return {
+            "candidates": [candidate],
+            "usageMetadata": usage,
+            "modelVersion": model,
+        }
+
+    @fake_app.post("/{api_version}/cachedContents")
+    async def create_cached_content(api_version: str, request: Request):
+        body = await request.json()
+        _record(request, "cachedContents.create", body.get("model", ""))
+        parts = (body.get("systemInstruction") or {}).get("parts") or [{}]
+        tokens = _tokens(parts[0].get("text", ""))
+        if tokens < cache_min_tokens:
+            return _error(400, "Cached content is too small")
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        cached_contents[name] = (tokens, _expire_time(body.get("ttl")))
+        return _cached_content(name, body.get("model", ""), tokens)
+
+    @fake_app.patch("/{api_version}/cachedContents/{cache_id}")
+    async def update_cached_content(api_version: str, cache_id: str, request: Request):
+        _record(request, "cachedContents.update")
+        name = f"cachedContents/{cache_id}"
+        if name not in cached_contents:
+            return _error(404, "Cached content not found")
+        body = await request.json()
+        tokens = cached_contents[name][0]
+        cached_contents[name] = (tokens, _expire_time(body.get("ttl")))
+        return _cached_content(name, "", tokens)
+
+    @fake_app.delete("/{api_version}/cachedContents/{cache_id}")
+    async def delete_cached_content(api_version: str, cache_id: str, request: Request):
+        _record(request, "cachedContents.delete")
+        if cached_contents.pop(f"cachedContents/{cache_id}", None) is None:
+            return _error(404, "Cached content not found")
+        return {}
+
+    @fake_app.get("/{api_version}/models")
+    async def list_models(api_version: str, request: Request):
+        _record(request, "models.list")
+        models = [
+            "gemini-2.5-pro",
+            "gemini-2.5-flash",
+            "gemini-3.0-flash",
+            "text-embedding-004",
+        ]
+        return {
+            "models": [
+                {
+                    "name": f"models/{name}",
+                    "displayName": name.replace("-", " ").title(),
+                    "supportedGenerationMethods": (
+                        ["embedContent"] if "embedding" in name else ["generateContent"]
+                    ),
+                }
+                for name in models
+            ]
+        }
+
+    @fake_app.post("/{api_version}/models/{model_action}")
+    async def generate_content(api_version: str, model_action: str, request: Request):
+        body = await request.json()
+        model, _, action = model_action.partition(":")
+        _record(request, action, model)
+
+        if pending_failures:
+            code = pending_failures.pop(0)
+            return JSONResponse(
+                status_code=code,
+                content={"error": {"code": code, "message": "fake upstream error"}},
+                headers={"Retry-After": retry_after} if code == 429 else None,
+            )
+        cached_tokens = 0
+        if body.get("cachedContent"):
+            if body["cachedContent"] not in cached_contents:
+                return _error(404, "Cached content not found")
+            cached_tokens = cached_contents[body["cachedContent"]][0]
+        contents = body.get("contents") or [{}]
+        parts = contents[-1].get("parts") or [{}]
+        text = f"[optimized] {parts[0].get('text', '')}"
+
+        if action == "streamGenerateContent":
+            words = [] if empty_stream else text.split(" ")
+
+            async def events():
+                for index, word in enumerate(words):
+                    await asyncio.sleep(latency / len(words))
+                    piece = word if index == 0 else f" {word}"
+                    chunk = _response(
+                        model,
+                        piece,
+                        finish=index == len(words) - 1,
+                        cached_tokens=cached_tokens,
+                    )
+                    yield f"data: {json.dumps(chunk)}\r\n\r\n"
+                if not words:
+                    chunk = {
+                        "candidates": [{"finishReason": "MAX_TOKENS"}],
+                        "modelVersion": model,
+                    }
+                    yield f"data: {json.dumps(chunk)}\r\n\r\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency)
+        return _response(model, text, cached_tokens=cached_tokens)
+
+    return fake_app
+
+
+class FakeGeminiServer:
+    """在背景執行緒中啟動假 Gemini 服務的 context manager"""
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        failures: list[int] | None = None,
+        cache_min_tokens: int = 0,
+        retry_after: str = "0",
+        empty_stream: bool = False,
+    ):
+        self.latency = latency
+        self.port = self._free_port()
+        self.app = create_fake_gemini_app(
+            latency, failures, cache_min_tokens, retry_after, empty_stream
+        )
+        self._server = uvicorn.Server(
+            uvicorn.Config(
+                self.app,
+                host="127.0.0.1",
+                port=self.port,
+                log_level="warning",
+                backlog=4096,
+            )
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @staticmethod
+    def _free_port() -> int:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    @property
+    def requests(self) -> list[dict]:
+        """已收到的請求記錄"""
+        return self.app.state.requests
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> Self:
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
@@ -0,0 +1,213 @@
+"""
+歷史記錄內容壓縮的效益與開銷量測
+
+比較三種儲存方式：未壓縮、zlib（無字典）、zlib 搭配訓練字典，
+量測儲存比例、單筆壓縮／解壓縮耗時，以及 SQLite 寫入與讀取的開銷。
+
+執行方式（於 backend 目錄）：
+    python -m benchmarks.history_compression
+    python -m benchmarks.history_compression --database db/database.db
+
+指定 --database 時以該資料庫 prompt_blobs 中的內容作為樣本（唯讀），
+否則產生模擬資料。
+"""
+
+import argparse
+import os
+from pathlib import Path
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from app.config import settings
+from app.services.history_compression import HistoryCompressor, train_dictionary
+
+# 模擬優化結果常見的段落結構
+_SECTIONS = [
+    ("## 角色", ["你是一位資深的{topic}專家。", "你熟悉{topic}的最佳實務與常見陷阱。"]),
+    (
+        "## 任務",
+        ["請根據使用者提供的需求，完成{topic}相關的工作。", "必要時先列出假設。"],
+    ),
+    ("## 背景", ["使用者正在處理{topic}，目標是{goal}。", "目前遇到的困難是{issue}。"]),
+    ("## 輸出格式", ["以條列方式輸出，每點不超過兩句。", "最後附上一段總結。"]),
+    ("## 限制", ["不得捏造事實，資訊不足時請提出問題。", "回答請使用繁體中文。"]),
+]
+_TOPICS = ["SQL 查詢", "資料分析", "行銷文案", "程式除錯", "API 設計", "教學簡報"]
+_GOALS = ["提升效能", "降低成本", "改善可讀性", "縮短交付時間", "提高轉換率"]
+_ISSUES = ["資料量過大", "需求不明確", "時程緊迫", "缺乏測試", "欄位定義不一致"]
+_WORDS = [
+    "使用者",
+    "資料",
+    "查詢",
+    "報表",
+    "欄位",
+    "索引",
+    "效能",
+    "流程",
+    "客戶",
+    "訂單",
+    "指標",
+    "模型",
+    "範例",
+    "步驟",
+]
+
+
+def _synthetic_corpus(count: int, seed: int = 42) -> list[str]:
+    """產生模擬的優化結果"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        values = {
+            "topic": rng.choice(_TOPICS),
+            "goal": rng.choice(_GOALS),
+            "issue": rng.choice(_ISSUES),
+        }
+        lines = []
+        for heading, sentences in _SECTIONS:
+            lines.append(heading)
+            lines.extend(sentence.format(**values) for sentence in sentences)
+            lines.append(" ".join(rng.choices(_WORDS, k=rng.randint(10, 60))))
+        corpus.append("\n".join(lines))
+    return corpus
+
+
+def _database_corpus(path: str, limit: int) -> list[str]:
+    """由既有資料庫讀取 prompt_blobs 中的內容（唯讀）"""
+    reader = HistoryCompressor()
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for dictionary_id, data in connection.execute(
+            "SELECT dictionary_id, data FROM history_dictionaries"
+        ):
+            reader.add_dictionary(dictionary_id, data)
+        rows = connection.execute(
+            "SELECT body, body_z FROM prompt_blobs ORDER BY created_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+    finally:
+        connection.close()
+    return [body for body in (reader.full_text(*row) for row in rows) if body]
+
+
+def _percentile(values: list[float], ratio: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def _measure_codec(name: str, compressor: HistoryCompressor, bodies: list[str]) -> None:
+    """量測壓縮比例與單筆壓縮／解壓縮耗時"""
+    raw_total = stored_total = 0
+    compress_us, decompress_us = [], []
+    for body in bodies:
+        raw = len(body.encode("utf-8"))
+        started = time.perf_counter()
+        blob = compressor.compress(body)
+        compress_us.append((time.perf_counter() - started) * 1e6)
+        raw_total += raw
+        if blob is None:
+            stored_total += raw
+            continue
+        # 壓縮後文字欄位仍保留預覽
+        stored_total += len(blob) + len(
+            body[: compressor.preview_chars].encode("utf-8")
+        )
+        started = time.perf_counter()
+        compressor.decompress(blob)
+        decompress_us.append((time.perf_counter() - started) * 1e6)
+
+    print(
+        f"{name:<14} 儲存比例 {stored_total / raw_total:6.3f}  "
+        f"壓縮 p50 {statistics.median(compress_us):7.1f}µs "
+        f"p99 {_percentile(compress_us, 0.99):7.1f}µs  "
+        f"解壓縮 p50 {statistics.median(decompress_us or [0]):6.1f}µs "
+        f"p99 {_percentile(decompress_us or [0], 0.99):6.1f}µs"
+    )
+
+
+def _measure_database(
+    name: str, compressor: HistoryCompressor | None, bodies: list[str]
+) -> None:
+    """量測 SQLite 寫入、詳細內容讀取耗時與檔案大小"""
+    workdir = tempfile.mkdtemp(prefix="history-compression-")
+    path = os.path.join(workdir, "bench.db")
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE history (id INTEGER PRIMARY KEY, body TEXT, body_z BLOB)"
+    )
+
+    started = time.perf_counter()
+    for index in range(0, len(bodies), 500):
+        rows = []
+        for body in bodies[index : index + 500]:
+            blob = compressor.compress(body) if compressor else None
+            preview = body if blob is None else body[: compressor.preview_chars]
+            rows.append((preview, blob))
+        connection.executemany("INSERT INTO history (body, body_z) VALUES (?, ?)", rows)
+        connection.commit()
+    write_us = (time.perf_counter() - started) / len(bodies) * 1e6
+
+    ids = random.Random(0).sample(range(1, len(bodies) + 1), min(1000, len(bodies)))
+    started = time.perf_counter()
+    for history_id in ids:
+        body, blob = connection.execute(
+            "SELECT body, body_z FROM history WHERE id = ?", (history_id,)
+        ).fetchone()
+        if blob is not None:
+            compressor.decompress(blob)
+    read_us = (time.perf_counter() - started) / len(ids) * 1e6
+
+    connection.execute("VACUUM")
+    connection.close()
+    size = Path(path).stat().st_size
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(
+        f"{name:<14} 檔案 {size / 1024:9.1f} KiB  "
+        f"寫入 {write_us:6.1f}µs/筆  讀取詳細內容 {read_us:6.1f}µs/筆"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", help="以既有 SQLite 資料庫作為樣本")
+    parser.add_argument("--count", type=int, default=5000, help="樣本數")
+    args = parser.parse_args()
+
+    if args.database:
+        bodies = _database_corpus(args.database, args.count)
+    else:
+        bodies = _synthetic_corpus(args.count)
+    if len(bodies) < 2:
+        raise SystemExit("樣本不足")
+
+    # 前半訓練字典，後半量測，避免以訓練資料評估
+    training, evaluation = bodies[: len(bodies) // 2], bodies[len(bodies) // 2 :]
+    options = {
+        "min_bytes": settings.history_compression_min_bytes,
+        "level": settings.history_compression_level,
+        "preview_chars": settings.history_preview_chars,
+    }
+    plain = HistoryCompressor(**options)
+    with_dictionary = HistoryCompressor(**options)
+    dictionary = train_dictionary(training)
+    with_dictionary.add_dictionary(1, dictionary)
+
+    sizes = [len(body.encode("utf-8")) for body in evaluation]
+    print(
+        f"樣本 {len(evaluation)} 筆，平均 {statistics.mean(sizes):.0f} bytes，"
+        f"門檻 {plain.min_bytes} bytes，字典 {len(dictionary)} bytes\n"
+    )
+    _measure_codec("zlib", plain, evaluation)
+    _measure_codec("zlib + 字典", with_dictionary, evaluation)
+    print()
+    _measure_database("未壓縮", None, evaluation)
+    _measure_database("zlib", plain, evaluation)
+    _measure_database("zlib + 字典", with_dictionary, evaluation)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+歷史記錄內容去重比例量測
+
+以既有資料庫的實際內容，計算不同門檻下以內容雜湊去重可節省的空間：
+參考數、不重複內容數、重複比例，以及去重前後的內容大小。
+遷移前（內容存於歷史記錄）與遷移後（內容存於 prompt_blobs）的資料庫皆可量測；
+遷移後另外列出 prompt_blobs 實際佔用的大小（含壓縮）。
+
+執行方式（於 backend 目錄）：
+    python -m benchmarks.history_dedup --database db/database.db
+    python -m benchmarks.history_dedup --database db/database.db --thresholds 0 256 512
+"""
+
+import argparse
+from collections import defaultdict
+import hashlib
+import sqlite3
+
+from app.config import settings
+from app.services.history_compression import HistoryCompressor
+
+_FIELDS = ("original_prompt", "optimized_prompt")
+
+
+def _columns(connection: sqlite3.Connection, table: str) -> set[str]:
+    return {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+
+
+def _references(connection: sqlite3.Connection):
+    """逐一產生 (欄位, 內容雜湊, 內容大小)
+
+    存於 prompt_blobs 的內容直接使用雜湊與記錄的大小，不需解壓縮。
+    """
+    reader = HistoryCompressor()
+    if _columns(connection, "history_dictionaries"):
+        for dictionary_id, data in connection.execute(
+            "SELECT dictionary_id, data FROM history_dictionaries"
+        ):
+            reader.add_dictionary(dictionary_id, data)
+
+    sizes = {}
+    if _columns(connection, "prompt_blobs"):
+        sizes = dict(
+            connection.execute("SELECT blob_hash, size_bytes FROM prompt_blobs")
+        )
+    columns = _columns(connection, "prompt_history")
+    selected = []
+    for field in _FIELDS:
+        hash_field = field.replace("_prompt", "_blob_hash")
+        selected += [
+            field,
+            f"{field}_z" if f"{field}_z" in columns else "NULL",
+            hash_field if hash_field in columns else "NULL",
+        ]
+
+    cursor = connection.execute(f"SELECT {', '.join(selected)} FROM prompt_history")
+    for row in cursor:
+        for index, field in enumerate(_FIELDS):
+            text, blob, digest = row[index * 3 : index * 3 + 3]
+            if digest is not None:
+                yield field, digest, sizes[digest]
+                continue
+            body = reader.full_text(text, blob) or ""
+            raw = body.encode("utf-8")
+            yield field, hashlib.sha256(raw).hexdigest(), len(raw)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", required=True, help="SQLite 資料庫路徑（唯讀）")
+    parser.add_argument(
+        "--thresholds",
+        type=int,
+        nargs="+",
+        default=[0, 256, settings.history_blob_min_bytes, 1024, 4096],
+        help="量測的門檻（bytes）",
+    )
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(f"file:{args.database}?mode=ro", uri=True)
+    try:
+        # 每個門檻、欄位（含合計）：參考數、去重前大小、不重複內容
+        references = defaultdict(int)
+        logical = defaultdict(int)
+        unique: dict[tuple, dict[str, int]] = defaultdict(dict)
+        rows = 0
+        for field, digest, size in _references(connection):
+            rows += field == _FIELDS[0]
+            for threshold in args.thresholds:
+                if size < threshold:
+                    continue
+                for key in ((threshold, field), (threshold, "total")):
+                    references[key] += 1
+                    logical[key] += size
+                    unique[key][digest] = size
+
+        print(f"歷史記錄 {rows} 筆\n")
+        print(
+            f"{'門檻':>8} {'欄位':<18} {'參考':>9} {'不重複':>9} {'重複比例':>8} "
+            f"{'去重前':>12} {'去重後':>12}"
+        )
+        for threshold in args.thresholds:
+            for field in (*_FIELDS, "total"):
+                key = (threshold, field)
+                if not references[key]:
+                    continue
+                distinct = len(unique[key])
+                deduped = sum(unique[key].values())
+                print(
+                    f"{threshold:>8} {field:<18} {references[key]:>9} {distinct:>9} "
+                    f"{1 - distinct / references[key]:>8.1%} "
+                    f"{logical[key]:>12} {deduped:>12}"
+                )
+
+        if not _columns(connection, "prompt_blobs"):
+            return
+        blobs = connection.execute(
+            "SELECT count(*), sum(ref_count), sum(size_bytes), "
+            "sum(coalesce(length(body_z), length(CAST(body AS BLOB)))) "
+            "FROM prompt_blobs"
+        ).fetchone()
+        if blobs[0]:
+            count, refs, size, stored = blobs
+            print(
+                f"\nprompt_blobs：{count} 筆內容、{refs} 個參考，"
+                f"內容 {size} bytes，實際儲存 {stored} bytes（{stored / size:.1%}）"
+            )
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Prompt 優化併發效能基準測試
+
+比較同步與非同步 Gemini 呼叫路徑在不同併發數下的吞吐量。
+以本機假 Gemini 服務取代真實 API，每個請求固定延遲。
+
+執行方式（於 backend 目錄）：
+    python -m benchmarks.optimize_concurrency --latency 0.2 --levels 1 10 50 200
+"""
+
+import argparse
+import asyncio
+import time
+
+from google.genai import types
+
+from app.services.gemini_client import GeminiClient
+from app.services.prompt_optimizer import PromptOptimizerService
+from benchmarks.fake_gemini import FakeGeminiServer
+
+MODEL = "gemini-2.5-flash"
+TEMPLATE = "請將以下「內容」轉換為強大的提示詞"
+
+
+class _SyncOptimizerService(PromptOptimizerService):
+    """舊版行為：在事件迴圈中直接呼叫同步 API（作為對照組）"""
+
+    async def _call_gemini_api(
+        self,
+        template_content: str,
+        user_prompt: str,
+        model: str,
+        temperature: float,
+        max_output_tokens: int | None = None,
+    ) -> dict:
+        optimized_text = self.gemini_client.generate_content(
+            model=model,
+            system_instruction=template_content,
+            content=user_prompt,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+        )
+        return {
+            "optimized_prompt": optimized_text,
+            "improvement_analysis": "已根據模板進行優化",
+        }
+
+
+async def _run_level(service: PromptOptimizerService, concurrency: int) -> float:
+    """以指定併發數執行一輪請求，回傳每秒完成數"""
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            service._call_gemini_api(TEMPLATE, f"prompt #{i}", MODEL, 0.2)
+            for i in range(concurrency)
+        )
+    )
+    return concurrency / (time.perf_counter() - started)
+
+
+async def _main(latency: float, levels: list[int]) -> None:
+    with FakeGeminiServer(latency=latency) as server:
+        client = GeminiClient(
+            "fake-api-key", http_options=types.HttpOptions(base_url=server.base_url)
+        )
+        services = {
+            "sync": _SyncOptimizerService(None, client),  # type: ignore[arg-type]
+            "async": PromptOptimizerService(None, client),  # type: ignore[arg-type]
+        }
+
+        # 預熱連線
+        await _run_level(services["async"], 1)
+
+        print(f"上游延遲 {latency:.3f}s")
+        print(
+            f"{'in-flight':>10} {'sync req/s':>12} {'async req/s':>12} {'speedup':>8}"
+        )
+        for concurrency in levels:
+            sync_rps = await _run_level(services["sync"], concurrency)
+            async_rps = await _run_level(services["async"], concurrency)
+            print(
+                f"{concurrency:>10} {sync_rps:>12.1f} {async_rps:>12.1f} "
+                f"{async_rps / sync_rps:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 10, 50, 200])
+    args = parser.parse_args()
+    asyncio.run(_main(args.latency, args.levels))
@@ -1,18 +1,155 @@
+import atexit
+from datetime import UTC, datetime, timedelta
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+
+# 測試使用獨立的設定與暫存工作目錄（SQLite 路徑相對於工作目錄）
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ["DATABASE_TYPE"] = "sqlite"
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+WORK_DIR = Path(tempfile.mkdtemp(prefix="prompt-master-tests-"))
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+(WORK_DIR / "db").mkdir()
+
+# 資料庫引擎建立時即解析相對路徑，匯入應用程式期間切換到暫存目錄
+_cwd = os.getcwd()
+os.chdir(WORK_DIR)
+
+from alembic.config import Config
+import fakeredis
 from fastapi.testclient import TestClient
+from google.genai import types
 from httpx import ASGITransport, AsyncClient
 import pytest
+import redis
+import redis.asyncio
+from sqlmodel import Session, select
 
-from app.dependencies import get_session
+from alembic import command
+from app import main
+from app.api import (
+    health as health_api,
+    optimize as optimize_api,
+)
+from app.config import settings
+from app.dependencies import engine
 from app.main import app
+from app.models import PromptHistory, User
+from app.services import gemini_client_pool as pool_module
+from app.services.gemini_client_pool import GeminiClientPool
+from app.services.gemini_context_cache import GeminiContextCache
+from app.services.gemini_limiter import ModelConcurrencyLimiter
+from app.services.gemini_resilience import GeminiResilience
+from app.services.history_compression import history_compressor
+from app.services.history_search import index_history_bodies
+from app.services.job_queue import create_job_queue
+from app.utils import redis_client
+from benchmarks.fake_gemini import FakeGeminiServer
+
+os.chdir(_cwd)
+
+DATABASE_PATH = WORK_DIR / "db" / "database.db"
+TEMPLATE_DATABASE_PATH = WORK_DIR / "template.db"
+
+
+def alembic_config() -> Config:
+    """不讀取 alembic.ini 的遷移設定，避免其日誌設定停用應用程式的 logger"""
+    config = Config()
+    config.set_main_option("script_location", str(BACKEND_DIR / "alembic"))
+    return config
+
 
+@pytest.fixture(scope="session", autouse=True)
+def work_dir():
+    """於暫存目錄執行測試，並只執行一次遷移，之後每個測試複製這份資料庫"""
+    cwd = os.getcwd()
+    os.chdir(WORK_DIR)
+    command.upgrade(alembic_config(), "head")
+    engine.dispose()
+    shutil.copyfile(DATABASE_PATH, TEMPLATE_DATABASE_PATH)
+    yield WORK_DIR
+    engine.dispose()
+    os.chdir(cwd)
 
-# 模擬資料庫依賴
-async def get_test_database():
-    return {"test": "database"}
 
+@pytest.fixture(autouse=True)
+def fresh_database(work_dir):
+    """每個測試使用剛完成遷移的資料庫"""
+    engine.dispose()
+    for suffix in ("-wal", "-shm", "-journal"):
+        Path(f"{DATABASE_PATH}{suffix}").unlink(missing_ok=True)
+    shutil.copyfile(TEMPLATE_DATABASE_PATH, DATABASE_PATH)
+    history_compressor._dictionaries.clear()
+    yield
+    engine.dispose()
 
-# 覆寫依賴
-app.dependency_overrides[get_session] = get_test_database
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """以 fakeredis 取代 Redis，每個測試使用全新的資料"""
+    server = fakeredis.FakeServer()
+
+    class FakeRedis(fakeredis.FakeRedis):
+        def __init__(self, *args, host=None, port=None, **kwargs):
+            super().__init__(*args, server=server, **kwargs)
+
+    class FakeAsyncRedis(fakeredis.FakeAsyncRedis):
+        def __init__(self, *args, host=None, port=None, **kwargs):
+            super().__init__(*args, server=server, **kwargs)
+
+    monkeypatch.setattr(redis, "Redis", FakeRedis)
+    monkeypatch.setattr(redis.asyncio, "Redis", FakeAsyncRedis)
+    monkeypatch.setattr(redis_client, "_async_redis_client", None)
+    return server
+
+
+@pytest.fixture(autouse=True)
+def skip_startup_migration(monkeypatch):
+    """lifespan 不再執行 alembic 子行程（資料庫已由 fresh_database 準備）"""
+    monkeypatch.setattr(main, "create_db_and_tables", lambda: None)
+
+
+@pytest.fixture(autouse=True)
+def job_queue(monkeypatch):
+    """每個測試使用全新的工作佇列（佇列綁定建立時的事件迴圈）"""
+    queue = create_job_queue()
+    for module in (main, optimize_api, health_api):
+        monkeypatch.setattr(module, "optimize_job_queue", queue)
+    return queue
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """啟動假 Gemini 服務，並讓全域連線池改連到該服務
+
+    回傳的工廠函式接受 FakeGeminiServer 的參數；重試延遲縮短以加快測試。
+    """
+    servers: list[FakeGeminiServer] = []
+
+    def start(**kwargs) -> FakeGeminiServer:
+        server = FakeGeminiServer(**{"latency": 0.01, **kwargs})
+        server.__enter__()
+        servers.append(server)
+        pool = GeminiClientPool(
+            http_options=types.HttpOptions(base_url=server.base_url),
+            resilience=GeminiResilience(base_delay=0.01, max_delay=0.05),
+            limiter=ModelConcurrencyLimiter(
+                default_limit=settings.gemini_concurrency_default_limit,
+                max_queue=settings.gemini_concurrency_max_queue,
+            ),
+            context_cache=GeminiContextCache(enabled=False),
+        )
+        monkeypatch.setattr(pool_module, "gemini_client_pool", pool)
+        return server
+
+    yield start
+    for server in servers:
+        server.__exit__(None, None, None)
 
 
 @pytest.fixture
@@ -34,3 +171,78 @@ async def async_client():
 def sample_user_data():
     """測試用戶資料"""
     return {"username": "testuser", "email": "test@example.com", "is_active": True}
+
+
+@pytest.fixture
+def auth_headers(client):
+    """註冊測試用戶並回傳帶有 Bearer token 的標頭"""
+    response = client.post(
+        "/api/v1/auth/register",
+        json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "password123",
+        },
+    )
+    assert response.status_code in (200, 201), response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def optimize_body():
+    """優化請求的基本內容（使用預設模板）"""
+    return {
+        "api_key": "test-api-key",
+        "original_prompt": "write a sql query that lists active users",
+        "template_id": 1,
+        "model": "gemini-2.5-flash",
+    }
+
+
+@pytest.fixture
+def add_history(auth_headers):
+    """直接寫入測試用戶的歷史記錄，回傳新增記錄的 history_id（由舊到新）
+
+    記錄的建立時間由 start 起每筆間隔 step，預設從現在往前推算，
+    確保最新一筆早於現在。
+    """
+
+    def add(
+        count: int,
+        model: str = "gemini-2.5-flash",
+        start: datetime | None = None,
+        step: timedelta = timedelta(minutes=1),
+        prompt: str = "history prompt {index}",
+    ) -> list[int]:
+        start = start or datetime.now(UTC) - step * (count + 1)
+        with Session(engine) as session:
+            user = session.exec(select(User).where(User.username == "testuser")).one()
+            histories = [
+                PromptHistory(
+                    user_id=user.user_id,
+                    original_prompt=prompt.format(index=index),
+                    optimized_prompt=f"optimized {prompt.format(index=index)}",
+                    template_id=1,
+                    model_used=model,
+                    temperature=0.2,
+                    created_at=start + step * index,
+                )
+                for index in range(count)
+            ]
+            session.add_all(histories)
+            session.flush()
+            index_history_bodies(
+                session,
+                (
+                    (
+                        history.history_id,
+                        history.original_prompt,
+                        history.optimized_prompt,
+                    )
+                    for history in histories
+                ),
+            )
+            session.commit()
+            return [history.history_id for history in histories]
+
+    return add
@@ -0,0 +1,93 @@
+import asyncio
+
+from google.genai import types
+import pytest
+
+from app.services.gemini_client_pool import GeminiClientPool
+
+
+def _pool(server, **kwargs) -> GeminiClientPool:
+    return GeminiClientPool(
+        http_options=types.HttpOptions(base_url=server.base_url), **kwargs
+    )
+
+
+def _request(content: str) -> dict:
+    return {
+        "model": "gemini-2.5-flash",
+        "system_instruction": "你是 Prompt 優化助手",
+        "content": content,
+    }
+
+
+@pytest.fixture
+def server(fake_gemini):
+    return fake_gemini(latency=0.2)
+
+
+def test_reuses_client_per_api_key():
+    pool = GeminiClientPool()
+
+    first = pool.get("key-a")
+
+    assert pool.get("key-a") is first
+    assert pool.get("key-b") is not first
+    assert pool.stats()["hits"] == 1
+    assert pool.stats()["misses"] == 2
+
+
+def test_rejects_empty_api_key():
+    with pytest.raises(ValueError):
+        GeminiClientPool().get("")
+
+
+async def test_eviction_closes_sync_and_async_pools(server, mocker):
+    pool = _pool(server, max_size=1)
+    client = pool.get("key-a")
+    await client.generate_content_async(**_request("hi"))
+    aio_close = mocker.spy(client.client.aio, "aclose")
+    sync_close = mocker.spy(client.client, "close")
+
+    pool.get("key-b")
+    await asyncio.gather(*pool._retiring)
+
+    aio_close.assert_awaited_once()
+    sync_close.assert_called_once()
+    assert client._client is None
+    assert pool.stats()["evictions"] == 1
+
+
+async def test_eviction_waits_for_in_flight_request(server, mocker):
+    pool = _pool(server, max_size=1)
+    client = pool.get("key-a")
+    aio_close = mocker.spy(client.client.aio, "aclose")
+
+    request = asyncio.create_task(client.generate_content_async(**_request("slow")))
+    await asyncio.sleep(0.05)
+    pool.get("key-b")
+    await asyncio.gather(*pool._retiring)
+
+    aio_close.assert_not_awaited()
+    assert await request == "[optimized] slow"
+    aio_close.assert_awaited_once()
+
+
+def test_eviction_without_event_loop_closes_sync_pool(server, mocker):
+    pool = _pool(server, max_size=1)
+    client = pool.get("key-a")
+    sync_close = mocker.spy(client.client, "close")
+
+    pool.get("key-b")
+
+    sync_close.assert_called_once()
+
+
+async def test_close_errors_are_logged_not_raised(server, mocker, caplog):
+    pool = _pool(server)
+    client = pool.get("key-a")
+    mocker.patch.object(client, "aclose", side_effect=RuntimeError("loop closed"))
+
+    await pool.aclose()
+
+    assert "關閉 Gemini 客戶端失敗" in caplog.text
+    assert pool.stats()["size"] == 0
@@ -0,0 +1,169 @@
+import gc
+import time
+
+from google.genai import types
+import pytest
+
+from app.services.gemini_client import GeminiClient
+from app.services.gemini_context_cache import GeminiContextCache
+from benchmarks.fake_gemini import FakeGeminiServer
+
+MODEL = "gemini-2.5-flash"
+TEMPLATE = "You are a prompt engineer. " * 20
+
+
+@pytest.fixture
+def server():
+    with FakeGeminiServer(latency=0.01) as server:
+        yield server
+
+
+def _cache(**kwargs) -> GeminiContextCache:
+    return GeminiContextCache(**{"enabled": True, "min_tokens": 10, **kwargs})
+
+
+def _client(server, cache: GeminiContextCache) -> GeminiClient:
+    return GeminiClient(
+        "cache-key",
+        http_options=types.HttpOptions(base_url=server.base_url),
+        context_cache=cache,
+    )
+
+
+async def _generate(client: GeminiClient, template: str = TEMPLATE):
+    return await client.generate_content_with_usage_async(
+        model=MODEL, system_instruction=template, content="hello"
+    )
+
+
+def _actions(server) -> list[str]:
+    return [r["action"] for r in server.requests]
+
+
+async def test_template_is_cached_once_and_reused(server):
+    cache = _cache()
+    client = _client(server, cache)
+
+    _, first = await _generate(client)
+    _, second = await _generate(client)
+
+    assert _actions(server) == [
+        "cachedContents.create",
+        "generateContent",
+        "generateContent",
+    ]
+    assert first.cached_tokens > 0
+    assert second.cached_tokens == first.cached_tokens
+    stats = cache.stats()
+    assert stats["created"] == 1
+    assert stats["hits"] == 1
+    assert stats["tokens_saved"] == first.cached_tokens * 2
+    await client.aclose()
+
+
+async def test_short_template_is_not_cached(server):
+    cache = _cache(min_tokens=10_000)
+    client = _client(server, cache)
+
+    await _generate(client)
+
+    assert _actions(server) == ["generateContent"]
+    await client.aclose()
+
+
+async def test_expiring_handle_is_extended(server):
+    cache = _cache(ttl_seconds=60, refresh_margin=120)
+    client = _client(server, cache)
+
+    await _generate(client)
+    await _generate(client)
+
+    assert _actions(server).count("cachedContents.update") == 1
+    assert cache.stats()["refreshed"] == 1
+    await client.aclose()
+
+
+async def test_create_failure_falls_back_and_backs_off():
+    with FakeGeminiServer(latency=0.01, cache_min_tokens=10_000) as server:
+        cache = _cache(failure_ttl=60)
+        client = _client(server, cache)
+
+        text, _ = await _generate(client)
+        await _generate(client)
+
+        assert text == "[optimized] hello"
+        assert _actions(server).count("cachedContents.create") == 1
+        assert cache.stats()["failures"] == 1
+        await client.aclose()
+
+
+async def test_deleted_upstream_cache_is_discarded_and_request_resent(server):
+    cache = _cache()
+    client = _client(server, cache)
+    await _generate(client)
+    [handle] = cache._handles.values()
+    await client.client.aio.caches.delete(name=handle.name)
+
+    text, _ = await _generate(client)
+
+    assert text == "[optimized] hello"
+    assert cache.stats()["handles"] == 0
+    await _generate(client)
+    assert _actions(server).count("cachedContents.create") == 2
+    await client.aclose()
+
+
+async def test_invalidate_deletes_upstream_cache(server):
+    cache = _cache()
+    client = _client(server, cache)
+    await _generate(client)
+
+    assert await cache.invalidate(TEMPLATE) == 1
+
+    assert _actions(server)[-1] == "cachedContents.delete"
+    assert cache.stats()["handles"] == 0
+    await client.aclose()
+
+
+async def test_handle_does_not_keep_client_alive(server):
+    cache = _cache()
+    client = _client(server, cache)
+    await _generate(client)
+    await client.aclose()
+    del client
+    gc.collect()
+
+    await cache.aclose()
+
+    assert "cachedContents.delete" not in _actions(server)
+
+
+async def test_expired_entries_are_pruned(server):
+    cache = _cache(failure_ttl=0)
+    client = _client(server, cache)
+    await _generate(client)
+    await _generate(client, template="Another template. " * 20)
+    assert cache.stats()["locks"] == 2
+
+    for handle in cache._handles.values():
+        handle.expires_at = time.time() - 1
+    cache._failed_until[("key", MODEL, "hash")] = time.time() - 1
+    cache._prune(time.time())
+
+    assert cache.stats()["handles"] == 0
+    assert cache.stats()["locks"] == 0
+    assert cache._failed_until == {}
+    await client.aclose()
+
+
+async def test_retired_client_is_not_reopened_to_delete_cache(server):
+    cache = _cache()
+    client = _client(server, cache)
+    await _generate(client)
+    await client.retire()
+
+    assert await cache.invalidate(TEMPLATE) == 1
+
+    # 不會以淘汰的客戶端重新建立（且不會關閉）的連線
+    assert "cachedContents.delete" not in _actions(server)
+    assert client._client is None
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from app.services.gemini_hedging import LatencyTracker, RequestHedger
+
+
+def _warm(hedger: RequestHedger, model: str, latency: float, samples: int) -> None:
+    tracker = hedger._tracker(model)
+    for _ in range(samples):
+        tracker.record(latency)
+
+
+def test_percentile():
+    tracker = LatencyTracker(window=10)
+    for latency in range(1, 11):
+        tracker.record(float(latency))
+
+    assert tracker.percentile(0.5) == 6.0
+    assert tracker.percentile(0.95) == 10.0
+    assert LatencyTracker().percentile(0.5) is None
+
+
+async def test_no_hedge_before_min_samples():
+    hedger = RequestHedger(min_samples=5)
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    assert hedger.hedge_delay("model") is None
+    assert await hedger.run("model", fn) == "ok"
+    assert len(calls) == 1
+
+
+async def test_slow_primary_is_hedged_and_loser_cancelled():
+    hedger = RequestHedger(min_samples=1, min_delay=0.01, max_hedge_ratio=1.0)
+    _warm(hedger, "model", 0.02, samples=5)
+    cancelled = []
+    attempts = 0
+
+    async def fn():
+        nonlocal attempts
+        attempts += 1
+        attempt = attempts
+        try:
+            await asyncio.sleep(1.0 if attempt == 1 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(attempt)
+            raise
+        return f"attempt {attempt}"
+
+    assert await hedger.run("model", fn) == "attempt 2"
+
+    # 落敗的請求在回傳前已結束取消
+    assert cancelled == [1]
+    stats = hedger.stats()["model"]
+    assert stats["hedges_fired"] == 1
+    assert stats["hedges_won"] == 1
+
+
+async def test_hedge_ratio_caps_extra_requests():
+    hedger = RequestHedger(min_samples=1, min_delay=0.01, max_hedge_ratio=0.5)
+    _warm(hedger, "model", 0.01, samples=100)
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.03)
+        return "ok"
+
+    for _ in range(4):
+        await hedger.run("model", fn)
+
+    assert hedger.stats()["model"]["hedges_fired"] == 2
+    assert len(calls) == 6
+
+
+async def test_error_is_raised_only_when_both_attempts_fail():
+    hedger = RequestHedger(min_samples=1, min_delay=0.01, max_hedge_ratio=1.0)
+    _warm(hedger, "model", 0.01, samples=5)
+    attempts = 0
+
+    async def fn():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0.03)
+        raise RuntimeError("upstream failed")
+
+    with pytest.raises(RuntimeError, match="upstream failed"):
+        await hedger.run("model", fn)
+    assert attempts == 2
+
+
+async def test_attempts_cancelled_from_inside_are_skipped():
+    hedger = RequestHedger(min_samples=1, min_delay=0.01, max_hedge_ratio=1.0)
+    _warm(hedger, "model", 0.01, samples=5)
+    attempts = 0
+
+    async def fn():
+        nonlocal attempts
+        attempts += 1
+        attempt = attempts
+        await asyncio.sleep(0.03 if attempt == 1 else 0.05)
+        if attempt == 1:
+            raise asyncio.CancelledError
+        return "hedge"
+
+    assert await hedger.run("model", fn) == "hedge"
+
+
+async def test_all_attempts_cancelled_from_inside_is_an_error():
+    hedger = RequestHedger(min_samples=1, min_delay=0.01, max_hedge_ratio=1.0)
+    _warm(hedger, "model", 0.01, samples=5)
+
+    async def fn():
+        await asyncio.sleep(0.03)
+        raise asyncio.CancelledError
+
+    with pytest.raises(RuntimeError, match="取消"):
+        await hedger.run("model", fn)
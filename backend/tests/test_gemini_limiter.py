@@ -0,0 +1,88 @@
+import asyncio
+
+from google.genai import errors
+import pytest
+
+from app.services import gemini_client_pool as pool_module
+from app.services.gemini_limiter import (
+    AdaptiveLimiter,
+    LoadShedError,
+    ModelConcurrencyLimiter,
+)
+
+
+def _throttled() -> errors.APIError:
+    return errors.APIError(429, {"error": {"code": 429, "message": "quota"}})
+
+
+async def test_saturated_queue_sheds_with_429_and_retry_after(
+    async_client, optimize_body, fake_gemini
+):
+    fake_gemini(latency=0.3)
+    pool_module.gemini_client_pool.limiter = ModelConcurrencyLimiter(
+        default_limit=1, max_queue=0
+    )
+    bodies = [
+        {**optimize_body, "original_prompt": f"prompt {i}", "use_cache": False}
+        for i in range(2)
+    ]
+
+    first, second = await asyncio.gather(
+        async_client.post("/api/v1/prompts/optimize", json=bodies[0]),
+        async_client.post("/api/v1/prompts/optimize", json=bodies[1]),
+    )
+
+    statuses = sorted([first.status_code, second.status_code])
+    assert statuses == [200, 429]
+    shed = first if first.status_code == 429 else second
+    assert int(shed.headers["Retry-After"]) >= 1
+    stats = pool_module.gemini_client_pool.limiter.stats()
+    assert stats[optimize_body["model"]]["shed"] == 1
+
+
+async def test_waiters_run_in_order_within_limit():
+    limiter = AdaptiveLimiter(max_limit=1, max_queue=5)
+    order = []
+
+    async def call(name: str):
+        await limiter.acquire()
+        order.append(name)
+        await asyncio.sleep(0.01)
+        limiter.release(None, 0.01)
+
+    await asyncio.gather(*(call(name) for name in "abc"))
+
+    assert order == ["a", "b", "c"]
+    assert limiter.in_flight == 0
+
+
+async def test_full_queue_raises_load_shed_error():
+    limiter = AdaptiveLimiter(max_limit=1, max_queue=0)
+    await limiter.acquire()
+
+    with pytest.raises(LoadShedError) as excinfo:
+        await limiter.acquire()
+
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.retry_after >= 1
+
+
+def test_limit_backs_off_on_429_and_recovers_on_success():
+    limiter = AdaptiveLimiter(max_limit=8, min_limit=1)
+
+    limiter.in_flight = 1
+    limiter.release(_throttled(), 0.1)
+    assert limiter.limit == 4
+    assert limiter.throttled == 1
+
+    for _ in range(4):
+        limiter.in_flight = 1
+        limiter.release(None, 0.1)
+    assert limiter.limit > 4.5
+
+
+def test_per_model_limits():
+    limiter = ModelConcurrencyLimiter(default_limit=16, limits={"pro": 2})
+
+    assert limiter.limiter("pro").max_limit == 2
+    assert limiter.limiter("flash").max_limit == 16
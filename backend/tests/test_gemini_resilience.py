@@ -0,0 +1,77 @@
+import httpx
+import pytest
+
+from app.services.gemini_resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    GeminiResilience,
+    GeminiUnavailableError,
+)
+
+
+def _generate_calls(server) -> list[dict]:
+    return [r for r in server.requests if r["action"] == "generateContent"]
+
+
+def test_transient_503_is_retried(client, optimize_body, fake_gemini):
+    server = fake_gemini(failures=[503])
+
+    response = client.post("/api/v1/prompts/optimize", json=optimize_body)
+
+    assert response.status_code == 200
+    assert len(_generate_calls(server)) == 2
+
+
+def test_exhausted_retries_return_503(client, optimize_body, fake_gemini):
+    server = fake_gemini(failures=[503] * 3)
+
+    response = client.post("/api/v1/prompts/optimize", json=optimize_body)
+
+    assert response.status_code == 503
+    assert "Retry-After" not in response.headers
+    assert len(_generate_calls(server)) == 3
+
+
+def test_long_retry_after_returns_429_with_header(client, optimize_body, fake_gemini):
+    # Retry-After 超過 max_retry_after 時不在伺服器端等待，直接轉交用戶端
+    server = fake_gemini(failures=[429], retry_after="60")
+
+    response = client.post("/api/v1/prompts/optimize", json=optimize_body)
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "60"
+    assert len(_generate_calls(server)) == 1
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0)
+
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(httpx.ConnectError("boom"))
+
+    assert breaker.state == "open"
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(None)
+    assert breaker.state == "closed"
+
+
+async def test_open_breaker_rejects_without_calling_upstream():
+    resilience = GeminiResilience(base_delay=0, max_attempts=1, failure_threshold=1)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise httpx.ConnectError("boom")
+
+    with pytest.raises(GeminiUnavailableError):
+        await resilience.call("model", failing)
+    with pytest.raises(CircuitOpenError) as excinfo:
+        await resilience.call("model", failing)
+
+    assert len(calls) == 1
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.retry_after > 0
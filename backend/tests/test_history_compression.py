@@ -0,0 +1,77 @@
+import pytest
+from sqlmodel import Session, select
+
+from app.dependencies import engine
+from app.models import HistoryDictionary, PromptBlob
+from app.services.history_compression import (
+    HistoryCompressor,
+    history_compressor,
+    train_dictionary,
+)
+
+TEMPLATED = [
+    "## 角色\n你是資深的資料庫工程師\n## 任務\n"
+    f"請優化第 {index} 個查詢並說明索引的選擇\n## 輸出格式\n條列式說明，附上 SQL"
+    for index in range(30)
+]
+
+
+def test_round_trip_and_thresholds():
+    compressor = HistoryCompressor(min_bytes=64)
+    text = "describe the schema " * 20
+
+    blob = compressor.compress(text)
+
+    assert blob is not None and len(blob) < len(text)
+    assert compressor.decompress(blob) == text
+    assert compressor.full_text("preview", blob) == text
+    assert compressor.full_text("plain", None) == "plain"
+    assert compressor.compress("short") is None
+    assert HistoryCompressor(enabled=False).compress(text * 10) is None
+
+
+def test_dictionary_shrinks_templated_text():
+    plain = HistoryCompressor(min_bytes=0)
+    with_dictionary = HistoryCompressor(min_bytes=0)
+    with_dictionary.add_dictionary(1, train_dictionary(TEMPLATED))
+    text = TEMPLATED[0].replace("第 0 個", "第 99 個")
+
+    blob = with_dictionary.compress(text)
+
+    # 短內容單獨壓縮不會變小，共用字典才有效果
+    assert plain.compress(text) is None
+    assert blob is not None
+    assert with_dictionary.decompress(blob) == text
+
+
+def test_unknown_dictionary_is_loaded_from_database():
+    data = train_dictionary(TEMPLATED)
+    with Session(engine) as session:
+        dictionary = HistoryDictionary(data=data, sample_count=len(TEMPLATED))
+        session.add(dictionary)
+        session.commit()
+        dictionary_id = dictionary.dictionary_id
+    writer = HistoryCompressor(min_bytes=0)
+    writer.add_dictionary(dictionary_id, data)
+
+    blob = writer.compress(TEMPLATED[1])
+
+    assert history_compressor.decompress(blob) == TEMPLATED[1]
+    with pytest.raises(ValueError):
+        history_compressor.decompress(blob[:1] + (999).to_bytes(4, "big") + blob[5:])
+
+
+def test_long_bodies_are_stored_compressed(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    fake_gemini()
+    long_prompt = "describe the schema " * 60
+    body = {**optimize_body, "original_prompt": long_prompt}
+    client.post("/api/v1/prompts/optimize", json=body, headers=auth_headers)
+
+    with Session(engine) as session:
+        blobs = session.exec(select(PromptBlob)).all()
+
+    assert len(blobs) == 2
+    assert all(blob.body is None and blob.body_z for blob in blobs)
+    assert long_prompt in {history_compressor.decompress(b.body_z) for b in blobs}
@@ -0,0 +1,69 @@
+from app.config import settings
+
+
+def test_list_returns_truncated_previews(
+    client, auth_headers, add_history, monkeypatch
+):
+    monkeypatch.setattr(settings, "history_preview_chars", 20)
+    add_history(1, prompt="short")
+    add_history(1, prompt="a much longer prompt {index}")
+
+    long_item, short_item = client.get(
+        "/api/v1/prompts/history", headers=auth_headers
+    ).json()
+
+    assert long_item["original_prompt"] == "a much longer prompt"
+    assert long_item["truncated"] is True
+    assert short_item["original_prompt"] == "short"
+    assert short_item["optimized_prompt"] == "optimized short"
+    assert short_item["truncated"] is False
+
+
+def test_detail_returns_full_blob_content(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    fake_gemini()
+    long_prompt = "describe the schema " * 60
+    body = {**optimize_body, "original_prompt": long_prompt}
+    client.post("/api/v1/prompts/optimize", json=body, headers=auth_headers)
+    [preview] = client.get("/api/v1/prompts/history", headers=auth_headers).json()
+
+    response = client.get(
+        f"/api/v1/prompts/history/{preview['history_id']}", headers=auth_headers
+    )
+
+    assert preview["truncated"] is True
+    assert len(preview["original_prompt"]) == settings.history_preview_chars
+    assert response.status_code == 200
+    assert response.json()["original_prompt"] == long_prompt
+    assert response.json()["optimized_prompt"] == f"[optimized] {long_prompt}"
+
+
+def test_detail_etag_and_not_modified(client, auth_headers, add_history):
+    [history_id] = add_history(1)
+    url = f"/api/v1/prompts/history/{history_id}"
+
+    response = client.get(url, headers=auth_headers)
+    etag = response.headers["ETag"]
+    cached = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+
+def test_detail_of_missing_or_foreign_row_is_404(client, auth_headers, add_history):
+    [history_id] = add_history(1)
+    other = client.post(
+        "/api/v1/auth/register",
+        json={"username": "other", "email": "o@example.com", "password": "password123"},
+    ).json()["access_token"]
+
+    missing = client.get("/api/v1/prompts/history/999999", headers=auth_headers)
+    foreign = client.get(
+        f"/api/v1/prompts/history/{history_id}",
+        headers={"Authorization": f"Bearer {other}"},
+    )
+
+    assert missing.status_code == 404
+    assert foreign.status_code == 404
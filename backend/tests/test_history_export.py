@@ -0,0 +1,104 @@
+import csv
+import gzip
+import io
+import json
+
+from sqlmodel import Session, select
+
+from app.api.history import _export_batches, _history_filters
+from app.config import settings
+from app.dependencies import engine
+from app.models import User
+
+
+def _ndjson(response) -> list[dict]:
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_ndjson_export_streams_all_rows_in_batches(
+    client, auth_headers, add_history, monkeypatch
+):
+    monkeypatch.setattr(settings, "history_export_batch_size", 3)
+    ids = add_history(7)
+
+    response = client.get("/api/v1/prompts/history/export", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"].endswith('.ndjson"')
+    rows = _ndjson(response)
+    assert [row["history_id"] for row in rows] == ids[::-1]
+    assert rows[-1]["original_prompt"] == "history prompt 0"
+
+
+def test_connection_is_returned_between_batches(auth_headers, add_history):
+    ids = add_history(5)
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.username == "testuser")).one()
+    conditions = _history_filters(user.user_id, None, None, None)
+
+    exported = []
+    for batch in _export_batches(conditions, 2):
+        # 等待用戶端接收期間不佔用連線（也不保持開啟的交易）
+        assert engine.pool.checkedout() == 0
+        exported.extend(item.history_id for item in batch)
+
+    assert exported == ids[::-1]
+
+
+def test_csv_export_has_bom_and_header(client, auth_headers, add_history):
+    add_history(2, prompt="含有, 逗號 {index}")
+
+    response = client.get(
+        "/api/v1/prompts/history/export?format=csv", headers=auth_headers
+    )
+
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    text = response.content.decode("utf-8")
+    assert text.startswith("\ufeff")
+    rows = list(csv.DictReader(io.StringIO(text.removeprefix("\ufeff"))))
+    assert [row["original_prompt"] for row in rows] == ["含有, 逗號 1", "含有, 逗號 0"]
+
+
+def test_gzip_export(client, auth_headers, add_history):
+    add_history(3)
+
+    response = client.get(
+        "/api/v1/prompts/history/export?gzip=true", headers=auth_headers
+    )
+
+    assert response.headers["content-type"] == "application/gzip"
+    assert response.headers["content-disposition"].endswith('.ndjson.gz"')
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert len(lines) == 3
+
+
+def test_export_filters_by_model(client, auth_headers, add_history):
+    add_history(2, model="gemini-2.5-pro")
+    add_history(1)
+
+    response = client.get(
+        "/api/v1/prompts/history/export?model=gemini-2.5-pro", headers=auth_headers
+    )
+
+    assert [row["model_used"] for row in _ndjson(response)] == ["gemini-2.5-pro"] * 2
+
+
+def test_export_includes_full_long_prompts(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    fake_gemini()
+    long_prompt = "describe the schema " * 60
+    body = {**optimize_body, "original_prompt": long_prompt}
+    client.post("/api/v1/prompts/optimize", json=body, headers=auth_headers)
+
+    [row] = _ndjson(client.get("/api/v1/prompts/history/export", headers=auth_headers))
+
+    assert row["original_prompt"] == long_prompt
+    assert row["optimized_prompt"] == f"[optimized] {long_prompt}"
+
+
+def test_export_requires_authentication(client):
+    response = client.get("/api/v1/prompts/history/export")
+
+    assert response.status_code in (401, 403)
@@ -0,0 +1,74 @@
+from datetime import UTC, datetime, timedelta
+
+
+def _pages(client, headers, url: str) -> list[list[int]]:
+    pages = []
+    while url:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        pages.append([item["history_id"] for item in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        url = f"/api/v1/prompts/history?limit=3&cursor={cursor}" if cursor else None
+    return pages
+
+
+def test_cursor_walks_every_row_newest_first(client, auth_headers, add_history):
+    ids = add_history(8)
+
+    pages = _pages(client, auth_headers, "/api/v1/prompts/history?limit=3")
+
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert [i for page in pages for i in page] == ids[::-1]
+
+
+def test_rows_with_equal_timestamps_are_not_skipped(client, auth_headers, add_history):
+    ids = add_history(7, step=timedelta(0))
+
+    pages = _pages(client, auth_headers, "/api/v1/prompts/history?limit=3")
+
+    assert [i for page in pages for i in page] == sorted(ids, reverse=True)
+
+
+def test_next_page_headers(client, auth_headers, add_history):
+    add_history(2)
+
+    response = client.get("/api/v1/prompts/history?limit=1", headers=auth_headers)
+
+    cursor = response.headers["X-Next-Cursor"]
+    assert response.headers["Link"].endswith('>; rel="next"')
+    assert f"cursor={cursor}" in response.headers["Link"]
+    last = client.get(
+        f"/api/v1/prompts/history?limit=1&cursor={cursor}", headers=auth_headers
+    )
+    assert "X-Next-Cursor" not in last.headers
+
+
+def test_model_and_date_filters(client, auth_headers, add_history):
+    day = datetime(2026, 3, 10, 12, tzinfo=UTC)
+    add_history(2, model="gemini-2.5-pro", start=day, step=timedelta(days=1))
+    [flash] = add_history(1, start=day)
+
+    by_model = client.get(
+        "/api/v1/prompts/history?model=gemini-2.5-flash", headers=auth_headers
+    ).json()
+    by_date = client.get(
+        "/api/v1/prompts/history?start_date=2026-03-11&end_date=2026-03-11",
+        headers=auth_headers,
+    ).json()
+
+    assert [item["history_id"] for item in by_model] == [flash]
+    assert [item["created_at"][:10] for item in by_date] == ["2026-03-11"]
+
+
+def test_invalid_cursor_is_rejected(client, auth_headers):
+    response = client.get(
+        "/api/v1/prompts/history?cursor=not-a-cursor", headers=auth_headers
+    )
+
+    assert response.status_code == 400
+
+
+def test_limit_is_bounded(client, auth_headers):
+    response = client.get("/api/v1/prompts/history?limit=100000", headers=auth_headers)
+
+    assert response.status_code == 422
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import UTC, date, datetime, timedelta, timezone
+
+import pytest
+from sqlmodel import Session
+
+from app.dependencies import engine
+from app.services.history_partitions import (
+    HistoryPartitionManager,
+    add_months,
+    create_partition_sql,
+    is_partitioned,
+    partition_month,
+    partition_name,
+)
+from app.services.history_retention import HistoryRetention
+
+
+@pytest.mark.parametrize(
+    ("month", "months", "expected"),
+    [
+        (date(2026, 10, 18), 0, date(2026, 10, 1)),
+        (date(2026, 10, 1), 3, date(2027, 1, 1)),
+        (date(2026, 1, 31), -1, date(2025, 12, 1)),
+        (date(2026, 12, 1), 12, date(2027, 12, 1)),
+    ],
+)
+def test_add_months(month, months, expected):
+    assert add_months(month, months) == expected
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        # 未帶時區的時間視為 UTC，不依本機時區換算
+        (datetime(2026, 10, 31, 23, 30), date(2026, 10, 1)),
+        (datetime(2026, 11, 1, 0, 30, tzinfo=UTC), date(2026, 11, 1)),
+        (
+            datetime(2026, 11, 1, 7, 0, tzinfo=timezone(timedelta(hours=8))),
+            date(2026, 10, 1),
+        ),
+    ],
+)
+def test_partition_month_uses_utc(value, expected):
+    assert partition_month(value) == expected
+
+
+def test_partition_sql_covers_one_utc_month():
+    sql = create_partition_sql(date(2026, 12, 15))
+
+    assert partition_name(date(2026, 12, 1)) == "prompt_history_p202612"
+    assert sql == (
+        "CREATE TABLE IF NOT EXISTS prompt_history_p202612 "
+        "PARTITION OF prompt_history FOR VALUES "
+        "FROM ('2026-12-01 00:00:00+00') TO ('2027-01-01 00:00:00+00')"
+    )
+
+
+def test_manager_is_inactive_outside_postgres(caplog):
+    with Session(engine) as session:
+        assert is_partitioned(session.connection()) is False
+        assert HistoryPartitionManager(enabled=False).check(session) is False
+
+        manager = HistoryPartitionManager(enabled=True)
+        assert manager.check(session) is False
+
+    assert "尚未分區" in caplog.text
+    assert manager.stats()["active"] is False
+
+
+def test_retention_without_active_partitions_deletes_rows(add_history):
+    add_history(2, start=datetime.now(UTC) - timedelta(days=30))
+    retention = HistoryRetention(
+        global_days=7, pause=0, partitions=HistoryPartitionManager(enabled=True)
+    )
+
+    assert asyncio.run(retention.prune()) == 2
@@ -0,0 +1,143 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlmodel import Session, select
+
+from app.dependencies import engine
+from app.models import PromptHistory
+from app.services.history_retention import (
+    HistoryRetention,
+    effective_retention_days,
+    history_retention,
+)
+
+RETENTION_URL = "/api/v1/prompts/history/retention"
+DELETE_URL = "/api/v1/prompts/history/delete"
+
+
+def _remaining_ids() -> list[int]:
+    with Session(engine) as session:
+        statement = select(PromptHistory.history_id).order_by(PromptHistory.history_id)
+        return list(session.exec(statement).all())
+
+
+@pytest.mark.parametrize(
+    ("user_days", "global_days", "expected"),
+    [(None, None, None), (30, None, 30), (None, 7, 7), (30, 7, 7), (3, 7, 3)],
+)
+def test_effective_retention_days(user_days, global_days, expected):
+    assert effective_retention_days(user_days, global_days) == expected
+
+
+def test_retention_settings_round_trip(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(history_retention, "global_days", 90)
+
+    default = client.get(RETENTION_URL, headers=auth_headers).json()
+    updated = client.put(
+        RETENTION_URL, json={"retention_days": 30}, headers=auth_headers
+    ).json()
+    cleared = client.put(
+        RETENTION_URL, json={"retention_days": None}, headers=auth_headers
+    ).json()
+
+    assert default == {
+        "retention_days": None,
+        "global_retention_days": 90,
+        "effective_days": 90,
+    }
+    assert updated["retention_days"] == 30
+    assert updated["effective_days"] == 30
+    assert cleared["effective_days"] == 90
+
+
+def test_retention_days_are_validated(client, auth_headers):
+    response = client.put(
+        RETENTION_URL, json={"retention_days": 0}, headers=auth_headers
+    )
+
+    assert response.status_code == 422
+
+
+def test_bulk_delete_by_ids_ignores_missing_rows(client, auth_headers, add_history):
+    first, second, third = add_history(3)
+
+    response = client.post(
+        DELETE_URL, json={"history_ids": [first, third, 999999]}, headers=auth_headers
+    )
+
+    assert response.json() == {"deleted": 2}
+    assert _remaining_ids() == [second]
+
+
+def test_bulk_delete_by_date_range(client, auth_headers, add_history):
+    start = datetime(2026, 1, 1, 12, tzinfo=UTC)
+    january = add_history(2, start=start, step=timedelta(days=1))
+    february = add_history(1, start=start + timedelta(days=31))
+
+    response = client.post(
+        DELETE_URL,
+        json={"start_date": "2026-01-01", "end_date": "2026-01-31"},
+        headers=auth_headers,
+    )
+
+    assert response.json() == {"deleted": len(january)}
+    assert _remaining_ids() == february
+
+
+def test_bulk_delete_requires_a_selection(client, auth_headers):
+    empty = client.post(DELETE_URL, json={}, headers=auth_headers)
+    reversed_range = client.post(
+        DELETE_URL,
+        json={"start_date": "2026-02-01", "end_date": "2026-01-01"},
+        headers=auth_headers,
+    )
+
+    assert empty.status_code == 422
+    assert reversed_range.status_code == 422
+
+
+def test_prune_deletes_expired_rows_in_batches(client, auth_headers, add_history):
+    client.put(RETENTION_URL, json={"retention_days": 10}, headers=auth_headers)
+    add_history(5, start=datetime.now(UTC) - timedelta(days=30))
+    recent = add_history(2)
+    retention = HistoryRetention(batch_size=2, pause=0)
+
+    deleted = asyncio.run(retention.prune())
+
+    assert deleted == 5
+    assert _remaining_ids() == recent
+    assert retention.stats()["batches"] == 3
+    assert retention.stats()["runs"] == 1
+
+
+def test_global_retention_applies_to_users_without_a_setting(
+    client, auth_headers, add_history
+):
+    add_history(2, start=datetime.now(UTC) - timedelta(days=30))
+    recent = add_history(1)
+
+    assert asyncio.run(HistoryRetention().prune()) == 0
+    assert asyncio.run(HistoryRetention(global_days=7).prune()) == 2
+    assert _remaining_ids() == recent
+
+
+async def test_loop_survives_unexpected_errors(monkeypatch, caplog):
+    retention = HistoryRetention(interval=0.01)
+    calls = 0
+
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ValueError("corrupt blob")
+        return 0
+
+    monkeypatch.setattr(retention, "prune", flaky)
+    retention.start()
+    await asyncio.sleep(0.05)
+    await retention.stop()
+
+    assert calls > 1
+    assert retention.stats()["failures"] == 1
+    assert "corrupt blob" in caplog.text
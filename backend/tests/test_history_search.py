@@ -0,0 +1,157 @@
+import sqlite3
+
+from sqlmodel import Session, select
+
+from app.dependencies import engine
+from app.models import PromptHistory, User
+from app.services.history_search import index_history_bodies
+from app.services.history_writer import HistoryWriter
+
+
+def _search(client, headers, q: str, **params) -> list[dict]:
+    response = client.get(
+        "/api/v1/prompts/history/search", params={"q": q, **params}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _prompts(results: list[dict]) -> list[str]:
+    return [item["original_prompt"] for item in results]
+
+
+def test_all_terms_must_match(client, auth_headers, add_history):
+    add_history(1, prompt="postgres index tuning")
+    add_history(1, prompt="postgres backup script")
+
+    results = _search(client, auth_headers, "postgres index")
+
+    assert _prompts(results) == ["postgres index tuning"]
+    assert results[0]["score"] > 0
+
+
+def test_more_relevant_rows_rank_first(client, auth_headers, add_history):
+    add_history(1, prompt="a note that mentions caching once")
+    add_history(1, prompt="caching caching caching strategies")
+
+    results = _search(client, auth_headers, "caching")
+
+    assert _prompts(results)[0] == "caching caching caching strategies"
+
+
+def test_short_and_cjk_terms(client, auth_headers, add_history):
+    add_history(1, prompt="優化資料庫查詢 in go")
+    add_history(1, prompt="優化資料庫查詢 in rust")
+
+    assert len(_search(client, auth_headers, "資料庫")) == 2
+    assert _prompts(_search(client, auth_headers, "資料庫 go")) == [
+        "優化資料庫查詢 in go"
+    ]
+
+
+def test_other_users_rows_are_not_returned(client, auth_headers, add_history):
+    add_history(1, prompt="shared keyword mine")
+    with Session(engine) as session:
+        other = User(username="other", email="other@example.com", password_hash="x")
+        session.add(other)
+        session.commit()
+        theirs = PromptHistory(
+            user_id=other.user_id,
+            original_prompt="shared keyword theirs",
+            optimized_prompt="optimized",
+            template_id=1,
+            model_used="gemini-2.5-flash",
+            temperature=0.2,
+        )
+        session.add(theirs)
+        session.flush()
+        index_history_bodies(
+            session, [(theirs.history_id, theirs.original_prompt, "optimized")]
+        )
+        session.commit()
+
+    assert _prompts(_search(client, auth_headers, "keyword")) == ["shared keyword mine"]
+
+
+def test_long_prompt_is_searchable_beyond_preview(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    fake_gemini()
+    long_prompt = "describe the schema " * 60 + "needle-term"
+    body = {**optimize_body, "original_prompt": long_prompt}
+    client.post("/api/v1/prompts/optimize", json=body, headers=auth_headers)
+
+    results = _search(client, auth_headers, "needle-term")
+
+    assert _prompts(results) == [long_prompt]
+
+
+def test_write_behind_rows_are_searchable(client, auth_headers):
+    long_prompt = "describe the schema " * 60 + "writer-needle"
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.username == "testuser")).one()
+    HistoryWriter._write(
+        [
+            PromptHistory(
+                user_id=user.user_id,
+                original_prompt=prompt,
+                optimized_prompt=f"optimized {prompt}",
+                template_id=1,
+                model_used="gemini-2.5-flash",
+                temperature=0.2,
+            )
+            for prompt in (long_prompt, "short writer-needle")
+        ]
+    )
+
+    results = _search(client, auth_headers, "writer-needle")
+
+    assert sorted(_prompts(results)) == sorted([long_prompt, "short writer-needle"])
+
+
+def test_schema_does_not_depend_on_app_functions(add_history):
+    [history_id] = add_history(1, prompt="raw connection entry")
+    # 未註冊 history_text 的一般連線
+    connection = sqlite3.connect(engine.url.database)
+    try:
+        with connection:
+            schema = connection.execute(
+                "SELECT name FROM sqlite_master WHERE sql LIKE '%history_text%'"
+            ).fetchall()
+            connection.execute(
+                "DELETE FROM prompt_history WHERE history_id = ?", (history_id,)
+            )
+        indexed = connection.execute(
+            "SELECT count(*) FROM prompt_history_fts WHERE rowid = ?", (history_id,)
+        ).fetchone()
+    finally:
+        connection.close()
+
+    assert schema == []
+    assert indexed == (0,)
+
+
+def test_deleted_rows_leave_the_index(client, auth_headers, add_history):
+    [history_id] = add_history(1, prompt="temporary entry")
+    client.delete(f"/api/v1/prompts/history/{history_id}", headers=auth_headers)
+
+    assert _search(client, auth_headers, "temporary") == []
+
+
+def test_pagination_link(client, auth_headers, add_history):
+    add_history(3, prompt="paged result {index}")
+
+    response = client.get(
+        "/api/v1/prompts/history/search?q=paged&limit=2", headers=auth_headers
+    )
+
+    assert len(response.json()) == 2
+    assert "offset=2" in response.headers["Link"]
+
+
+def test_blank_query_is_rejected(client, auth_headers):
+    response = client.get(
+        "/api/v1/prompts/history/search", params={"q": "   "}, headers=auth_headers
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, func, select
+
+from app.dependencies import engine
+from app.models import PromptHistory, UsageRollup, User
+from app.services.history_writer import HistoryWriter
+
+
+@pytest.fixture
+def user_id() -> int:
+    with Session(engine) as session:
+        user = User(username="writer", email="writer@example.com", password_hash="x")
+        session.add(user)
+        session.commit()
+        return user.user_id
+
+
+@pytest.fixture
+def make_history(user_id):
+    def make(prompt: str = "prompt", model: str | None = "gemini-2.5-flash"):
+        return PromptHistory(
+            user_id=user_id,
+            original_prompt=prompt,
+            optimized_prompt=f"optimized {prompt}",
+            template_id=1,
+            model_used=model,
+            temperature=0.2,
+        )
+
+    return make
+
+
+def _stored_prompts() -> list[str]:
+    with Session(engine) as session:
+        statement = select(PromptHistory.original_prompt).order_by(
+            PromptHistory.history_id
+        )
+        return list(session.exec(statement).all())
+
+
+def _operational_error() -> OperationalError:
+    return OperationalError("INSERT", {}, Exception("database is locked"))
+
+
+async def test_submitted_rows_are_written_in_batches(make_history):
+    writer = HistoryWriter(enabled=True, batch_size=2, flush_interval=0.01)
+    writer.start()
+
+    assert await writer.submit([make_history(f"p{i}") for i in range(5)])
+    await writer.stop()
+
+    assert _stored_prompts() == [f"p{i}" for i in range(5)]
+    with Session(engine) as session:
+        assert session.exec(select(func.sum(UsageRollup.requests))).one() == 5
+    stats = writer.stats()
+    assert stats["flushed_rows"] == 5
+    assert stats["depth"] == 0
+
+
+async def test_bad_row_is_dropped_and_others_written(make_history):
+    writer = HistoryWriter(enabled=True)
+    writer._buffer = [make_history("good 1"), make_history(model=None)]
+    writer._buffer.append(make_history("good 2"))
+
+    assert await writer.flush() is True
+
+    assert _stored_prompts() == ["good 1", "good 2"]
+    assert writer.stats()["dropped"] == 1
+    assert writer.stats()["failures"] == 1
+    assert writer.stats()["depth"] == 0
+
+
+async def test_unavailable_database_requeues_rows(make_history, monkeypatch):
+    writer = HistoryWriter(enabled=True)
+    rows = [make_history(f"p{i}") for i in range(3)]
+    writer._buffer = list(rows)
+
+    def unavailable(histories):
+        raise _operational_error()
+
+    monkeypatch.setattr(writer, "_write", unavailable)
+
+    assert await writer.flush() is False
+    assert writer._buffer == rows
+    assert writer.stats()["dropped"] == 0
+
+
+async def test_requeue_is_capped_at_max_buffer(make_history, monkeypatch):
+    writer = HistoryWriter(enabled=True, max_buffer=3, batch_size=2)
+    rows = [make_history(f"p{i}") for i in range(3)]
+    late = [make_history("late 1"), make_history("late 2")]
+    writer._buffer = list(rows)
+
+    def unavailable(histories):
+        # 寫入期間有新的記錄進入緩衝區
+        if late[0] not in writer._buffer:
+            writer._buffer.extend(late)
+        raise _operational_error()
+
+    monkeypatch.setattr(writer, "_write", unavailable)
+
+    assert await writer.flush() is False
+    assert writer._buffer == [rows[2], *late]
+    assert writer.stats()["dropped"] == 2
+
+
+async def test_flush_loop_survives_unexpected_errors(make_history, monkeypatch):
+    writer = HistoryWriter(enabled=True, flush_interval=0.01)
+    original = writer.flush
+    calls = 0
+
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("unexpected")
+        return await original()
+
+    monkeypatch.setattr(writer, "flush", flaky)
+    writer.start()
+    await asyncio.sleep(0.05)
+
+    assert await writer.submit([make_history("after error")])
+    await writer.stop()
+
+    assert _stored_prompts() == ["after error"]
+    assert writer.stats()["failures"] == 1
+
+
+async def test_submit_is_refused_when_task_has_died(make_history):
+    writer = HistoryWriter(enabled=True)
+    writer.start()
+    writer._task.cancel()
+    await asyncio.sleep(0)
+
+    assert await writer.submit([make_history()]) is False
+
+
+def test_writer_restarts_on_a_new_event_loop(make_history):
+    writer = HistoryWriter(enabled=True, flush_interval=0.01)
+
+    async def cycle(prompt: str):
+        writer.start()
+        assert await writer.submit([make_history(prompt)])
+        await asyncio.sleep(0.03)
+        await writer.stop()
+
+    asyncio.run(cycle("first loop"))
+    asyncio.run(cycle("second loop"))
+
+    assert _stored_prompts() == ["first loop", "second loop"]
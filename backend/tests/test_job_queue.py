@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from app.schemas.optimize import PromptOptimizeRequest
+from app.services.job_queue import (
+    InMemoryJobQueue,
+    JobStatus,
+    OptimizeJobQueue,
+    RedisJobQueue,
+)
+from app.utils import get_async_redis_client
+
+
+def test_base_queue_is_abstract():
+    class Incomplete(OptimizeJobQueue):
+        async def submit(self, user_id, request):
+            return "job"
+
+    with pytest.raises(TypeError):
+        OptimizeJobQueue()
+    with pytest.raises(TypeError):
+        Incomplete()
+    assert isinstance(InMemoryJobQueue(), OptimizeJobQueue)
+
+
+def test_job_runs_in_background_and_long_polls(client, optimize_body, fake_gemini):
+    fake_gemini()
+
+    submitted = client.post("/api/v1/prompts/optimize/jobs", json=optimize_body)
+
+    assert submitted.status_code == 202
+    job_id = submitted.json()["job_id"]
+    job = client.get(f"/api/v1/prompts/optimize/jobs/{job_id}?wait=5").json()
+    assert job["status"] == JobStatus.SUCCEEDED.value
+    assert job["result"]["optimized_prompt"] == (
+        f"[optimized] {optimize_body['original_prompt']}"
+    )
+    assert job["finished_at"] is not None
+
+
+def test_failed_job_records_error(client, optimize_body, fake_gemini):
+    fake_gemini()
+    body = {**optimize_body, "template_id": 9999}
+
+    job_id = client.post("/api/v1/prompts/optimize/jobs", json=body).json()["job_id"]
+    job = client.get(f"/api/v1/prompts/optimize/jobs/{job_id}?wait=5").json()
+
+    assert job["status"] == JobStatus.FAILED.value
+    assert job["error"] == "模板不存在"
+
+
+def test_job_is_private_to_its_owner(client, auth_headers, optimize_body, fake_gemini):
+    fake_gemini()
+    job_id = client.post(
+        "/api/v1/prompts/optimize/jobs", json=optimize_body, headers=auth_headers
+    ).json()["job_id"]
+
+    assert client.get(f"/api/v1/prompts/optimize/jobs/{job_id}").status_code == 404
+    owner = client.get(f"/api/v1/prompts/optimize/jobs/{job_id}", headers=auth_headers)
+    assert owner.status_code == 200
+
+
+def test_full_queue_returns_503_with_retry_after(client, optimize_body, job_queue):
+    job_queue.max_depth = 0
+
+    response = client.post("/api/v1/prompts/optimize/jobs", json=optimize_body)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+
+async def test_redis_queue_worker_processes_and_deletes_message(
+    optimize_body, fake_gemini
+):
+    fake_gemini()
+    queue = RedisJobQueue(poll_interval_seconds=0.01)
+    stop = asyncio.Event()
+    worker = asyncio.create_task(queue.run_worker(stop, concurrency=2))
+
+    job_id = await queue.submit(None, PromptOptimizeRequest(**optimize_body))
+    job = await queue.wait(job_id, timeout=5)
+    stop.set()
+    await worker
+
+    assert job["status"] == JobStatus.SUCCEEDED.value
+    assert job["result"]["model"] == optimize_body["model"]
+    # 請求內容含 API 金鑰，完成後不應留在 stream 中
+    assert await get_async_redis_client().xlen(RedisJobQueue.STREAM_KEY) == 0
+    stats = await queue.stats()
+    assert stats["submitted"] == 1
+    assert stats["succeeded"] == 1
+    assert stats["depth"] == 0
@@ -0,0 +1,76 @@
+import json
+
+from app.api import models as models_api
+from app.services.gemini_client import GeminiModel
+from app.services.model_catalogue import ModelCatalogue
+
+
+def _names(catalogue: ModelCatalogue) -> list[str]:
+    return [model.name for model in catalogue.models()]
+
+
+def test_endpoint_serves_catalogue_with_etag(client):
+    response = client.get("/api/v1/models/models")
+
+    assert response.status_code == 200
+    assert [m["name"] for m in response.json()] == [m.value for m in GeminiModel]
+    etag = response.headers["ETag"]
+    assert "max-age=" in response.headers["Cache-Control"]
+
+    cached = client.get("/api/v1/models/models", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+
+
+async def test_refresh_merges_upstream_generate_models(fake_gemini):
+    server = fake_gemini()
+    catalogue = ModelCatalogue(api_key="catalogue-key")
+    fallback_etag = catalogue.etag
+
+    assert await catalogue.refresh() is True
+
+    names = _names(catalogue)
+    assert names[: len(GeminiModel)] == [m.value for m in GeminiModel]
+    assert "gemini-3.0-flash" in names
+    assert "text-embedding-004" not in names
+    assert catalogue.etag != fallback_etag
+    assert json.loads(catalogue.body)[-1]["name"] == names[-1]
+    assert catalogue.stats()["source"] == "upstream"
+    assert [r["api_key"] for r in server.requests] == ["catalogue-key"]
+
+
+async def test_failed_refresh_keeps_previous_catalogue(monkeypatch):
+    catalogue = ModelCatalogue(api_key="catalogue-key")
+    before = (_names(catalogue), catalogue.etag)
+
+    async def unavailable():
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(catalogue, "_fetch_upstream", unavailable)
+
+    assert await catalogue.refresh() is False
+    assert (_names(catalogue), catalogue.etag) == before
+    assert catalogue.stats()["failures"] == 1
+    assert catalogue.stats()["source"] == "fallback"
+
+
+def test_endpoint_reflects_refreshed_catalogue(client, fake_gemini, monkeypatch):
+    fake_gemini()
+    catalogue = ModelCatalogue(api_key="catalogue-key")
+    monkeypatch.setattr(models_api, "model_catalogue", catalogue)
+    old_etag = client.get("/api/v1/models/models").headers["ETag"]
+
+    client.portal.call(catalogue.refresh)
+    response = client.get("/api/v1/models/models", headers={"If-None-Match": old_etag})
+
+    assert response.status_code == 200
+    assert "gemini-3.0-flash" in [m["name"] for m in response.json()]
+
+
+async def test_start_without_api_key_is_a_no_op():
+    catalogue = ModelCatalogue()
+
+    catalogue.start()
+
+    assert catalogue._task is None
+    await catalogue.stop()
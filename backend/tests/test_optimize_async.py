@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from sqlmodel import Session, select
+
+from app.dependencies import engine
+from app.models import PromptHistory
+
+
+def test_optimize_returns_upstream_text(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    server = fake_gemini()
+
+    response = client.post(
+        "/api/v1/prompts/optimize", json=optimize_body, headers=auth_headers
+    )
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["optimized_prompt"] == f"[optimized] {optimize_body['original_prompt']}"
+    assert data["model"] == "gemini-2.5-flash"
+    assert [r["action"] for r in server.requests] == ["generateContent"]
+    with Session(engine) as session:
+        histories = session.exec(select(PromptHistory)).all()
+    assert len(histories) == 1
+    assert histories[0].model_used == "gemini-2.5-flash"
+
+
+def test_anonymous_optimize_does_not_save_history(client, optimize_body, fake_gemini):
+    fake_gemini()
+
+    response = client.post("/api/v1/prompts/optimize", json=optimize_body)
+
+    assert response.status_code == 200, response.text
+    with Session(engine) as session:
+        assert session.exec(select(PromptHistory)).all() == []
+
+
+async def test_concurrent_optimize_calls_do_not_block_event_loop(
+    async_client, optimize_body, fake_gemini
+):
+    fake_gemini(latency=0.3)
+
+    async def optimize(index: int):
+        body = {**optimize_body, "original_prompt": f"prompt {index}"}
+        return await async_client.post("/api/v1/prompts/optimize", json=body)
+
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(optimize(i) for i in range(8)))
+    elapsed = time.perf_counter() - started
+
+    assert all(r.status_code == 200 for r in responses)
+    # 同步阻塞的實作需要約 8 × 0.3 秒；非同步路徑應接近單次延遲
+    assert elapsed < 1.5
+
+
+def test_optimize_rejects_empty_api_key(client, optimize_body):
+    response = client.post(
+        "/api/v1/prompts/optimize", json={**optimize_body, "api_key": ""}
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.dependencies import engine
+from app.models import PromptHistory, Template
+from app.services.gemini_client import GeminiClient
+from app.services.token_budget import optimize_token_budget
+
+
+def _items(response) -> list[dict]:
+    items = [json.loads(line) for line in response.text.splitlines()]
+    return sorted(items, key=lambda item: item["index"])
+
+
+def _batch_body(optimize_body: dict, prompts: list[str], **extra) -> dict:
+    body = {k: v for k, v in optimize_body.items() if k != "original_prompt"}
+    return {**body, "prompts": prompts, "use_cache": False, **extra}
+
+
+def test_batch_returns_one_line_per_prompt(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    fake_gemini()
+    prompts = [f"prompt number {i}" for i in range(5)]
+
+    response = client.post(
+        "/api/v1/prompts/optimize/batch",
+        json=_batch_body(optimize_body, prompts),
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    items = _items(response)
+    assert [item["index"] for item in items] == list(range(5))
+    assert [item["optimized_prompt"] for item in items] == [
+        f"[optimized] {p}" for p in prompts
+    ]
+    assert all(item["error"] is None for item in items)
+    with Session(engine) as session:
+        assert len(session.exec(select(PromptHistory)).all()) == 5
+
+
+def test_batch_limits_concurrent_upstream_calls(
+    client, optimize_body, fake_gemini, monkeypatch
+):
+    fake_gemini(latency=0.05)
+    original = GeminiClient.generate_content_with_usage_async
+    running = 0
+    peak = 0
+
+    async def tracked(self, *args, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(0.02)
+            return await original(self, *args, **kwargs)
+        finally:
+            running -= 1
+
+    monkeypatch.setattr(GeminiClient, "generate_content_with_usage_async", tracked)
+    prompts = [f"prompt {i}" for i in range(8)]
+
+    response = client.post(
+        "/api/v1/prompts/optimize/batch",
+        json=_batch_body(optimize_body, prompts, concurrency=2),
+    )
+
+    assert len(_items(response)) == 8
+    assert peak == 2
+
+
+def test_batch_item_errors_do_not_fail_other_items(
+    client, optimize_body, fake_gemini, monkeypatch
+):
+    fake_gemini()
+    with Session(engine) as session:
+        template = session.get(Template, optimize_body["template_id"])
+        template_tokens = optimize_token_budget.template_tokens(template)
+    monkeypatch.setattr(optimize_token_budget, "max_input_tokens", template_tokens + 20)
+
+    response = client.post(
+        "/api/v1/prompts/optimize/batch",
+        json=_batch_body(optimize_body, ["short prompt", "x" * 400]),
+    )
+
+    ok, too_long = _items(response)
+    assert ok["error"] is None
+    assert ok["optimized_prompt"] == "[optimized] short prompt"
+    assert too_long["optimized_prompt"] is None
+    assert "超過可用上限" in too_long["error"]
+
+
+def test_batch_rejects_too_many_prompts(client, optimize_body, monkeypatch):
+    monkeypatch.setattr(settings, "batch_optimize_max_items", 2)
+
+    response = client.post(
+        "/api/v1/prompts/optimize/batch",
+        json=_batch_body(optimize_body, ["a", "b", "c"]),
+    )
+
+    assert response.status_code == 400
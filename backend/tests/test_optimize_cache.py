@@ -0,0 +1,83 @@
+from app.services.optimize_cache import OptimizeResultCache, optimize_fingerprint
+
+
+def _generate_calls(server) -> list[dict]:
+    return [r for r in server.requests if r["action"] == "generateContent"]
+
+
+def test_fingerprint_normalizes_whitespace():
+    def fingerprint(template="template", prompt="hello world", temperature=0.2):
+        return optimize_fingerprint(template, prompt, "gemini", temperature, None)
+
+    assert fingerprint(prompt=" hello   world\n") == fingerprint()
+    assert fingerprint(temperature=0.3) != fingerprint()
+    assert fingerprint(template="other") != fingerprint()
+
+
+def test_cache_key_is_scoped_by_api_key():
+    cache = OptimizeResultCache()
+    args = ("template", "hello", "gemini", 0.2, None)
+
+    key = cache.build_key("key-a", *args)
+
+    assert cache.build_key("key-a", *args) == key
+    assert cache.build_key("key-b", *args) != key
+    assert "key-a" not in key
+
+
+def test_identical_request_hits_cache(client, optimize_body, fake_gemini):
+    server = fake_gemini()
+
+    first = client.post("/api/v1/prompts/optimize", json=optimize_body).json()
+    second = client.post("/api/v1/prompts/optimize", json=optimize_body).json()
+
+    assert first["cache_hit"] is False
+    assert second["cache_hit"] is True
+    assert second["optimized_prompt"] == first["optimized_prompt"]
+    assert second["usage"]["total_tokens"] == 0
+    assert len(_generate_calls(server)) == 1
+
+
+def test_cached_result_is_not_served_to_another_api_key(
+    client, optimize_body, fake_gemini
+):
+    server = fake_gemini()
+
+    client.post("/api/v1/prompts/optimize", json=optimize_body)
+    other = client.post(
+        "/api/v1/prompts/optimize", json={**optimize_body, "api_key": "other-key"}
+    ).json()
+
+    assert other["cache_hit"] is False
+    assert [r["api_key"] for r in _generate_calls(server)] == [
+        "test-api-key",
+        "other-key",
+    ]
+
+
+def test_high_temperature_and_opt_out_skip_cache(client, optimize_body, fake_gemini):
+    server = fake_gemini()
+    hot = {**optimize_body, "temperature": 0.9}
+    opt_out = {**optimize_body, "use_cache": False}
+
+    for body in (hot, hot, opt_out, opt_out):
+        response = client.post("/api/v1/prompts/optimize", json=body)
+        assert response.json()["cache_hit"] is False
+
+    assert len(_generate_calls(server)) == 4
+
+
+async def test_evicts_oldest_entries_over_capacity():
+    cache = OptimizeResultCache(max_entries=2)
+    keys = [
+        cache.build_key("key", "t", f"prompt {i}", "m", 0.0, None) for i in range(3)
+    ]
+
+    for index, key in enumerate(keys):
+        await cache.set(key, {"optimized_prompt": str(index)})
+
+    assert await cache.get(keys[0]) is None
+    assert await cache.get(keys[2]) == {"optimized_prompt": "2"}
+    stats = await cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
@@ -0,0 +1,127 @@
+import asyncio
+import gc
+import json
+
+from sqlmodel import Session, select
+
+from app.dependencies import engine
+from app.models import PromptHistory
+from app.services.gemini_client import GeminiClient
+from app.services.prompt_optimizer import PromptOptimizerService
+
+MODELS = ["gemini-2.5-pro", "gemini-2.5-flash"]
+
+
+def _fan_out_body(optimize_body: dict, mode: str) -> dict:
+    return {
+        **optimize_body,
+        "model": None,
+        "models": MODELS,
+        "fan_out_mode": mode,
+        "use_cache": False,
+    }
+
+
+def _slow_model(monkeypatch, slow: str, delay: float = 1.0) -> None:
+    """讓指定模型的呼叫變慢"""
+    original = GeminiClient.generate_content_with_usage_async
+
+    async def delayed(self, *args, **kwargs):
+        if kwargs["model"] == slow:
+            await asyncio.sleep(delay)
+        return await original(self, *args, **kwargs)
+
+    monkeypatch.setattr(GeminiClient, "generate_content_with_usage_async", delayed)
+
+
+def _histories() -> list[PromptHistory]:
+    with Session(engine) as session:
+        return list(session.exec(select(PromptHistory)).all())
+
+
+def test_first_mode_returns_fastest_model(
+    client, auth_headers, optimize_body, fake_gemini, monkeypatch
+):
+    fake_gemini()
+    _slow_model(monkeypatch, slow="gemini-2.5-pro")
+
+    response = client.post(
+        "/api/v1/prompts/optimize",
+        json=_fan_out_body(optimize_body, "first"),
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+    assert response.json()["model"] == "gemini-2.5-flash"
+    assert [h.model_used for h in _histories()] == ["gemini-2.5-flash"]
+
+
+def test_all_mode_streams_every_model(client, auth_headers, optimize_body, fake_gemini):
+    server = fake_gemini()
+
+    response = client.post(
+        "/api/v1/prompts/optimize",
+        json=_fan_out_body(optimize_body, "all"),
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(r["model"] for r in results) == sorted(MODELS)
+    assert all(r["error"] is None and r["latency_ms"] >= 0 for r in results)
+    called = {r["model"] for r in server.requests if r["action"] == "generateContent"}
+    assert called == set(MODELS)
+    assert sorted(h.model_used for h in _histories()) == sorted(MODELS)
+
+
+def test_all_mode_reports_per_model_errors(
+    client, optimize_body, fake_gemini, monkeypatch
+):
+    fake_gemini()
+    original = GeminiClient.generate_content_with_usage_async
+
+    async def failing_pro(self, *args, **kwargs):
+        if kwargs["model"] == "gemini-2.5-pro":
+            raise RuntimeError("pro is down")
+        return await original(self, *args, **kwargs)
+
+    monkeypatch.setattr(GeminiClient, "generate_content_with_usage_async", failing_pro)
+
+    response = client.post(
+        "/api/v1/prompts/optimize", json=_fan_out_body(optimize_body, "all")
+    )
+
+    results = {r["model"]: r for r in map(json.loads, response.text.splitlines())}
+    assert "pro is down" in results["gemini-2.5-pro"]["error"]
+    assert results["gemini-2.5-flash"]["optimized_prompt"] is not None
+
+
+async def test_first_mode_awaits_cancelled_models_and_retrieves_errors():
+    service = PromptOptimizerService(None, gemini_client=None)
+    cleaned_up = []
+    unretrieved = []
+    loop = asyncio.get_running_loop()
+    loop.set_exception_handler(lambda _, context: unretrieved.append(context))
+
+    async def optimize_text(template, prompt, model, temperature, **kwargs):
+        if model == "failing":
+            raise RuntimeError("upstream failed")
+        if model == "slow":
+            try:
+                await asyncio.sleep(1.0)
+            finally:
+                cleaned_up.append(model)
+        return {"optimized_prompt": f"by {model}"}, False
+
+    service._optimize_text = optimize_text
+    model, result, _ = await service._optimize_first(
+        "template", "prompt", ["failing", "fast", "slow"], 0.2
+    )
+    gc.collect()
+    loop.set_exception_handler(None)
+
+    assert (model, result["optimized_prompt"]) == ("fast", "by fast")
+    # 回傳前已等待被取消的模型結束，且失敗模型的錯誤已被取回
+    assert cleaned_up == ["slow"]
+    assert unretrieved == []
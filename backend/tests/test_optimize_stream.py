@@ -0,0 +1,103 @@
+import json
+
+from sqlmodel import Session, select
+
+from app.dependencies import engine
+from app.models import PromptHistory, Template
+from app.services.token_budget import optimize_token_budget
+
+
+def _events(response) -> list[tuple[str, dict]]:
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def _histories() -> list[PromptHistory]:
+    with Session(engine) as session:
+        return list(session.exec(select(PromptHistory)).all())
+
+
+def test_stream_sends_chunks_then_done(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    fake_gemini()
+
+    response = client.post(
+        "/api/v1/prompts/optimize/stream", json=optimize_body, headers=auth_headers
+    )
+
+    assert response.status_code == 200
+    events = _events(response)
+    assert [name for name, _ in events[:-1]] == ["chunk"] * (len(events) - 1)
+    name, done = events[-1]
+    assert name == "done"
+    expected = f"[optimized] {optimize_body['original_prompt']}"
+    assert "".join(data["text"] for _, data in events[:-1]) == expected
+    assert done["optimized_prompt"] == expected
+    assert [h.optimized_prompt for h in _histories()] == [expected]
+
+
+def test_stream_done_reports_model_from_models_list(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    server = fake_gemini()
+    body = {**optimize_body, "model": None, "models": ["gemini-2.5-pro"]}
+
+    response = client.post(
+        "/api/v1/prompts/optimize/stream", json=body, headers=auth_headers
+    )
+
+    name, done = _events(response)[-1]
+    assert name == "done"
+    assert done["model"] == "gemini-2.5-pro"
+    assert server.requests[-1]["model"] == "gemini-2.5-pro"
+    assert _histories()[0].model_used == "gemini-2.5-pro"
+
+
+def test_empty_stream_is_an_error_and_not_saved(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    fake_gemini(empty_stream=True)
+
+    response = client.post(
+        "/api/v1/prompts/optimize/stream", json=optimize_body, headers=auth_headers
+    )
+
+    assert response.status_code == 200
+    assert [name for name, _ in _events(response)] == ["error"]
+    assert _histories() == []
+
+
+def test_stream_rejects_multiple_models(client, optimize_body):
+    body = {**optimize_body, "models": ["gemini-2.5-pro", "gemini-2.5-flash"]}
+
+    response = client.post("/api/v1/prompts/optimize/stream", json=body)
+
+    assert response.status_code == 400
+
+
+def test_done_reports_prompt_after_truncation(
+    client, auth_headers, optimize_body, fake_gemini, monkeypatch
+):
+    fake_gemini()
+    with Session(engine) as session:
+        template = session.get(Template, optimize_body["template_id"])
+        template_tokens = optimize_token_budget.template_tokens(template)
+    monkeypatch.setattr(optimize_token_budget, "overflow", "truncate")
+    monkeypatch.setattr(optimize_token_budget, "max_input_tokens", template_tokens + 20)
+    body = {**optimize_body, "original_prompt": "word " * 200}
+
+    response = client.post(
+        "/api/v1/prompts/optimize/stream", json=body, headers=auth_headers
+    )
+
+    name, done = _events(response)[-1]
+    assert name == "done"
+    sent = done["original_prompt"]
+    assert len(sent) < len(body["original_prompt"])
+    assert body["original_prompt"].startswith(sent)
+    assert done["optimized_prompt"] == f"[optimized] {sent}"
+    assert _histories()[0].original_prompt == sent
@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+from sqlmodel import Session, select
+
+from app.dependencies import engine
+from app.models import PromptBlob, PromptHistory, User
+from app.services.history_writer import HistoryWriter
+from app.services.prompt_blobs import body_hash
+
+LONG_PROMPT = "describe the schema " * 60
+
+
+@pytest.fixture
+def write_histories(auth_headers):
+    """以延遲寫入器的寫入路徑新增測試用戶的歷史記錄，回傳 history_id（由舊到新）"""
+
+    def write(*prompts: str) -> list[int]:
+        with Session(engine) as session:
+            user = session.exec(select(User).where(User.username == "testuser")).one()
+        HistoryWriter._write(
+            [
+                PromptHistory(
+                    user_id=user.user_id,
+                    original_prompt=prompt,
+                    optimized_prompt="optimized",
+                    template_id=1,
+                    model_used="gemini-2.5-flash",
+                    temperature=0.2,
+                )
+                for prompt in prompts
+            ]
+        )
+        with Session(engine) as session:
+            statement = select(PromptHistory.history_id).order_by(
+                PromptHistory.history_id
+            )
+            return list(session.exec(statement).all())
+
+    return write
+
+
+def _blobs() -> dict[str, int]:
+    with Session(engine) as session:
+        blobs = session.exec(select(PromptBlob)).all()
+        return {blob.blob_hash: blob.ref_count for blob in blobs}
+
+
+def test_identical_long_bodies_are_stored_once(write_histories):
+    write_histories(LONG_PROMPT, LONG_PROMPT, "short prompt")
+
+    with Session(engine) as session:
+        histories = session.exec(select(PromptHistory)).all()
+
+    assert _blobs() == {body_hash(LONG_PROMPT): 2}
+    long_rows = [h for h in histories if h.original_blob_hash is not None]
+    assert len(long_rows) == 2
+    assert all(len(h.original_prompt) < len(LONG_PROMPT) for h in long_rows)
+
+
+def test_deleting_histories_releases_blobs(client, auth_headers, write_histories):
+    first, second = write_histories(LONG_PROMPT, LONG_PROMPT)
+
+    client.delete(f"/api/v1/prompts/history/{first}", headers=auth_headers)
+    assert _blobs() == {body_hash(LONG_PROMPT): 1}
+
+    client.delete(f"/api/v1/prompts/history/{second}", headers=auth_headers)
+    assert _blobs() == {}
+
+
+def test_blob_rows_can_be_deleted_without_app_functions(write_histories):
+    [history_id] = write_histories(LONG_PROMPT + "raw-needle")
+    # 未註冊 history_text 的一般連線
+    connection = sqlite3.connect(engine.url.database)
+    count = (
+        "SELECT count(*) FROM prompt_history_fts "
+        "WHERE prompt_history_fts MATCH '\"raw-needle\"'"
+    )
+    try:
+        before = connection.execute(count).fetchone()
+        with connection:
+            connection.execute(
+                "DELETE FROM prompt_history WHERE history_id = ?", (history_id,)
+            )
+        after = connection.execute(count).fetchone()
+    finally:
+        connection.close()
+
+    assert before == (1,)
+    assert after == (0,)
@@ -0,0 +1,254 @@
+"""
+常用查詢的執行計畫回歸測試
+
+直接呼叫 `app/api/*.py` 的端點函式與 `PromptOptimizerService._get_template`，
+攔截實際執行的 SELECT 與 DELETE 並以 EXPLAIN 檢查：每個查詢都必須使用索引，
+不得退化為全表掃描或需要額外排序。
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from datetime import UTC, date, datetime, timedelta
+import re
+from typing import NamedTuple
+
+from fastapi import HTTPException, Request, Response
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.api import auth, history, templates
+from app.dependencies import engine
+from app.models import PromptHistory, Template, User
+from app.schemas.history import PromptHistoryBulkDelete
+from app.schemas.template import TemplateCreate, TemplateUpdate
+from app.schemas.user import UserCreate, UserLogin
+from app.services.history_retention import history_retention
+from app.services.prompt_optimizer import PromptOptimizerService
+
+# SQLite：`SCAN <table>`（未使用索引）或需要暫存 B-tree 排序
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (TABLE )?\w+( AS \w+)?$")
+SQLITE_TEMP_SORT = "USE TEMP B-TREE FOR ORDER BY"
+# 以索引、主鍵或全文檢索索引定位資料列
+SQLITE_INDEX_USE = re.compile(
+    r"^(SEARCH .+ USING .*(INDEX|PRIMARY KEY)|SCAN \w+ VIRTUAL TABLE INDEX)"
+)
+
+
+class PlanRecorder:
+    """攔截 SELECT / DELETE 並記錄其 EXPLAIN 結果"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.plans: list[tuple[str, list[str]]] = []
+        self.recording = False
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+
+    def close(self) -> None:
+        event.remove(self.engine, "before_cursor_execute", self._before_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, many):
+        if not self.recording or not statement.lstrip().upper().startswith(
+            ("SELECT", "DELETE")
+        ):
+            return
+        explain_cursor = conn.connection.cursor()
+        try:
+            explain_cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            rows = explain_cursor.fetchall()
+        finally:
+            explain_cursor.close()
+        # 計畫說明在最後一欄
+        self.plans.append((statement, [str(row[-1]) for row in rows]))
+
+
+class Seeded(NamedTuple):
+    session: Session
+    user: User
+    template: Template
+    middle: PromptHistory
+
+
+def _request(path: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("testserver", 80),
+            "path": path,
+            "root_path": "",
+            "query_string": b"",
+            "headers": [],
+        }
+    )
+
+
+@pytest.fixture
+def seeded():
+    """建立少量測試資料"""
+    with Session(engine) as session:
+        user = User(username="explain", email="explain@example.com", password_hash="x")
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+
+        template = Template(user_id=user.user_id, name="custom", content="內容")
+        session.add(template)
+        now = datetime.now(UTC)
+        histories = [
+            PromptHistory(
+                user_id=user.user_id,
+                original_prompt=f"prompt {i}",
+                optimized_prompt=f"optimized {i}",
+                template_id=1,
+                model_used="gemini-2.5-flash",
+                temperature=0.2,
+                created_at=now - timedelta(minutes=i),
+            )
+            for i in range(200)
+        ]
+        session.add_all(histories)
+        session.commit()
+        session.refresh(template)
+        session.refresh(histories[50])
+        yield Seeded(session, user, template, histories[50])
+
+
+@pytest.fixture
+def recorder():
+    recorder = PlanRecorder(engine)
+    yield recorder
+    recorder.close()
+
+
+HISTORY_ARGS = {
+    "limit": 50,
+    "cursor": None,
+    "model": None,
+    "start_date": None,
+    "end_date": None,
+}
+
+# 檢查名稱 -> 呼叫端點函式的工廠；批次刪除只指定不存在的 ID 或過去的日期
+CHECKS: dict[str, Callable[[Seeded], Awaitable]] = {
+    "history: list first page": lambda s: history.get_prompt_history(
+        _request("/api/v1/prompts/history"),
+        Response(),
+        s.session,
+        s.user,
+        **HISTORY_ARGS,
+    ),
+    "history: list with cursor and filters": lambda s: history.get_prompt_history(
+        _request("/api/v1/prompts/history"),
+        Response(),
+        s.session,
+        s.user,
+        **{
+            **HISTORY_ARGS,
+            "cursor": history._encode_cursor(s.middle),
+            "model": "gemini-2.5-flash",
+        },
+    ),
+    "history: detail": lambda s: history.get_prompt_history_detail(
+        s.middle.history_id, s.session, s.user, if_none_match=None
+    ),
+    "history: export batches": lambda s: asyncio.to_thread(
+        list,
+        history._export_batches(
+            history._history_filters(s.user.user_id, None, None, None), 50
+        ),
+    ),
+    "history: full-text search": lambda s: history.search_prompt_history(
+        _request("/api/v1/prompts/history/search"),
+        Response(),
+        s.session,
+        s.user,
+        q="optimized prompt",
+        limit=20,
+        offset=0,
+        model=None,
+        start_date=None,
+        end_date=None,
+    ),
+    "history: delete": lambda s: history.delete_prompt_history(0, s.session, s.user),
+    "history: bulk delete by ids": lambda s: history.bulk_delete_prompt_history(
+        PromptHistoryBulkDelete(history_ids=[0]), s.session, s.user
+    ),
+    "history: bulk delete by date range": lambda s: history.bulk_delete_prompt_history(
+        PromptHistoryBulkDelete(
+            start_date=date(2000, 1, 1), end_date=date(2000, 1, 31)
+        ),
+        s.session,
+        s.user,
+    ),
+    "history: retention batch": lambda s: asyncio.to_thread(
+        history_retention.delete_expired,
+        s.session,
+        s.user.user_id,
+        datetime(2000, 1, 1, tzinfo=UTC),
+    ),
+    "history: usage stats": lambda s: history.get_usage_stats(
+        s.session, s.user, start_date=None, end_date=None, model=None
+    ),
+    "templates: list defaults (anonymous)": lambda s: templates.get_all_templates(
+        None, s.session
+    ),
+    "templates: list user + defaults": lambda s: templates.get_all_templates(
+        s.user, s.session
+    ),
+    "templates: get by id": lambda s: templates.get_template_by_id(
+        s.user, s.session, s.template.template_id
+    ),
+    "templates: create duplicate-name check": lambda s: templates.create_template(
+        s.user, s.session, TemplateCreate(name="custom", content="內容")
+    ),
+    "templates: update lookup": lambda s: templates.update_template(
+        s.user, s.session, 0, TemplateUpdate()
+    ),
+    "templates: delete lookup": lambda s: templates.delete_template(
+        s.user, s.session, 0
+    ),
+    "optimizer: _get_template (logged in)": lambda s: PromptOptimizerService(
+        s.session, gemini_client=None
+    )._get_template(s.user.user_id, s.template.template_id),
+    "optimizer: _get_template (anonymous)": lambda s: PromptOptimizerService(
+        s.session, gemini_client=None
+    )._get_template(None, 1),
+    "auth: register username check": lambda s: auth.user_register(
+        UserCreate(username="explain", email="new@example.com", password="x"),
+        s.session,
+    ),
+    "auth: register email check": lambda s: auth.user_register(
+        UserCreate(username="new", email="explain@example.com", password="x"),
+        s.session,
+    ),
+    "auth: login lookup": lambda s: auth.user_login(
+        UserLogin(username="missing", password="x"), s.session
+    ),
+}
+
+
+@pytest.mark.parametrize("label", list(CHECKS))
+async def test_query_uses_index(label, seeded, recorder):
+    recorder.recording = True
+    try:
+        await CHECKS[label](seeded)
+    except HTTPException:
+        # 不存在的資料會在查詢後回傳 404/400，查詢本身仍已執行
+        pass
+    finally:
+        recorder.recording = False
+
+    assert recorder.plans, "未執行任何查詢"
+    for statement, plan in recorder.plans:
+        sql = " ".join(statement.split())
+        problems = [
+            line
+            for line in plan
+            if SQLITE_FULL_SCAN.match(line.strip()) or SQLITE_TEMP_SORT in line
+        ]
+        assert not problems, f"{sql}\n{plan}"
+        assert any(SQLITE_INDEX_USE.match(line.strip()) for line in plan), (
+            f"{sql}\n{plan}"
+        )
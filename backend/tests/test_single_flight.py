@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+def _counting(result: dict, delay: float = 0.05):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result
+
+    return fn, calls
+
+
+async def test_identical_calls_share_one_execution():
+    flight = SingleFlight()
+    fn, calls = _counting({"value": 1})
+
+    results = await asyncio.gather(*(flight.do("key", fn) for _ in range(5)))
+
+    assert results == [{"value": 1}] * 5
+    assert len(calls) == 1
+    assert flight.stats()["leaders"] == 1
+    assert flight.stats()["shared"] == 4
+    assert flight.stats()["in_flight"] == 0
+
+
+async def test_different_keys_run_separately():
+    flight = SingleFlight()
+    fn, calls = _counting({"value": 1})
+
+    await asyncio.gather(flight.do("a", fn), flight.do("b", fn))
+
+    assert len(calls) == 2
+
+
+async def test_waiters_retry_when_leader_fails():
+    flight = SingleFlight()
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        await asyncio.sleep(0.05)
+        if len(attempts) == 1:
+            raise RuntimeError("upstream hiccup")
+        return {"value": 2}
+
+    leader, waiter = await asyncio.gather(
+        flight.do("key", fn), flight.do("key", fn), return_exceptions=True
+    )
+
+    assert isinstance(leader, RuntimeError)
+    assert waiter == {"value": 2}
+    assert flight.stats()["fallbacks"] == 1
+
+
+async def test_leader_cancellation_does_not_cancel_shared_call():
+    flight = SingleFlight()
+    fn, calls = _counting({"value": 3}, delay=0.1)
+
+    leader = asyncio.create_task(flight.do("key", fn))
+    await asyncio.sleep(0.01)
+    waiter = asyncio.create_task(flight.do("key", fn))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    assert await waiter == {"value": 3}
+    assert len(calls) == 1
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+async def test_redis_mode_shares_result_across_workers():
+    workers = [SingleFlight(use_redis=True, poll_interval_seconds=0.01) for _ in "ab"]
+    fn, calls = _counting({"value": 4}, delay=0.1)
+
+    results = await asyncio.gather(*(worker.do("key", fn) for worker in workers))
+
+    assert results == [{"value": 4}, {"value": 4}]
+    assert len(calls) == 1
+    assert sum(worker.stats()["remote_shared"] for worker in workers) == 1
+
+
+async def test_requests_are_coalesced_only_per_api_key(
+    async_client, optimize_body, fake_gemini
+):
+    server = fake_gemini(latency=0.2)
+    body = {**optimize_body, "use_cache": False}
+
+    responses = await asyncio.gather(
+        async_client.post("/api/v1/prompts/optimize", json=body),
+        async_client.post("/api/v1/prompts/optimize", json=body),
+        async_client.post(
+            "/api/v1/prompts/optimize", json={**body, "api_key": "other-key"}
+        ),
+    )
+
+    assert all(r.status_code == 200 for r in responses)
+    calls = [r["api_key"] for r in server.requests if r["action"] == "generateContent"]
+    assert sorted(calls) == ["other-key", "test-api-key"]
@@ -0,0 +1,98 @@
+import pytest
+from sqlmodel import Session
+
+from app.dependencies import engine
+from app.models import Template
+from app.services.token_budget import (
+    TokenBudget,
+    estimate_tokens,
+    optimize_token_budget,
+    truncate_to_tokens,
+)
+
+
+def _template(content: str = "t" * 40) -> Template:
+    return Template(name="budget", content=content)
+
+
+def test_estimate_tokens_by_character_class():
+    assert estimate_tokens(None) == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("你好世界") == 4
+    assert estimate_tokens("hi 你好") == 3
+
+
+def test_truncate_stays_within_budget():
+    text = "abcd" * 10 + "你好" * 10
+
+    truncated = truncate_to_tokens(text, 15)
+
+    assert estimate_tokens(truncated) <= 15
+    assert text.startswith(truncated)
+    assert truncate_to_tokens("short", 15) == "short"
+
+
+def test_reject_mode_raises_when_over_budget():
+    budget = TokenBudget(max_input_tokens=20, overflow="reject")
+
+    assert budget.fit_prompt(_template(), "ok") == "ok"
+    with pytest.raises(ValueError, match="超過可用上限"):
+        budget.fit_prompt(_template(), "x" * 100)
+    with pytest.raises(ValueError, match="模板超過"):
+        budget.fit_prompt(_template("t" * 200), "ok")
+    assert budget.stats()["rejected"] == 2
+
+
+def test_truncate_mode_cuts_user_input():
+    budget = TokenBudget(max_input_tokens=20, overflow="truncate")
+
+    fitted = budget.fit_prompt(_template(), "x" * 100)
+
+    assert estimate_tokens(fitted) == 10
+    assert budget.stats()["truncated"] == 1
+
+
+def test_precomputed_template_tokens_are_preferred():
+    template = Template(name="budget", content="short", content_tokens=50)
+
+    assert TokenBudget.template_tokens(template) == 50
+
+
+def test_output_tokens_are_capped():
+    budget = TokenBudget(max_output_tokens=100)
+
+    assert budget.output_tokens(None) == 100
+    assert budget.output_tokens(50) == 50
+    assert budget.output_tokens(500) == 100
+
+
+def test_invalid_overflow_mode():
+    with pytest.raises(ValueError):
+        TokenBudget(overflow="drop")
+
+
+def test_over_budget_request_is_rejected_before_upstream(
+    client, optimize_body, fake_gemini, monkeypatch
+):
+    server = fake_gemini()
+    monkeypatch.setattr(optimize_token_budget, "max_input_tokens", 10)
+
+    response = client.post("/api/v1/prompts/optimize", json=optimize_body)
+
+    assert response.status_code == 400
+    assert server.requests == []
+
+
+def test_template_token_count_is_stored_on_create(client, auth_headers):
+    content = "abcd" * 25
+
+    response = client.post(
+        "/api/v1/templates/",
+        json={"name": "counted", "description": "d", "content": content},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+    with Session(engine) as session:
+        template = session.get(Template, response.json()["template_id"])
+        assert template.content_tokens == 25
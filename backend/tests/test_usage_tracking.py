@@ -0,0 +1,83 @@
+from datetime import UTC, datetime
+
+from sqlmodel import Session, select
+
+from app.dependencies import engine
+from app.models import PromptHistory
+
+
+def _histories() -> list[PromptHistory]:
+    with Session(engine) as session:
+        return list(session.exec(select(PromptHistory)).all())
+
+
+def test_response_reports_upstream_usage(client, optimize_body, fake_gemini):
+    fake_gemini()
+
+    usage = client.post("/api/v1/prompts/optimize", json=optimize_body).json()["usage"]
+
+    assert usage["input_tokens"] > 0
+    assert usage["output_tokens"] > 0
+    assert usage["total_tokens"] == usage["input_tokens"] + usage["output_tokens"]
+    assert usage["latency_ms"] >= 0
+
+
+def test_history_and_rollup_record_usage(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    fake_gemini()
+
+    first = client.post(
+        "/api/v1/prompts/optimize", json=optimize_body, headers=auth_headers
+    ).json()
+    second = client.post(
+        "/api/v1/prompts/optimize", json=optimize_body, headers=auth_headers
+    ).json()
+
+    assert second["cache_hit"] is True
+    assert second["usage"]["total_tokens"] == 0
+    assert second["usage"]["latency_ms"] is None
+    miss, hit = sorted(_histories(), key=lambda h: h.cache_hit)
+    assert miss.total_tokens == first["usage"]["total_tokens"]
+    assert miss.latency_ms is not None
+    assert hit.latency_ms is None
+
+    rollups = client.get("/api/v1/prompts/usage", headers=auth_headers).json()
+    assert rollups == [
+        {
+            "day": datetime.now(UTC).date().isoformat(),
+            "model": optimize_body["model"],
+            "requests": 2,
+            "cache_hits": 1,
+            "input_tokens": first["usage"]["input_tokens"],
+            "output_tokens": first["usage"]["output_tokens"],
+            "total_tokens": first["usage"]["total_tokens"],
+            "upstream_calls": 1,
+            "avg_latency_ms": float(miss.latency_ms),
+        }
+    ]
+
+
+def test_deleting_history_keeps_spent_usage(
+    client, auth_headers, optimize_body, fake_gemini
+):
+    fake_gemini()
+    client.post("/api/v1/prompts/optimize", json=optimize_body, headers=auth_headers)
+    [history] = _histories()
+
+    deleted = client.delete(
+        f"/api/v1/prompts/history/{history.history_id}", headers=auth_headers
+    )
+
+    assert deleted.status_code == 204
+    [rollup] = client.get("/api/v1/prompts/usage", headers=auth_headers).json()
+    assert rollup["requests"] == 1
+
+
+def test_usage_rejects_inverted_date_range(client, auth_headers):
+    response = client.get(
+        "/api/v1/prompts/usage?start_date=2026-02-01&end_date=2026-01-01",
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 400